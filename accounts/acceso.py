@@ -0,0 +1,118 @@
+import asyncio
+import hashlib
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+from django.conf import settings
+from django.contrib.auth import authenticate
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.db import close_old_connections
+from django.dispatch import receiver
+
+
+class LimiteExcedido(Exception):
+    def __init__(self, espera):
+        super().__init__(espera)
+        self.espera = espera  # Segundos hasta que haya un intento disponible
+
+    def cabeceras(self):
+        return {'Retry-After': str(math.ceil(self.espera))}
+
+
+def _cubetas(request, username):
+    # (clave, configuración) de cada cubeta que aplica a este intento
+    limites = settings.LOGIN_LIMITES
+    if not limites:
+        return []
+    cubetas = []
+    if limites.get('IP'):
+        cubetas.append((f"login:ip:{request.META.get('REMOTE_ADDR', '')}", limites['IP']))
+    if limites.get('USUARIO') and username:
+        # El username lo elige el atacante: se usa su hash para acotar el largo de la clave
+        digesto = hashlib.blake2b(str(username).lower().encode(), digest_size=16).hexdigest()
+        cubetas.append((f'login:usuario:{digesto}', limites['USUARIO']))
+    return cubetas
+
+
+def _evaluar(cubetas, estados, ahora):
+    # Recarga cada cubeta según el tiempo transcurrido; si alguna está vacía el intento se rechaza sin
+    # consumir de las demás. Devuelve los estados nuevos a guardar.
+    nuevos, espera = {}, 0
+    for clave, limite in cubetas:
+        capacidad, recarga = limite['CAPACIDAD'], limite['RECARGA']
+        tokens, ultimo = estados.get(clave, (capacidad, ahora))
+        tokens = min(capacidad, tokens + (ahora - ultimo) * recarga)
+        if tokens < 1:
+            espera = max(espera, (1 - tokens) / recarga)
+        nuevos[clave] = (tokens - 1, ahora)
+    if espera:
+        raise LimiteExcedido(espera)
+    return nuevos
+
+
+def _duracion(cubetas):
+    # Una cubeta sin uso se recarga por completo en capacidad / recarga segundos; después basta con olvidarla
+    return math.ceil(max(limite['CAPACIDAD'] / limite['RECARGA'] for _, limite in cubetas))
+
+
+def verificar_limite(request, username):
+    # Lanza LimiteExcedido antes de que el intento llegue a calcular el hash de la contraseña. Lectura y
+    # escritura no son atómicas: con N intentos simultáneos la cubeta puede ceder hasta N - 1 de más.
+    cubetas = _cubetas(request, username)
+    if not cubetas:
+        return
+    cache = caches[settings.LOGIN_LIMITES.get('ALIAS', 'default')]
+    nuevos = _evaluar(cubetas, cache.get_many([clave for clave, _ in cubetas]), time.time())
+    cache.set_many(nuevos, timeout=_duracion(cubetas))
+
+
+async def averificar_limite(request, username):
+    cubetas = _cubetas(request, username)
+    if not cubetas:
+        return
+    cache = caches[settings.LOGIN_LIMITES.get('ALIAS', 'default')]
+    nuevos = _evaluar(cubetas, await cache.aget_many([clave for clave, _ in cubetas]), time.time())
+    await cache.aset_many(nuevos, timeout=_duracion(cubetas))
+
+
+class ColaLlena(Exception):
+    pass
+
+
+@lru_cache(maxsize=None)
+def _hilos_hash():
+    return ThreadPoolExecutor(max_workers=settings.LOGIN_HASH_HILOS, thread_name_prefix='hash-login')
+
+
+_pendientes = 0
+
+
+def _autenticar_en_hilo(username, password):
+    close_old_connections()
+    try:
+        return authenticate(username=username, password=password)
+    finally:
+        close_old_connections()
+
+
+async def aautenticar(username, password):
+    # El hash corre en un pool propio y acotado: con sync_to_async ocuparía el hilo que comparten todas las
+    # vistas async para el ORM, y una ráfaga de logins detendría al resto de endpoints.
+    global _pendientes
+    if _pendientes >= settings.LOGIN_HASH_HILOS + settings.LOGIN_HASH_COLA:
+        raise ColaLlena()
+    _pendientes += 1  # Solo se modifica desde el hilo del event loop
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_hilos_hash(), _autenticar_en_hilo,
+                                                                username, password)
+    finally:
+        _pendientes -= 1
+
+
+@receiver(setting_changed)
+def _reiniciar_hilos(setting, **kwargs):
+    if setting == 'LOGIN_HASH_HILOS':
+        _hilos_hash.cache_clear()
@@ -1,25 +1,67 @@
 from django.contrib import admin
+from django.core.paginator import Paginator
+from django.db import connection
+from django.utils.functional import cached_property
 
 from accounts.models import Token, CuentaBancaria, Contacto, Transferencia
 
 
+class PaginadorEstimado(Paginator):
+    # En PostgreSQL un COUNT(*) sobre millones de filas recorre la tabla completa; sin filtros
+    # se usa la estimación del planificador (pg_class.reltuples), que es instantánea
+    @cached_property
+    def count(self):
+        consulta = self.object_list.query
+        if connection.vendor == 'postgresql' and not consulta.where:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+                               [self.object_list.model._meta.db_table])
+                estimado = cursor.fetchone()[0]
+            if estimado > 0:
+                return estimado
+        return super().count
+
+
+class BancoAdmin(admin.ModelAdmin):
+    # Las búsquedas usan lookups exactos o de prefijo sensibles a mayúsculas: así aprovechan los índices
+    # únicos (y sus índices *_like en PostgreSQL) en lugar de UPPER(...) LIKE '%...%'
+    paginator = PaginadorEstimado
+    show_full_result_count = False
+    list_per_page = 50
+
+
 # Register your models here.
 
 @admin.register(Token)
-class TokenAdmin(admin.ModelAdmin):
-    pass
+class TokenAdmin(BancoAdmin):
+    list_display = ('token', 'cliente', 'generado_en', 'usado_en', 'es_valido')
+    list_select_related = ('cliente',)
+    raw_id_fields = ('cliente',)
+    search_fields = ('cliente__username__exact',)
+    ordering = ('-id',)
 
 
 @admin.register(CuentaBancaria)
-class CuentaBancariaAdmin(admin.ModelAdmin):
-    pass
+class CuentaBancariaAdmin(BancoAdmin):
+    list_display = ('numero', 'tipo', 'saldo', 'fracciones', 'usuario')
+    list_select_related = ('usuario',)
+    raw_id_fields = ('usuario',)
+    search_fields = ('numero__startswith', 'usuario__username__exact')
 
 
 @admin.register(Contacto)
-class ContactoAdmin(admin.ModelAdmin):
-    pass
+class ContactoAdmin(BancoAdmin):
+    list_display = ('usuario', 'cuenta_bancaria')
+    list_select_related = ('usuario', 'cuenta_bancaria')
+    raw_id_fields = ('usuario', 'cuenta_bancaria')
+    readonly_fields = ('numero', 'nombre')  # Copias de la cuenta: Contacto.save() las recalcula
+    search_fields = ('usuario__username__exact', 'cuenta_bancaria__numero__startswith')
 
 
 @admin.register(Transferencia)
-class TransferenciaAdmin(admin.ModelAdmin):
-    pass
\ No newline at end of file
+class TransferenciaAdmin(BancoAdmin):
+    list_display = ('id', 'fecha', 'cuenta_origen', 'cuenta_destino', 'monto')
+    list_select_related = ('cuenta_origen', 'cuenta_destino')
+    raw_id_fields = ('cuenta_origen', 'cuenta_destino')
+    search_fields = ('cuenta_origen__numero__exact', 'cuenta_destino__numero__exact')
+    ordering = ('-id',)
@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class AccountsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'accounts'
+
+    def ready(self):
+        # Registra las señales que invalidan la caché de lecturas, mantienen las copias de Contacto, abren las
+        # cuentas nuevas en el libro mayor e instalan la medición de SQL
+        from . import cache_lecturas, contactos, libro, metricas  # noqa: F401
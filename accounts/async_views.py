@@ -0,0 +1,129 @@
+from functools import wraps
+
+from django.contrib.auth.models import User
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.settings import api_settings
+
+from . import fracciones
+from .acceso import aautenticar, averificar_limite, ColaLlena, LimiteExcedido
+from .authentication import JWTLecturaAuthentication
+from .json_rapido import RespuestaJSON
+from .cache_lecturas import arespuesta_cacheada, CUENTAS, CONTACTOS
+from .models import CuentaBancaria, Contacto
+from .replicas import lectura_replica
+from .tokens import obtener_almacen
+from .views import parametros_tokens, consulta_tokens, pagina_tokens, credenciales, login_limitado
+
+# Vistas nativas async para servir con ASGI. DRF no soporta vistas async, así que la autenticación
+# JWT se hace aquí: la firma se valida en memoria y el usuario se carga con el ORM asíncrono.
+# Las lecturas usan JWTLecturaAuthentication y no consultan auth_user.
+_jwt = JWTAuthentication()
+_jwt_lectura = JWTLecturaAuthentication()
+
+
+async def autenticar(request, lectura=False):
+    autenticador = _jwt_lectura if lectura else _jwt
+    header = autenticador.get_header(request)
+    if header is None:
+        return None
+    raw_token = autenticador.get_raw_token(header)
+    if raw_token is None:
+        return None
+
+    token_validado = autenticador.get_validated_token(raw_token)
+    if lectura:
+        return autenticador.get_user(token_validado)
+    try:
+        user_id = token_validado[api_settings.USER_ID_CLAIM]
+    except KeyError:
+        raise InvalidToken('Token contained no recognizable user identification')
+    usuario = await User.objects.filter(**{api_settings.USER_ID_FIELD: user_id}).afirst()
+    if usuario is None or not usuario.is_active:
+        raise InvalidToken('User not found')
+    return usuario
+
+
+def jwt_requerido(lectura=False):
+    def decorador(vista):
+        @wraps(vista)
+        async def envoltura(request, *args, **kwargs):
+            if request.method != 'GET':
+                return RespuestaJSON({'detail': f'Method "{request.method}" not allowed.'}, status=405)
+            try:
+                usuario = await autenticar(request, lectura)
+            except (InvalidToken, TokenError) as error:
+                return RespuestaJSON({'detail': str(error)}, status=401)
+            if usuario is None:
+                return RespuestaJSON({'detail': 'Authentication credentials were not provided.'}, status=401)
+            request.user = usuario
+            return await vista(request, *args, **kwargs)
+        return envoltura
+    return decorador
+
+
+@csrf_exempt
+async def login(request):
+    # Misma respuesta que /api/login/; el hash se calcula en los hilos de acceso.aautenticar
+    if request.method != 'POST':
+        return RespuestaJSON({'mensaje': 'Método no permitido'}, status=405)
+    datos = credenciales(request)
+    if datos is None:
+        return RespuestaJSON({'mensaje': 'Cuerpo JSON inválido'}, status=400)
+    username, password = datos
+
+    try:
+        await averificar_limite(request, username)
+        user = await aautenticar(username, password)
+    except LimiteExcedido as error:
+        return login_limitado(error)
+    except ColaLlena:
+        respuesta = RespuestaJSON({'mensaje': 'Servicio saturado, reintenta en unos segundos'}, status=503)
+        respuesta['Retry-After'] = '1'
+        return respuesta
+
+    if user is None:
+        return RespuestaJSON({'mensaje': 'Credenciales inválidas'}, status=400)
+    return RespuestaJSON({'mensaje': 'Login exitoso', 'usuario_id': user.id})
+
+
+@jwt_requerido()
+async def generar_token(request):
+    token, tiempo_restante = await obtener_almacen().aemitir(request.user)
+    return RespuestaJSON({'token': token, 'tiempo_restante': tiempo_restante})
+
+
+@jwt_requerido(lectura=True)
+@lectura_replica
+async def obtener_cuenta_origen(request):
+    async def construir():
+        cuentas = CuentaBancaria.objects.filter(usuario_id=request.user.pk) \
+            .values_list('numero', 'tipo', 'saldo', fracciones.en_fracciones())
+        return {'cuentas': [{'numero': numero, 'tipo': tipo, 'saldo': fracciones.total(saldo, extra)}
+                            async for numero, tipo, saldo, extra in cuentas]}
+
+    return await arespuesta_cacheada(request, CUENTAS, construir)
+
+
+@jwt_requerido(lectura=True)
+@lectura_replica
+async def obtener_contactos(request):
+    async def construir():
+        contactos = Contacto.objects.filter(usuario_id=request.user.pk).order_by('numero', 'id') \
+            .values_list('nombre', 'numero')
+        return {'contactos': [{'nombre': nombre, 'numero': numero} async for nombre, numero in contactos]}
+
+    return await arespuesta_cacheada(request, CONTACTOS, construir)
+
+
+@jwt_requerido(lectura=True)
+@lectura_replica
+async def obtener_tokens_cliente(request):
+    try:
+        limite, antes = parametros_tokens(request)
+    except ValueError:
+        return RespuestaJSON({'error': 'Los parámetros de paginación no son válidos'}, status=400)
+
+    tokens = [token async for token in consulta_tokens(request.user, limite, antes)]
+    return RespuestaJSON(pagina_tokens(tokens, limite))
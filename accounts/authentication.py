@@ -0,0 +1,50 @@
+import hashlib
+import time
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.models import TokenUser
+
+from .cache_lecturas import CacheLocalLRU
+
+
+@lru_cache(maxsize=None)
+def tokens_verificados():
+    configuracion = settings.JWT_LECTURA
+    return CacheLocalLRU(configuracion['CACHE_TTL'], configuracion['CACHE_MAXIMO'])
+
+
+@receiver(setting_changed)
+def _reiniciar_tokens_verificados(setting, **kwargs):
+    if setting == 'JWT_LECTURA':
+        tokens_verificados.cache_clear()
+
+
+class JWTLecturaAuthentication(JWTAuthentication):
+    # Autenticación para endpoints de solo lectura sin ninguna consulta a la base de datos:
+    # el usuario se construye con los claims (user_id, username) en lugar de cargarse de auth_user,
+    # y los tokens ya verificados se recuerdan por el hash del token completo hasta su expiración.
+    # Un usuario desactivado conserva el acceso de lectura hasta que su access token expire.
+
+    def get_validated_token(self, raw_token):
+        if not settings.JWT_LECTURA['CACHE_MAXIMO']:
+            return super().get_validated_token(raw_token)
+
+        # Clave sobre el token completo y no solo la firma: otra cabecera o payload con la misma firma no puede
+        # reutilizar una verificación previa
+        clave = hashlib.sha256(raw_token).digest()
+        cache = tokens_verificados()
+        token_validado = cache.get(clave)
+        if token_validado is None:
+            token_validado = super().get_validated_token(raw_token)
+            restante = token_validado['exp'] - time.time()
+            cache.set(clave, token_validado, ttl=min(restante, cache.ttl))
+        elif token_validado['exp'] <= time.time():
+            return super().get_validated_token(raw_token)  # Expiró dentro del TTL: produce el error estándar
+        return token_validado
+
+    def get_user(self, validated_token):
+        return TokenUser(validated_token)
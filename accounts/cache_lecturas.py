@@ -0,0 +1,226 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.crypto import get_random_string
+from django.http import HttpResponse, HttpResponseNotModified
+
+from .json_rapido import dumps
+from .models import CuentaBancaria, Contacto, Transferencia
+from .replicas import fijar_primaria
+
+CUENTAS = 'cuentas'
+CONTACTOS = 'contactos'
+
+# Cada clave tiene una generación que cambia al invalidarla, y cada entrada guarda la generación leída antes de
+# construirla. Una lectura que empezó antes del commit y guarda su entrada después de la invalidación queda con
+# una generación vieja y no vuelve a servirse.
+
+
+def _generacion(clave):
+    return f'generacion:{clave}'
+
+
+class CacheLocalLRU:
+    # Caché del proceso con TTL y un máximo de entradas; al llenarse descarta la menos usada
+    def __init__(self, ttl, maximo):
+        self.ttl = ttl
+        self.maximo = maximo
+        self.entradas = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, clave):
+        with self.lock:
+            entrada = self.entradas.get(clave)
+            if entrada is None:
+                return None
+            expira, valor = entrada
+            if expira < time.monotonic():
+                del self.entradas[clave]
+                return None
+            self.entradas.move_to_end(clave)
+            return valor
+
+    def get_many(self, claves):
+        valores = {clave: self.get(clave) for clave in claves}
+        return {clave: valor for clave, valor in valores.items() if valor is not None}
+
+    def set(self, clave, valor, ttl=None):
+        with self.lock:
+            self.entradas[clave] = (time.monotonic() + (self.ttl if ttl is None else ttl), valor)
+            self.entradas.move_to_end(clave)
+            while len(self.entradas) > self.maximo:
+                self.entradas.popitem(last=False)
+
+    def delete_many(self, claves):
+        with self.lock:
+            for clave in claves:
+                self.entradas.pop(clave, None)
+
+    def invalidar(self, claves):
+        self.delete_many(claves)
+        for clave in claves:
+            self.set(_generacion(clave), get_random_string(12), ttl=float('inf'))
+
+    # Sin E/S: las variantes async solo delegan
+    async def aget(self, clave):
+        return self.get(clave)
+
+    async def aget_many(self, claves):
+        return self.get_many(claves)
+
+    async def aset(self, clave, valor):
+        self.set(clave, valor)
+
+
+class CacheCompartida:
+    # Adaptador sobre un alias de CACHES (Redis, Memcached...) para que todos los procesos vean las invalidaciones
+    def __init__(self, ttl, alias):
+        self.ttl = ttl
+        self.alias = alias
+
+    def get(self, clave):
+        return caches[self.alias].get(f'lecturas:{clave}')
+
+    def get_many(self, claves):
+        valores = caches[self.alias].get_many([f'lecturas:{clave}' for clave in claves])
+        return {clave.removeprefix('lecturas:'): valor for clave, valor in valores.items()}
+
+    def set(self, clave, valor):
+        caches[self.alias].set(f'lecturas:{clave}', valor, timeout=self.ttl)
+
+    async def aget(self, clave):
+        return await caches[self.alias].aget(f'lecturas:{clave}')
+
+    async def aget_many(self, claves):
+        valores = await caches[self.alias].aget_many([f'lecturas:{clave}' for clave in claves])
+        return {clave.removeprefix('lecturas:'): valor for clave, valor in valores.items()}
+
+    async def aset(self, clave, valor):
+        await caches[self.alias].aset(f'lecturas:{clave}', valor, timeout=self.ttl)
+
+    def delete_many(self, claves):
+        caches[self.alias].delete_many([f'lecturas:{clave}' for clave in claves])
+
+    def invalidar(self, claves):
+        # Las generaciones no expiran: si una desapareciera antes que sus entradas, una vieja volvería a valer
+        caches[self.alias].set_many({f'lecturas:{_generacion(clave)}': get_random_string(12) for clave in claves},
+                                    timeout=None)
+        self.delete_many(claves)
+
+
+_contadores = defaultdict(lambda: {'aciertos': 0, 'fallos': 0})
+_contadores_lock = threading.Lock()
+
+
+def _contar(recurso, resultado):
+    with _contadores_lock:
+        _contadores[recurso][resultado] += 1
+
+
+def estadisticas():
+    with _contadores_lock:
+        return {recurso: dict(valores) for recurso, valores in _contadores.items()}
+
+
+@lru_cache(maxsize=None)
+def obtener_cache():
+    configuracion = settings.LECTURAS_CACHE
+    if configuracion['BACKEND'] == 'compartida':
+        return CacheCompartida(configuracion['TTL'], configuracion.get('ALIAS', 'default'))
+    return CacheLocalLRU(configuracion['TTL'], configuracion.get('MAXIMO', 10000))
+
+
+@receiver(setting_changed)
+def _reiniciar_cache(setting, **kwargs):
+    if setting == 'LECTURAS_CACHE':
+        obtener_cache.cache_clear()
+
+
+def _entrada(datos):
+    cuerpo = dumps(datos)
+    return f'"{hashlib.blake2b(cuerpo, digest_size=16).hexdigest()}"', cuerpo
+
+
+def _vigente(valores, clave):
+    # (generación actual, entrada o None si falta o se construyó antes de la última invalidación)
+    generacion, entrada = valores.get(_generacion(clave)), valores.get(clave)
+    if entrada is None or entrada[0] != generacion:
+        return generacion, None
+    return generacion, entrada
+
+
+def _responder(request, entrada):
+    _, etag, cuerpo = entrada
+    if etag in request.headers.get('If-None-Match', ''):
+        respuesta = HttpResponseNotModified()
+    else:
+        respuesta = HttpResponse(cuerpo, content_type='application/json')
+    respuesta['ETag'] = etag
+    respuesta['Cache-Control'] = 'private, no-cache'
+    return respuesta
+
+
+def respuesta_cacheada(request, recurso, construir):
+    # Devuelve el JSON ya serializado de la caché; si el cliente tiene la misma versión responde 304 sin cuerpo
+    clave = f'{recurso}:{request.user.pk}'
+    generacion, entrada = _vigente(obtener_cache().get_many([clave, _generacion(clave)]), clave)
+    if entrada is None:
+        _contar(recurso, 'fallos')
+        entrada = (generacion, *_entrada(construir()))
+        obtener_cache().set(clave, entrada)
+    else:
+        _contar(recurso, 'aciertos')
+    return _responder(request, entrada)
+
+
+async def arespuesta_cacheada(request, recurso, construir):
+    # Variante para vistas async: `construir` es una corrutina que usa el ORM asíncrono
+    clave = f'{recurso}:{request.user.pk}'
+    generacion, entrada = _vigente(await obtener_cache().aget_many([clave, _generacion(clave)]), clave)
+    if entrada is None:
+        _contar(recurso, 'fallos')
+        entrada = (generacion, *_entrada(await construir()))
+        await obtener_cache().aset(clave, entrada)
+    else:
+        _contar(recurso, 'aciertos')
+    return _responder(request, entrada)
+
+
+def invalidar(recurso, usuario_ids):
+    # La invalidación espera al commit: antes de él otra lectura podría volver a guardar los datos viejos.
+    # Los usuarios afectados leen de la primaria un momento: desde una réplica atrasada se volverían a cachear.
+    usuario_ids = set(usuario_ids)
+    claves = [f'{recurso}:{usuario_id}' for usuario_id in usuario_ids]
+
+    def despues_del_commit():
+        obtener_cache().invalidar(claves)
+        fijar_primaria(usuario_ids)
+    transaction.on_commit(despues_del_commit)
+
+
+@receiver([post_save, post_delete], sender=CuentaBancaria)
+def _cuenta_modificada(sender, instance, **kwargs):
+    invalidar(CUENTAS, [instance.usuario_id])
+    # El número de la cuenta aparece en los contactos de otros usuarios
+    invalidar(CONTACTOS, Contacto.objects.filter(cuenta_bancaria_id=instance.pk).values_list('usuario_id', flat=True))
+
+
+@receiver([post_save, post_delete], sender=Contacto)
+def _contacto_modificado(sender, instance, **kwargs):
+    invalidar(CONTACTOS, [instance.usuario_id])
+
+
+@receiver(post_save, sender=Transferencia)
+def _transferencia_realizada(sender, instance, created, **kwargs):
+    # Las transferencias cambian saldos con UPDATE ... F(), que no emite señales de CuentaBancaria
+    if created:
+        invalidar(CUENTAS, [instance.cuenta_origen.usuario_id, instance.cuenta_destino.usuario_id])
@@ -0,0 +1,59 @@
+import base64
+
+from django.contrib.auth.models import User
+from django.db.models import Q
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from .historial import CursorInvalido
+from .models import CuentaBancaria, Contacto
+
+
+def codificar_cursor(numero, id_):
+    return base64.urlsafe_b64encode(f'{numero}|{id_}'.encode()).decode()
+
+
+def decodificar_cursor(cursor):
+    try:
+        numero, id_ = base64.urlsafe_b64decode(cursor.encode()).decode().rsplit('|', 1)
+        return numero, int(id_)
+    except (ValueError, UnicodeError):
+        raise CursorInvalido()
+
+
+def buscar(usuario_id, prefijo='', cursor=None, limite=50):
+    # Contactos cuyo número de cuenta o dueño empiezan por `prefijo`, ordenados por (número, id).
+    # El índice (usuario, numero, id) entrega las filas ya ordenadas: cada página lee unas `limite` filas
+    # aunque el usuario tenga decenas de miles de contactos.
+    consulta = Contacto.objects.filter(usuario_id=usuario_id)
+    if prefijo:
+        consulta = consulta.filter(Q(numero__startswith=prefijo) | Q(nombre__istartswith=prefijo))
+    if cursor:
+        numero, id_ = decodificar_cursor(cursor)
+        consulta = consulta.filter(Q(numero__gt=numero) | Q(numero=numero, id__gt=id_))
+
+    filas = list(consulta.order_by('numero', 'id').values_list('id', 'numero', 'nombre')[:limite + 1])
+    siguiente = None
+    if len(filas) > limite:
+        filas = filas[:limite]
+        siguiente = codificar_cursor(filas[-1][1], filas[-1][0])
+    return [{'nombre': nombre, 'numero': numero} for _, numero, nombre in filas], siguiente
+
+
+# Las copias de numero y nombre en Contacto siguen a la cuenta y a su dueño. Las transferencias actualizan
+# saldos con UPDATE ... F() y no emiten estas señales.
+@receiver(post_save, sender=CuentaBancaria)
+def _cuenta_guardada(sender, instance, created, update_fields=None, **kwargs):
+    if created or (update_fields is not None and 'numero' not in update_fields):
+        return
+    Contacto.objects.filter(cuenta_bancaria_id=instance.pk).exclude(numero=instance.numero) \
+        .update(numero=instance.numero)
+
+
+@receiver(post_save, sender=User)
+def _usuario_guardado(sender, instance, created, update_fields=None, **kwargs):
+    # El login guarda last_login con update_fields: no cuesta una consulta extra
+    if created or (update_fields is not None and 'username' not in update_fields):
+        return
+    Contacto.objects.filter(cuenta_bancaria__usuario_id=instance.pk).exclude(nombre=instance.username) \
+        .update(nombre=instance.username)
@@ -0,0 +1,133 @@
+import csv
+import gzip
+import heapq
+import io
+import os
+from datetime import datetime, time, timedelta
+from operator import itemgetter
+
+from django.db.models import Exists, F, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from . import libro
+from .json_rapido import dumps
+from .models import CuentaBancaria, CorteSaldo, MovimientoLibro, Transferencia
+
+# Estados de cuenta de un periodo para un rango de ids de cuenta. Las transferencias del rango se leen con dos
+# recorridos ordenados por (cuenta, fecha, id), uno por índice, que se combinan en uno solo: cada cuenta recibe
+# sus movimientos seguidos y se escriben a medida que llegan. En memoria quedan solo las cuentas del rango.
+
+CAMPOS = ('cuenta', 'fecha', 'concepto', 'contraparte', 'monto', 'saldo', 'motivo')
+CLAVE_ORDEN = itemgetter('cuenta_id', 'fecha', 'id')
+FORMATOS = ('csv', 'jsonl')
+
+
+def limites(desde, hasta):
+    # [inicio, fin) del periodo entre las fechas `desde` y `hasta`, incluidas
+    inicio = timezone.make_aware(datetime.combine(desde, time.min))
+    return inicio, timezone.make_aware(datetime.combine(hasta + timedelta(days=1), time.min))
+
+
+def _antes(momento):
+    # Movimientos del libro anteriores a `momento`. Los de una transferencia cuentan por la fecha de la
+    # transferencia, la misma con la que se leen los renglones del estado, y no por la del asiento.
+    return Q(transferencia__isnull=True, fecha__lt=momento) | Q(transferencia__fecha__lt=momento)
+
+
+def saldos_iniciales(desde_id, hasta_id, inicio, fin):
+    # Saldo según el libro al inicio del periodo: último corte anterior más los movimientos posteriores a ese
+    # corte y anteriores al inicio. Los cambios de saldo que no son transferencias (aperturas, ajustes) quedan
+    # en el saldo inicial y no en el periodo. Se omiten las cuentas sin corte ni movimientos antes del fin del
+    # periodo (creadas después o que aún no entran al libro).
+    cortes = CorteSaldo.objects.filter(cuenta=OuterRef('pk'), fecha__lt=inicio).order_by('-fecha')
+    neto = MovimientoLibro.objects.filter(_antes(inicio), cuenta=OuterRef('pk'),
+                                          fecha__gt=OuterRef('fecha_corte')) \
+        .order_by().values('cuenta').annotate(neto=Sum(libro.MONTO_FIRMADO)).values('neto')
+    cuentas = CuentaBancaria.objects.filter(
+        Exists(MovimientoLibro.objects.filter(_antes(fin), cuenta=OuterRef('pk')))
+        | Exists(CorteSaldo.objects.filter(cuenta=OuterRef('pk'), fecha__lt=fin)),
+        id__gte=desde_id, id__lt=hasta_id,
+    ).annotate(
+        fecha_corte=Coalesce(Subquery(cortes.values('fecha')[:1]), libro.SIN_CORTE),
+    ).order_by('id').values_list(
+        'id', 'numero', Coalesce(Subquery(cortes.values('saldo')[:1]), libro.CERO),
+        Coalesce(Subquery(neto), libro.CERO),
+    )
+    return [(cuenta_id, numero, base + neto) for cuenta_id, numero, base, neto in cuentas]
+
+
+def _movimientos(tipo, desde_id, hasta_id, inicio, fin, chunk_size):
+    if tipo == 'salida':
+        cuenta, contraparte = 'cuenta_origen_id', 'cuenta_destino__numero'
+    else:
+        cuenta, contraparte = 'cuenta_destino_id', 'cuenta_origen__numero'
+    consulta = Transferencia.objects.filter(**{f'{cuenta}__gte': desde_id, f'{cuenta}__lt': hasta_id},
+                                            fecha__gte=inicio, fecha__lt=fin)
+    return consulta.order_by(cuenta, 'fecha', 'id').values(
+        'id', 'fecha', 'monto', 'motivo', cuenta_id=F(cuenta), contraparte=F(contraparte), tipo=Value(tipo),
+    ).iterator(chunk_size=chunk_size)
+
+
+def _fila(numero, fecha, concepto, saldo, contraparte='', monto=None, motivo=''):
+    return {
+        'cuenta': numero,
+        'fecha': fecha.isoformat(),
+        'concepto': concepto,
+        'contraparte': contraparte,
+        'monto': '' if monto is None else f'{monto:.2f}',
+        'saldo': f'{saldo:.2f}',
+        'motivo': motivo or '',
+    }
+
+
+def _escritor(archivo, formato):
+    if formato == 'jsonl':
+        return lambda fila: archivo.write(dumps(fila) + b'\n')
+    escritor = csv.DictWriter(archivo, fieldnames=CAMPOS)
+    escritor.writeheader()
+    return escritor.writerow
+
+
+def generar(desde_id, hasta_id, desde, hasta, ruta, formato='csv', chunk_size=2000):
+    # Escribe en `ruta` (gzip) los estados de las cuentas con id en [desde_id, hasta_id) y devuelve
+    # (cuentas, movimientos). Por cuenta: saldo inicial, un renglón por transferencia con el saldo después de
+    # aplicarla y saldo final. El archivo se escribe con otro nombre y se renombra al terminar.
+    inicio, fin = limites(desde, hasta)
+    cuentas = saldos_iniciales(desde_id, hasta_id, inicio, fin)
+    movimientos = heapq.merge(_movimientos('salida', desde_id, hasta_id, inicio, fin, chunk_size),
+                              _movimientos('entrada', desde_id, hasta_id, inicio, fin, chunk_size),
+                              key=CLAVE_ORDEN)
+    siguiente = next(movimientos, None)
+    escritos = 0
+
+    temporal = f'{ruta}.tmp'
+    with gzip.open(temporal, 'wb') as comprimido:
+        archivo = comprimido if formato == 'jsonl' else io.TextIOWrapper(comprimido, encoding='utf-8', newline='')
+        escribir = _escritor(archivo, formato)
+        for cuenta_id, numero, saldo in cuentas:
+            escribir(_fila(numero, desde, 'saldo_inicial', saldo))
+            while siguiente is not None and siguiente['cuenta_id'] <= cuenta_id:
+                if siguiente['cuenta_id'] == cuenta_id:
+                    monto = siguiente['monto']
+                    saldo += monto if siguiente['tipo'] == 'entrada' else -monto
+                    escribir(_fila(numero, siguiente['fecha'], siguiente['tipo'], saldo, siguiente['contraparte'],
+                                   monto, siguiente['motivo']))
+                    escritos += 1
+                siguiente = next(movimientos, None)
+            escribir(_fila(numero, hasta, 'saldo_final', saldo))
+        if archivo is not comprimido:
+            archivo.flush()
+            archivo.detach()
+    os.replace(temporal, ruta)
+    return len(cuentas), escritos
+
+
+def rangos(minimo, maximo, lote):
+    # Rangos alineados a múltiplos de `lote`: no dependen de las cuentas creadas después y se repiten igual
+    # al reanudar
+    return [(inicio, inicio + lote) for inicio in range(minimo - minimo % lote, maximo + 1, lote)]
+
+
+def nombre_archivo(desde_id, hasta_id, formato):
+    return f'cuentas_{desde_id:012d}_{hasta_id:012d}.{formato}.gz'
@@ -0,0 +1,104 @@
+import json
+import logging
+import random
+import traceback
+from datetime import timedelta
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import close_old_connections, transaction
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import EventoPendiente
+
+TRANSFERENCIA_REALIZADA = 'transferencia_realizada'
+
+logger = logging.getLogger('accounts.auditoria')
+
+
+@lru_cache(maxsize=None)
+def manejadores(tipo):
+    return tuple(import_string(ruta) for ruta in settings.EVENTOS['MANEJADORES'].get(tipo, ()))
+
+
+@receiver(setting_changed)
+def _reiniciar_manejadores(setting, **kwargs):
+    if setting == 'EVENTOS':
+        manejadores.cache_clear()
+
+
+def publicar(tipo, datos):
+    # Se llama dentro de la transacción de la operación: el evento existe si y solo si la operación se
+    # confirmó. Un INSERT por bloque; sin manejadores para el tipo no se escribe nada.
+    if not manejadores(tipo):
+        return
+    EventoPendiente.objects.bulk_create([EventoPendiente(tipo=tipo, datos=dato) for dato in datos],
+                                        batch_size=settings.TRANSFERENCIA_LOTE_BLOQUE)
+
+
+def datos_transferencia(transferencia):
+    return {
+        'id': transferencia.id,
+        'cuenta_origen': transferencia.cuenta_origen_id,
+        'cuenta_destino': transferencia.cuenta_destino_id,
+        'monto': str(transferencia.monto),
+        'fecha': transferencia.fecha.isoformat(),
+    }
+
+
+def _entregar(evento):
+    # Corre en un hilo del pool con su propia conexión. Devuelve None o el error a registrar.
+    close_old_connections()
+    try:
+        for manejador in manejadores(evento.tipo):
+            manejador(evento.id, evento.datos)
+        return None
+    except Exception as error:
+        return ''.join(traceback.format_exception_only(error)).strip()
+    finally:
+        close_old_connections()
+
+
+def _espera(intentos):
+    configuracion = settings.EVENTOS
+    segundos = min(configuracion['BACKOFF_MAXIMO'], configuracion['BACKOFF_BASE'] * 2 ** (intentos - 1))
+    return timedelta(seconds=segundos * random.uniform(0.5, 1.5))
+
+
+def procesar_lote(hilos, lote):
+    # Reclama hasta `lote` eventos con FOR UPDATE SKIP LOCKED y los mantiene bloqueados mientras el pool los
+    # entrega: otro worker, en este u otro proceso, salta esas filas en lugar de entregarlas de nuevo. Si el
+    # worker muere a mitad, la transacción se revierte y los eventos vuelven a quedar disponibles, por lo que
+    # la entrega es al menos una vez: los manejadores reciben el id del evento para descartar repeticiones.
+    ahora = timezone.now()
+    with transaction.atomic():
+        eventos = list(EventoPendiente.objects.select_for_update(skip_locked=True)
+                       .filter(descartado=False, disponible__lte=ahora).order_by('disponible', 'id')[:lote])
+        if not eventos:
+            return 0
+        errores = list(hilos.map(_entregar, eventos))
+
+        entregados, fallidos = [], []
+        for evento, error in zip(eventos, errores):
+            if error is None:
+                entregados.append(evento.id)
+                continue
+            evento.intentos += 1
+            evento.ultimo_error = error
+            evento.descartado = evento.intentos >= settings.EVENTOS['INTENTOS']
+            evento.disponible = ahora + _espera(evento.intentos)
+            fallidos.append(evento)
+        EventoPendiente.objects.filter(id__in=entregados).delete()
+        EventoPendiente.objects.bulk_update(fallidos, ['intentos', 'ultimo_error', 'descartado', 'disponible'])
+    for evento in fallidos:
+        logger.warning('Evento %s %s falló (intento %s): %s', evento.tipo, evento.id, evento.intentos,
+                       evento.ultimo_error)
+    return len(eventos)
+
+
+def auditar(evento_id, datos):
+    # Exporta cada transferencia como una línea JSON al logger accounts.auditoria
+    logger.info(json.dumps({'evento': evento_id, **datos}))
@@ -0,0 +1,70 @@
+import random
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, F, OuterRef, Subquery, Sum, When
+
+from .models import CuentaBancaria, FraccionSaldo
+
+# Cuentas calientes: el saldo se reparte entre CuentaBancaria.saldo (la base) y N filas de FraccionSaldo.
+# - Un crédito suma a una fracción al azar con UPDATE ... F(): solo bloquea esa fila, no la cuenta, así que
+#   N créditos simultáneos a la misma cuenta avanzan en paralelo salvo que elijan la misma fracción.
+# - Un débito bloquea la cuenta (como cualquier débito) y, si la base no alcanza, barre las fracciones hacia
+#   la base. Mientras la cuenta está bloqueada nadie más puede restar, solo sumar.
+# - Una lectura suma base y fracciones.
+
+
+def en_fracciones():
+    # Expresión para annotate/values_list con la suma de las fracciones; en las cuentas sin fracciones es nula y
+    # no evalúa la subconsulta. El saldo total es saldo + esta suma (ver total()).
+    suma = FraccionSaldo.objects.filter(cuenta=OuterRef('pk')).order_by().values('cuenta') \
+        .annotate(total=Sum('saldo')).values('total')
+    return Case(When(fracciones__gt=0, then=Subquery(suma)), default=None,
+                output_field=FraccionSaldo._meta.get_field('saldo'))
+
+
+def total(saldo, en_fracciones):
+    return saldo + en_fracciones if en_fracciones else saldo
+
+
+def acreditar(cuenta_id, fracciones, monto):
+    indice = random.randrange(fracciones)
+    if not FraccionSaldo.objects.filter(cuenta_id=cuenta_id, indice=indice).update(saldo=F('saldo') + monto):
+        # La cuenta se reconfiguró con menos fracciones entre la lectura y el crédito: la base también es saldo
+        CuentaBancaria.objects.filter(id=cuenta_id).update(saldo=F('saldo') + monto)
+
+
+def barrer(cuenta_id, faltante=None):
+    # Con la cuenta ya bloqueada, pasa a la base las fracciones necesarias para cubrir `faltante` (todas si es
+    # None) y devuelve el monto movido. Bloquea las fracciones con saldo en orden de índice en una sola consulta.
+    fracciones = list(FraccionSaldo.objects.select_for_update().filter(cuenta_id=cuenta_id, saldo__gt=0)
+                      .order_by('indice').values_list('id', 'saldo'))
+    ids, movido = [], Decimal('0')
+    for fraccion_id, saldo in fracciones:
+        if faltante is not None and movido >= faltante:
+            break
+        ids.append(fraccion_id)
+        movido += saldo
+    if ids:
+        FraccionSaldo.objects.filter(id__in=ids).update(saldo=Decimal('0'))
+        CuentaBancaria.objects.filter(id=cuenta_id).update(saldo=F('saldo') + movido)
+    return movido
+
+
+def fraccionar(cuenta_id, fracciones):
+    # Cambia el número de fracciones de una cuenta (0 la devuelve al modo normal). Los saldos de las fracciones
+    # pasan a la base, las sobrantes se eliminan y las que faltan se crean en cero.
+    with transaction.atomic():
+        cuenta = CuentaBancaria.objects.select_for_update().get(id=cuenta_id)
+        CuentaBancaria.objects.filter(id=cuenta_id).update(fracciones=fracciones)
+        # Se bloquean todas las fracciones, también las que están en cero y barrer() no toca: un crédito en curso
+        # sobre una fracción que se elimina termina antes del barrido o espera al commit, no encuentra la fila y
+        # acredita la base (ver acreditar())
+        existentes = dict(FraccionSaldo.objects.select_for_update().filter(cuenta_id=cuenta_id)
+                          .order_by('indice').values_list('indice', 'id'))
+        barrer(cuenta_id)
+        FraccionSaldo.objects.filter(id__in=[fraccion_id for indice, fraccion_id in existentes.items()
+                                             if indice >= fracciones]).delete()
+        FraccionSaldo.objects.bulk_create([FraccionSaldo(cuenta_id=cuenta_id, indice=indice)
+                                           for indice in range(fracciones) if indice not in existentes])
+        return cuenta.fracciones
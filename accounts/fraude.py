@@ -0,0 +1,217 @@
+import math
+import time
+from collections import defaultdict
+from datetime import datetime, timezone as dt_timezone
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from .models import Transferencia
+
+# Límites de velocidad por cuenta de origen, evaluados antes de confirmar cada transferencia sin consultar
+# Transferencia. En la caché compartida se guardan por cuenta:
+# - fraude:<id>:<medida>:<ventana>:<subventana>: un contador entero por subventana (CUBETAS por ventana) y medida;
+#   los montos se cuentan en centavos. Se suman con incr(), que es atómico: una ráfaga de transferencias
+#   simultáneas no pierde incrementos. La ventana deslizante suma las subventanas vigentes, con un error de a lo
+#   sumo una subventana (VENTANA / CUBETAS segundos).
+# - fraude:destinos:<id>:<generación>: filtro de Bloom de DESTINOS_BITS bits con los destinos pagados en la
+#   generación (periodos de DESTINOS_DIAS días). Un destino es conocido si está en la generación actual o en la
+#   anterior, así que se olvida entre DESTINOS_DIAS y el doble de días después del último pago y el filtro no se
+#   satura con los destinos de toda la vida de la cuenta.
+# La operación se reserva sumando a los contadores antes del commit y se libera si la transacción no se confirma
+# (services.transaccion_externa). Los destinos se marcan solo al confirmar: un intento fallido no convierte un
+# destino en conocido.
+
+MEDIDAS = ('monto', 'cantidad', 'destinos_nuevos')
+_HASHES = 3  # Posiciones del filtro de Bloom por destino
+
+
+class LimiteSuperado(Exception):
+    def __init__(self, regla):
+        super().__init__(regla)
+        self.regla = regla
+
+
+@lru_cache(maxsize=None)
+def configuracion():
+    # (reglas, contadores) con las reglas validadas y los pares (medida, ventana) distintos que usan
+    reglas = tuple(settings.FRAUDE['REGLAS'])
+    for regla in reglas:
+        if regla['MEDIDA'] not in MEDIDAS:
+            raise ImproperlyConfigured(f"FRAUDE: la medida de {regla['NOMBRE']} debe ser una de {', '.join(MEDIDAS)}")
+    return reglas, tuple(sorted({(regla['MEDIDA'], regla['VENTANA']) for regla in reglas}))
+
+
+@receiver(setting_changed)
+def _reiniciar_configuracion(setting, **kwargs):
+    if setting == 'FRAUDE':
+        configuracion.cache_clear()
+
+
+def _cache():
+    return caches[settings.FRAUDE['ALIAS']]
+
+
+def _subventana(marca, ventana):
+    return int(marca // (ventana / settings.FRAUDE['CUBETAS']))
+
+
+def _clave_contador(cuenta_id, medida, ventana, subventana):
+    return f'fraude:{cuenta_id}:{medida}:{ventana}:{subventana}'
+
+
+def _vigencia_contador(ventana):
+    # Una subventana deja de contar una ventana después de empezar
+    return math.ceil(ventana + ventana / settings.FRAUDE['CUBETAS'])
+
+
+def _periodo_destinos():
+    return settings.FRAUDE['DESTINOS_DIAS'] * 86400
+
+
+def _clave_destinos(cuenta_id, generacion):
+    return f'fraude:destinos:{cuenta_id}:{generacion}'
+
+
+def _posiciones(destino_id):
+    # Doble hash multiplicativo: determinista entre procesos, a diferencia de hash() sobre cadenas
+    mezcla = (destino_id * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF
+    bits = settings.FRAUDE['DESTINOS_BITS']
+    return [((mezcla & 0xFFFFFFFF) + i * ((mezcla >> 32) | 1)) % bits for i in range(_HASHES)]
+
+
+def _conocido(filtro, destino_id):
+    return all(filtro >> posicion & 1 for posicion in _posiciones(destino_id))
+
+
+def _marcar(filtro, destino_id):
+    for posicion in _posiciones(destino_id):
+        filtro |= 1 << posicion
+    return filtro
+
+
+def _delta(movimientos, conocidos):
+    # {medida: valor} de un grupo de [(destino_id, monto)] dado el filtro de destinos ya conocidos
+    centavos, nuevos = 0, 0
+    for destino_id, importe in movimientos:
+        centavos += int(importe * 100)
+        if not _conocido(conocidos, destino_id):
+            nuevos += 1
+            conocidos = _marcar(conocidos, destino_id)
+    return {'monto': centavos, 'cantidad': len(movimientos), 'destinos_nuevos': nuevos}
+
+
+def _sumar(cache, clave, valor, vigencia):
+    cache.add(clave, 0, timeout=vigencia)
+    try:
+        cache.incr(clave, valor)
+    except ValueError:
+        cache.add(clave, valor, timeout=vigencia)  # Expiró entre add() e incr()
+
+
+def liberar(reserva):
+    # Descuenta una reserva cuya transacción no se confirmó
+    cache = _cache()
+    for clave, valor in reserva:
+        try:
+            cache.decr(clave, valor)
+        except ValueError:
+            pass  # El contador ya expiró
+
+
+def reservar(cuenta_id, movimientos):
+    # Suma `movimientos` ([(destino_id, monto)]) a los contadores de la cuenta y devuelve la reserva para
+    # liberar(). Si el total con la reserva supera una regla la libera y lanza LimiteSuperado: entre
+    # transferencias simultáneas ninguna pasa sin contar a las otras.
+    reglas, contadores = configuracion()
+    if not reglas:
+        return []
+    cache, ahora = _cache(), time.time()
+    generacion = int(ahora // _periodo_destinos())
+    conocidos = 0
+    for filtro in cache.get_many([_clave_destinos(cuenta_id, gen) for gen in (generacion - 1, generacion)]).values():
+        conocidos |= filtro
+    delta = _delta(movimientos, conocidos)
+
+    reserva = []
+    for medida, ventana in contadores:
+        if delta[medida]:
+            clave = _clave_contador(cuenta_id, medida, ventana, _subventana(ahora, ventana))
+            _sumar(cache, clave, delta[medida], _vigencia_contador(ventana))
+            reserva.append((clave, delta[medida]))
+
+    claves = {(medida, ventana): [_clave_contador(cuenta_id, medida, ventana, subventana) for subventana in
+                                  range(_subventana(ahora, ventana) - settings.FRAUDE['CUBETAS'] + 1,
+                                        _subventana(ahora, ventana) + 1)]
+              for medida, ventana in contadores}
+    valores = cache.get_many([clave for lista in claves.values() for clave in lista])
+    for regla in reglas:
+        total = sum(valores.get(clave, 0) for clave in claves[regla['MEDIDA'], regla['VENTANA']])
+        limite = regla['LIMITE'] * 100 if regla['MEDIDA'] == 'monto' else regla['LIMITE']
+        if total > limite:
+            liberar(reserva)
+            raise LimiteSuperado(regla['NOMBRE'])
+    return reserva
+
+
+def registrar_destinos(cuenta_id, movimientos):
+    # Marca los destinos de una operación confirmada en el filtro de la generación actual. Dos escrituras
+    # simultáneas pueden perder una marca: ese destino vuelve a contar como nuevo, nunca al revés.
+    reglas, _ = configuracion()
+    if not reglas:
+        return
+    cache = _cache()
+    clave = _clave_destinos(cuenta_id, int(time.time() // _periodo_destinos()))
+    filtro = anterior = cache.get(clave, 0)
+    for destino_id, _ in movimientos:
+        filtro = _marcar(filtro, destino_id)
+    if filtro != anterior:
+        cache.set(clave, filtro, timeout=2 * _periodo_destinos())
+
+
+def reconstruir(chunk_size=2000, bloque=500):
+    # Recalcula contadores y filtros de destinos desde las transferencias recientes (tras vaciar o cambiar la
+    # caché) en un recorrido ordenado por (cuenta_origen, fecha). En memoria quedan a lo sumo `bloque` cuentas.
+    reglas, contadores = configuracion()
+    if not reglas:
+        return 0
+    cache, ahora = _cache(), time.time()
+    periodo = _periodo_destinos()
+    generacion = int(ahora // periodo)
+    desde_contadores = ahora - max(ventana for _, ventana in contadores)
+    transferencias = Transferencia.objects.filter(
+        fecha__gte=datetime.fromtimestamp((generacion - 1) * periodo, tz=dt_timezone.utc),
+    ).order_by('cuenta_origen_id', 'fecha', 'id').values_list('cuenta_origen_id', 'cuenta_destino_id', 'monto', 'fecha')
+
+    def guardar(estados):
+        por_ventana = defaultdict(dict)
+        for cuenta_id, (sumas, _) in estados.items():
+            for (medida, ventana, subventana), valor in sumas.items():
+                por_ventana[ventana][_clave_contador(cuenta_id, medida, ventana, subventana)] = valor
+        for ventana, valores in por_ventana.items():
+            cache.set_many(valores, timeout=_vigencia_contador(ventana))
+        cache.set_many({_clave_destinos(cuenta_id, gen): filtro for cuenta_id, (_, filtros) in estados.items()
+                        for gen, filtro in filtros.items()}, timeout=2 * periodo)
+        estados.clear()
+
+    estados = defaultdict(lambda: (defaultdict(int), defaultdict(int)))
+    cuentas = 0
+    for cuenta_id, destino_id, monto, fecha in transferencias.iterator(chunk_size=chunk_size):
+        if cuenta_id not in estados:
+            if len(estados) >= bloque:
+                guardar(estados)
+            cuentas += 1
+        sumas, filtros = estados[cuenta_id]
+        marca = fecha.timestamp()
+        gen = int(marca // periodo)
+        delta = _delta([(destino_id, monto)], filtros.get(gen - 1, 0) | filtros[gen])
+        filtros[gen] = _marcar(filtros[gen], destino_id)
+        if marca >= desde_contadores:
+            for medida, ventana in contadores:
+                sumas[medida, ventana, _subventana(marca, ventana)] += delta[medida]
+    guardar(estados)
+    return cuentas
@@ -0,0 +1,20 @@
+from django.conf import settings
+from django.contrib.auth.hashers import ScryptPasswordHasher
+
+
+class ScryptConfigurable(ScryptPasswordHasher):
+    # scrypt (memory-hard) con el costo de settings.HASHER_SCRYPT. Cambiar el costo no invalida contraseñas:
+    # must_update() compara los parámetros guardados en el hash y check_password() lo regenera en el
+    # siguiente login exitoso, igual que los hashes PBKDF2 anteriores.
+
+    @property
+    def work_factor(self):
+        return settings.HASHER_SCRYPT['N']
+
+    @property
+    def block_size(self):
+        return settings.HASHER_SCRYPT['R']
+
+    @property
+    def parallelism(self):
+        return settings.HASHER_SCRYPT['P']
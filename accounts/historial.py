@@ -0,0 +1,75 @@
+import base64
+import heapq
+from operator import itemgetter
+
+from django.db.models import F, Q, Value
+from django.utils.dateparse import parse_datetime
+
+from .models import Transferencia
+
+CAMPOS = ('id', 'fecha', 'monto', 'motivo')
+ORDEN = ('-fecha', '-id')
+CLAVE_ORDEN = itemgetter('fecha', 'id')
+
+
+class CursorInvalido(Exception):
+    pass
+
+
+def codificar_cursor(movimiento):
+    valor = f"{movimiento['fecha'].isoformat()}|{movimiento['id']}"
+    return base64.urlsafe_b64encode(valor.encode()).decode()
+
+
+def decodificar_cursor(cursor):
+    try:
+        fecha, id_ = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        fecha = parse_datetime(fecha)
+        id_ = int(id_)
+    except (ValueError, UnicodeError):
+        raise CursorInvalido()
+    if fecha is None:
+        raise CursorInvalido()
+    return fecha, id_
+
+
+def _movimientos(cuenta_id, tipo, posicion=None, desde=None, hasta=None, bd=None):
+    # Cada lado se resuelve con su índice (cuenta, fecha, id) ya ordenado; no hay OFFSET ni ordenamiento en memoria
+    if tipo == 'salida':
+        consulta = Transferencia.objects.filter(cuenta_origen_id=cuenta_id)
+        contraparte = 'cuenta_destino__numero'
+    else:
+        consulta = Transferencia.objects.filter(cuenta_destino_id=cuenta_id)
+        contraparte = 'cuenta_origen__numero'
+
+    if posicion is not None:
+        fecha, id_ = posicion
+        consulta = consulta.filter(Q(fecha__lt=fecha) | Q(fecha=fecha, id__lt=id_))
+    if desde is not None:
+        consulta = consulta.filter(fecha__gte=desde)
+    if hasta is not None:
+        consulta = consulta.filter(fecha__lt=hasta)
+    if bd is not None:
+        consulta = consulta.using(bd)
+    return consulta.order_by(*ORDEN).values(*CAMPOS, cuenta=F(contraparte), tipo=Value(tipo))
+
+
+def pagina(cuenta_id, cursor=None, limite=50):
+    # Devuelve una página del historial combinado y el cursor de la siguiente (None si no hay más)
+    posicion = decodificar_cursor(cursor) if cursor else None
+    salidas = list(_movimientos(cuenta_id, 'salida', posicion)[:limite + 1])
+    entradas = list(_movimientos(cuenta_id, 'entrada', posicion)[:limite + 1])
+
+    movimientos = list(heapq.merge(salidas, entradas, key=CLAVE_ORDEN, reverse=True))[:limite + 1]
+    if len(movimientos) > limite:
+        movimientos = movimientos[:limite]
+        return movimientos, codificar_cursor(movimientos[-1])
+    return movimientos, None
+
+
+def recorrer(cuenta_id, desde=None, hasta=None, chunk_size=2000, bd=None):
+    # Recorre todo el historial con dos cursores del servidor; la memoria usada no depende del número de filas.
+    # `bd` fija el alias de antemano: las consultas se ejecutan al transmitir la respuesta, fuera de la vista.
+    salidas = _movimientos(cuenta_id, 'salida', desde=desde, hasta=hasta, bd=bd).iterator(chunk_size=chunk_size)
+    entradas = _movimientos(cuenta_id, 'entrada', desde=desde, hasta=hasta, bd=bd).iterator(chunk_size=chunk_size)
+    return heapq.merge(salidas, entradas, key=CLAVE_ORDEN, reverse=True)
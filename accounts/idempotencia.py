@@ -0,0 +1,138 @@
+import hashlib
+import json
+import time
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework.response import Response
+
+from .models import ClaveIdempotencia
+
+
+# Respuestas que dependen del momento (conflicto, límite de velocidad, tiempo agotado): no se guardan, y un
+# reintento con la misma clave vuelve a ejecutar la vista en lugar de repetir el rechazo durante IDEMPOTENCIA_TTL
+TRANSITORIAS = {408, 409, 425, 429}
+
+
+class ReservaPerdida(Exception):
+    # Otra solicitud retomó la reserva por abandonada mientras esta seguía ejecutándose
+    pass
+
+
+def huella(request):
+    cuerpo = json.dumps(request.data, sort_keys=True, cls=DjangoJSONEncoder)
+    return hashlib.sha256(f'{request.method} {request.path}\n{cuerpo}'.encode()).hexdigest()
+
+
+def _repetir(registro):
+    respuesta = Response(registro['respuesta'], status=registro['status'])
+    respuesta['Idempotent-Replayed'] = 'true'
+    return respuesta
+
+
+def _crear(usuario, clave, huella_solicitud):
+    try:
+        with transaction.atomic():
+            return ClaveIdempotencia.objects.create(usuario=usuario, clave=clave, huella=huella_solicitud)
+    except IntegrityError:
+        return None  # Otra solicitud con la misma clave la creó primero
+
+
+def _reclamar(usuario, clave, huella_solicitud):
+    # Devuelve (registro propio, None) si esta solicitud debe ejecutarse, o (None, respuesta) si no.
+    # Se lee antes de insertar: un reintento de una solicitud ya completada cuesta una sola consulta.
+    plazo = timezone.now() + timedelta(seconds=settings.IDEMPOTENCIA_ESPERA)
+    espera = 0.02
+    while True:
+        registro = ClaveIdempotencia.objects.filter(usuario=usuario, clave=clave) \
+            .values('id', 'huella', 'estado', 'status', 'respuesta', 'creada_en').first()
+        if registro is None:
+            # Clave nueva, o la solicitud original falló sin respuesta y la liberó
+            propio = _crear(usuario, clave, huella_solicitud)
+            if propio is not None:
+                return propio, None
+            continue
+
+        if registro['creada_en'] < timezone.now() - timedelta(seconds=settings.IDEMPOTENCIA_TTL):
+            ClaveIdempotencia.objects.filter(id=registro['id'], creada_en=registro['creada_en']).delete()
+            continue
+
+        if registro['huella'] != huella_solicitud:
+            return None, Response({'error': 'La clave de idempotencia ya se usó con otra solicitud'}, status=422)
+        if registro['estado'] == ClaveIdempotencia.COMPLETADA:
+            return None, _repetir(registro)
+
+        # En curso. El resultado exitoso se guarda en la misma transacción que la transferencia, así que una
+        # reserva abandonada (proceso caído) nunca movió dinero y puede retomarse sin riesgo de doble débito.
+        # Retomarla renueva creada_en: si la solicitud original seguía viva, su completar() ya no coincide y su
+        # transacción se deshace.
+        abandonada = timezone.now() - timedelta(seconds=settings.IDEMPOTENCIA_RESERVA)
+        if registro['creada_en'] < abandonada and ClaveIdempotencia.objects.filter(
+                id=registro['id'], estado=ClaveIdempotencia.EN_CURSO, creada_en=registro['creada_en']
+        ).update(creada_en=timezone.now()):
+            return ClaveIdempotencia.objects.get(id=registro['id']), None
+
+        if timezone.now() >= plazo:
+            return None, Response({'error': 'Hay una solicitud en curso con la misma clave de idempotencia'},
+                                  status=409)
+        time.sleep(espera)
+        espera = min(espera * 2, 0.5)
+
+
+def _propia(registro):
+    # La reserva solo es de esta solicitud mientras conserve el creada_en con el que la obtuvo
+    return ClaveIdempotencia.objects.filter(id=registro.id, creada_en=registro.creada_en)
+
+
+def completar(registro, status, datos):
+    # Guarda la respuesta final; devuelve False si la reserva ya no es de esta solicitud
+    return bool(_propia(registro).filter(estado=ClaveIdempotencia.EN_CURSO)
+                .update(estado=ClaveIdempotencia.COMPLETADA, status=status, respuesta=datos))
+
+
+def al_confirmar(request, status, datos):
+    # Callback para transferir(): guarda la respuesta exitosa en el mismo commit que mueve el dinero. Si otra
+    # solicitud retomó la reserva, ReservaPerdida deshace la transferencia.
+    if request.idempotencia is None:
+        return None
+
+    def confirmar(transferencia):
+        if not completar(request.idempotencia, status, datos):
+            raise ReservaPerdida()
+    return confirmar
+
+
+def idempotente(vista):
+    # Honra la cabecera Idempotency-Key: una misma clave ejecuta la vista una sola vez y los reintentos
+    # reciben la respuesta guardada. La vista recibe el registro en request.idempotencia.
+    @wraps(vista)
+    def envoltura(request, *args, **kwargs):
+        clave = request.headers.get('Idempotency-Key')
+        request.idempotencia = None
+        if not clave:
+            return vista(request, *args, **kwargs)
+        if len(clave) > 64:
+            return Response({'error': 'La clave de idempotencia no puede superar 64 caracteres'}, status=400)
+
+        registro, respuesta = _reclamar(request.user, clave, huella(request))
+        if respuesta is not None:
+            return respuesta
+
+        request.idempotencia = registro
+        try:
+            respuesta = vista(request, *args, **kwargs)
+        except ReservaPerdida:
+            return Response({'error': 'Hay una solicitud en curso con la misma clave de idempotencia'}, status=409)
+        except Exception:
+            _propia(registro).delete()  # Sin respuesta que guardar: el cliente puede reintentar con la misma clave
+            raise
+        if respuesta.status_code >= 500 or respuesta.status_code in TRANSITORIAS:
+            _propia(registro).delete()
+        else:
+            completar(registro, respuesta.status_code, respuesta.data)
+        return respuesta
+    return envoltura
@@ -0,0 +1,126 @@
+import datetime
+import json
+from decimal import Decimal
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.http import HttpResponse
+from django.utils.functional import Promise
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser, JSONParser
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.settings import api_settings
+
+# Serialización JSON de la API: orjson o msgspec si están instalados, json de la biblioteca estándar si no.
+# Con cualquiera de los tres la salida es la misma: Decimal como cadena ('1500.00'), fechas en ISO-8601 y
+# JSON compacto en UTF-8. Las vistas entregan los valores tal como salen de la base de datos.
+
+
+def _por_defecto(valor):
+    # orjson y msgspec ya escriben datetime, date y time en ISO-8601; json los envía aquí
+    if isinstance(valor, Decimal):
+        return str(valor)
+    if isinstance(valor, (datetime.datetime, datetime.date, datetime.time)):
+        return valor.isoformat()
+    if isinstance(valor, Promise):
+        return str(valor)  # Mensajes traducibles de DRF y simplejwt
+    raise TypeError(f'{type(valor).__name__} no se puede serializar a JSON')
+
+
+def _orjson():
+    import orjson
+
+    def dumps(datos):
+        return orjson.dumps(datos, default=_por_defecto)
+    return dumps, orjson.loads, (orjson.JSONDecodeError,)
+
+
+def _msgspec():
+    import msgspec
+
+    codificador = msgspec.json.Encoder(enc_hook=_por_defecto, decimal_format='string')
+    return codificador.encode, msgspec.json.decode, (msgspec.DecodeError,)
+
+
+def _estandar():
+    def dumps(datos):
+        return json.dumps(datos, default=_por_defecto, ensure_ascii=False, separators=(',', ':')).encode()
+    return dumps, json.loads, (ValueError,)
+
+
+MOTORES = {'orjson': _orjson, 'msgspec': _msgspec, 'json': _estandar}
+
+
+@lru_cache(maxsize=None)
+def motor():
+    # (nombre, dumps, loads, errores de decodificación) del motor configurado en JSON_MOTOR
+    nombre = settings.JSON_MOTOR
+    if nombre != 'auto':
+        if nombre not in MOTORES:
+            raise ImproperlyConfigured(f"JSON_MOTOR debe ser 'auto' o uno de {', '.join(MOTORES)}")
+        try:
+            return (nombre, *MOTORES[nombre]())
+        except ImportError:
+            raise ImproperlyConfigured(f"JSON_MOTOR = '{nombre}' requiere instalar {nombre}")
+    for nombre, cargar in MOTORES.items():
+        try:
+            return (nombre, *cargar())
+        except ImportError:
+            continue
+
+
+@receiver(setting_changed)
+def _reiniciar_motor(setting, **kwargs):
+    if setting == 'JSON_MOTOR':
+        motor.cache_clear()
+
+
+def dumps(datos):
+    return motor()[1](datos)
+
+
+def loads(contenido):
+    return motor()[2](contenido)
+
+
+class RespuestaJSON(HttpResponse):
+    # Reemplazo de JsonResponse para las vistas que no pasan por los renderers de DRF
+    def __init__(self, datos, **kwargs):
+        kwargs.setdefault('content_type', 'application/json')
+        super().__init__(dumps(datos), **kwargs)
+
+
+class JSONRapidoRenderer(BaseRenderer):
+    media_type = 'application/json'
+    format = 'json'
+    charset = None  # El cuerpo ya es UTF-8; DRF no debe agregar charset al Content-Type
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return dumps(data)
+
+
+class JSONRapidoParser(BaseParser):
+    media_type = 'application/json'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return loads(stream.read())
+        except motor()[3] as error:
+            raise ParseError(f'JSON parse error - {error}')
+
+
+def _sustituir(clases, original, rapida):
+    return tuple(rapida if clase is original else clase for clase in clases)
+
+
+def json_rapido(vista):
+    # Para las vistas de accounts (debajo de @api_view): cambia JSONRenderer y JSONParser por los de este módulo
+    # y conserva los demás configurados en REST_FRAMEWORK, sin cambiar los valores por defecto del proyecto
+    vista.renderer_classes = _sustituir(api_settings.DEFAULT_RENDERER_CLASSES, JSONRenderer, JSONRapidoRenderer)
+    vista.parser_classes = _sustituir(api_settings.DEFAULT_PARSER_CLASSES, JSONParser, JSONRapidoParser)
+    return vista
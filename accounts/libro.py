@@ -0,0 +1,93 @@
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal
+
+from django.db.models import Case, DateTimeField, DecimalField, F, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import CuentaBancaria, MovimientoLibro, CorteSaldo
+
+CERO = Value(Decimal('0'), output_field=DecimalField(max_digits=12, decimal_places=2))
+# Aporte firmado de un movimiento al saldo: los débitos restan, créditos y aperturas suman
+MONTO_FIRMADO = Case(When(tipo=MovimientoLibro.DEBITO, then=-F('monto')), default=F('monto'),
+                     output_field=DecimalField(max_digits=12, decimal_places=2))
+# Fecha de corte de las cuentas sin cortes: todos sus movimientos cuentan
+SIN_CORTE = Value(datetime(1, 1, 1, tzinfo=dt_timezone.utc), output_field=DateTimeField())
+
+
+def _aplicar(saldos, cuenta_id, delta):
+    if cuenta_id not in saldos:
+        return None
+    saldos[cuenta_id] += delta
+    return saldos[cuenta_id]
+
+
+def registrar(asientos, saldos):
+    # asientos: [(transferencia, cuenta_origen_id, cuenta_destino_id, monto)] en el orden en que se aplicaron.
+    # saldos: saldo de cada cuenta involucrada leído con la fila bloqueada, antes de aplicar los asientos.
+    # Las cuentas siguen bloqueadas por la transacción, así que el saldo resultante calculado aquí es exacto.
+    # Las cuentas fraccionadas no vienen en `saldos` y su saldo resultante queda nulo.
+    saldos = dict(saldos)
+    ahora = timezone.now()
+    movimientos = []
+    for transferencia, origen_id, destino_id, monto in asientos:
+        movimientos.append(MovimientoLibro(cuenta_id=origen_id, transferencia=transferencia, tipo=MovimientoLibro.DEBITO,
+                                           monto=monto, saldo_resultante=_aplicar(saldos, origen_id, -monto),
+                                           fecha=ahora))
+        movimientos.append(MovimientoLibro(cuenta_id=destino_id, transferencia=transferencia, tipo=MovimientoLibro.CREDITO,
+                                           monto=monto, saldo_resultante=_aplicar(saldos, destino_id, monto),
+                                           fecha=ahora))
+    MovimientoLibro.objects.bulk_create(movimientos, batch_size=500)
+
+
+def abrir(cuentas):
+    # Asiento de apertura con el saldo actual para cuentas que aún no tienen movimientos en el libro
+    ahora = timezone.now()
+    MovimientoLibro.objects.bulk_create([
+        MovimientoLibro(cuenta_id=cuenta_id, tipo=MovimientoLibro.APERTURA, monto=saldo, saldo_resultante=saldo,
+                        fecha=ahora)
+        for cuenta_id, saldo in cuentas
+    ], batch_size=500)
+
+
+# Cada cuenta entra al libro al crearse, con su saldo inicial: una cuenta creada con saldo que transfiere antes
+# de reconcile_ledger --abrir quedaría descuadrada. Las cargas con bulk_create o COPY (populate_db) no emiten
+# post_save y siguen necesitando --abrir.
+@receiver(post_save, sender=CuentaBancaria)
+def _cuenta_creada(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        abrir([(instance.pk, instance.saldo)])
+
+
+def saldo_en(cuenta_id, momento):
+    # Saldo del corte más cercano anterior a `momento` más los movimientos posteriores a ese corte
+    corte = CorteSaldo.objects.filter(cuenta_id=cuenta_id, fecha__lte=momento).order_by('-fecha') \
+        .values_list('fecha', 'saldo').first()
+    desde, saldo = corte if corte else (None, Decimal('0'))
+
+    movimientos = MovimientoLibro.objects.filter(cuenta_id=cuenta_id, fecha__lte=momento)
+    if desde is not None:
+        movimientos = movimientos.filter(fecha__gt=desde)
+    return saldo + movimientos.aggregate(neto=Coalesce(Sum(MONTO_FIRMADO), CERO))['neto']
+
+
+def neto_entre(desde, hasta):
+    # Subconsulta correlacionada con CuentaBancaria: aporte neto de los movimientos en (desde, hasta]
+    movimientos = MovimientoLibro.objects.filter(cuenta=OuterRef('pk'))
+    if desde is not None:
+        movimientos = movimientos.filter(fecha__gt=desde)
+    if hasta is not None:
+        movimientos = movimientos.filter(fecha__lte=hasta)
+    neto = movimientos.order_by().values('cuenta').annotate(neto=Sum(MONTO_FIRMADO)).values('neto')
+    return Coalesce(Subquery(neto), CERO)
+
+
+def corte_vigente(campo, hasta=None):
+    # Subconsulta correlacionada con CuentaBancaria: `campo` del último corte de cada cuenta hasta `hasta`.
+    # Cada cuenta usa su propio corte: una corrida con --corte interrumpida deja cuentas sin el corte más reciente.
+    cortes = CorteSaldo.objects.filter(cuenta=OuterRef('pk'))
+    if hasta is not None:
+        cortes = cortes.filter(fecha__lte=hasta)
+    return Subquery(cortes.order_by('-fecha').values(campo)[:1])
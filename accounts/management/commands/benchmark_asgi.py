@@ -0,0 +1,102 @@
+import asyncio
+import json
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient, Client
+from django.test.utils import setup_test_environment
+
+from accounts.medicion import resumen
+from accounts.models import CuentaBancaria, Contacto
+from accounts.serializers import CustomTokenObtainPairSerializer
+
+RUTAS = ('obtener_cuenta_origen', 'obtener_contactos', 'obtener_tokens_cliente', 'generarToken')
+
+
+class Command(BaseCommand):
+    help = 'Compara peticiones por segundo y p99 de las vistas WSGI (/api/) contra las async (/api/async/)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--peticiones', type=int, default=1000, help='Peticiones por ruta y por modo')
+        parser.add_argument('--concurrencia', type=int, default=32)
+        parser.add_argument('--contactos', type=int, default=50, help='Contactos del usuario de prueba')
+        parser.add_argument('--url', help='Servidor local ya levantado (p. ej. http://127.0.0.1:8000); '
+                                          'por defecto se usan los handlers WSGI/ASGI en el mismo proceso')
+        parser.add_argument('--json', action='store_true', help='Imprime el resultado como JSON')
+
+    def handle(self, *args, **options):
+        setup_test_environment(debug=False)  # Admite el host 'testserver' y no acumula connection.queries
+        usuario = self.preparar_datos(options['contactos'])
+        headers = {'Authorization': f'Bearer {CustomTokenObtainPairSerializer.get_token(usuario).access_token}'}
+
+        resultados = {}
+        for ruta in RUTAS:
+            for modo, prefijo in (('wsgi', '/api/'), ('asgi', '/api/async/')):
+                url = f'{prefijo}{ruta}/'
+                if options['url']:
+                    medicion = self.medir_http(options['url'] + url, headers, options)
+                elif modo == 'wsgi':
+                    medicion = self.medir_wsgi(url, headers, options)
+                else:
+                    medicion = asyncio.run(self.medir_asgi(url, headers, options))
+                resultados[f'{modo} {ruta}'] = medicion
+
+        if options['json']:
+            self.stdout.write(json.dumps(resultados, indent=2))
+            return
+        for nombre, medicion in resultados.items():
+            self.stdout.write(f"{nombre:<32} {medicion['req_s']:>9} req/s  p50 {medicion['p50_ms']:>7} ms  "
+                              f"p99 {medicion['p99_ms']:>7} ms")
+
+    def preparar_datos(self, contactos):
+        usuario, _ = User.objects.get_or_create(username='benchmark_asgi')
+        CuentaBancaria.objects.get_or_create(numero='BENCH-ASGI-0', defaults={
+            'tipo': 'Ahorro', 'saldo': Decimal('1000.00'), 'usuario': usuario})
+        for i in range(Contacto.objects.filter(usuario=usuario).count(), contactos):
+            cuenta, _ = CuentaBancaria.objects.get_or_create(numero=f'BENCH-ASGI-{i + 1}', defaults={
+                'tipo': 'Ahorro', 'saldo': Decimal('0'), 'usuario': usuario})
+            Contacto.objects.create(usuario=usuario, cuenta_bancaria=cuenta)
+        return usuario
+
+    def medir_wsgi(self, url, headers, options):
+        def peticion(_):
+            inicio = time.perf_counter()
+            respuesta = Client().get(url, headers=headers)
+            assert respuesta.status_code == 200, respuesta.status_code
+            return time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        with ThreadPoolExecutor(options['concurrencia']) as pool:
+            latencias = list(pool.map(peticion, range(options['peticiones'])))
+        return resumen(latencias, time.perf_counter() - inicio)
+
+    async def medir_asgi(self, url, headers, options):
+        cliente = AsyncClient()
+        semaforo = asyncio.Semaphore(options['concurrencia'])
+
+        async def peticion():
+            async with semaforo:
+                inicio = time.perf_counter()
+                respuesta = await cliente.get(url, headers=headers)
+                assert respuesta.status_code == 200, respuesta.status_code
+                return time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        latencias = await asyncio.gather(*(peticion() for _ in range(options['peticiones'])))
+        return resumen(latencias, time.perf_counter() - inicio)
+
+    def medir_http(self, url, headers, options):
+        def peticion(_):
+            inicio = time.perf_counter()
+            with urllib.request.urlopen(urllib.request.Request(url, headers=headers)) as respuesta:
+                respuesta.read()
+            return time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        with ThreadPoolExecutor(options['concurrencia']) as pool:
+            latencias = list(pool.map(peticion, range(options['peticiones'])))
+        return resumen(latencias, time.perf_counter() - inicio)
@@ -0,0 +1,127 @@
+import json
+from io import StringIO
+from pathlib import Path
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import setup_databases, setup_test_environment, teardown_databases
+
+from accounts.cache_lecturas import CONTACTOS, CUENTAS, obtener_cache
+from accounts.medicion import comparar, medir
+from accounts.models import CuentaBancaria, Contacto, Token
+from accounts.serializers import CustomTokenObtainPairSerializer
+from accounts.tokens import obtener_almacen
+
+PASSWORD = 'password.3'
+
+
+def escenarios(usuario):
+    # Una petición por ruta de accounts/urls.py que interesa medir; cada función comprueba el status
+    cuenta_origen, cuenta_destino = _cuentas(usuario)
+    headers = {'Authorization': f'Bearer {CustomTokenObtainPairSerializer.get_token(usuario).access_token}'}
+    cliente = Client()
+
+    def verificar(respuesta, status=200):
+        if respuesta.status_code != status:
+            raise CommandError(f'{respuesta.request["PATH_INFO"]} respondió {respuesta.status_code}')
+
+    def login():
+        verificar(cliente.post('/api/login/', {'username': usuario.username, 'password': PASSWORD},
+                               content_type='application/json'))
+
+    def emitir_token():
+        # Se llama fuera de la medición: el token se emite con el almacén configurado, como lo haría el cliente
+        return obtener_almacen().emitir(usuario)[0]
+
+    def transferencia(token):
+        verificar(cliente.post('/api/transferencia/', {
+            'cuenta_origen': cuenta_origen, 'cuenta_destino': cuenta_destino, 'monto': '0.01',
+            'motivo': 'benchmark', 'token': token}, content_type='application/json', headers=headers))
+
+    # {ruta: (petición, preparación fuera de la medición o None)}
+    return {
+        'login': (login, None),
+        'generarToken': (lambda: verificar(cliente.get('/api/generarToken/', headers=headers)), None),
+        'obtener_cuenta_origen': (lambda: verificar(cliente.get('/api/obtener_cuenta_origen/', headers=headers)),
+                                  None),
+        'obtener_tokens_cliente': (lambda: verificar(cliente.get('/api/obtener_tokens_cliente/', headers=headers)),
+                                   None),
+        'obtener_contactos': (lambda: verificar(cliente.get('/api/obtener_contactos/', headers=headers)), None),
+        'transferencia': (transferencia, emitir_token),
+    }
+
+
+def _cuentas(usuario):
+    origen = CuentaBancaria.objects.filter(usuario=usuario).values_list('numero', flat=True).first()
+    destino = Contacto.objects.filter(usuario=usuario).values_list('cuenta_bancaria__numero', flat=True).first()
+    return origen, destino
+
+
+class Command(BaseCommand):
+    help = ('Mide latencia, consultas SQL y memoria por petición de los endpoints a varias escalas de datos, '
+            'guarda el resultado como línea base y falla si se supera la línea base existente')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--escalas', default='100,1000',
+                            help='Usuarios generados por escala, separados por coma (ver populate_db)')
+        parser.add_argument('--peticiones', type=int, default=200, help='Peticiones por ruta y escala')
+        parser.add_argument('--muestras-memoria', type=int, default=20)
+        parser.add_argument('--base', default='benchmarks/endpoints.json',
+                            help='Archivo JSON de la línea base; cada motor de base de datos tiene su sección')
+        parser.add_argument('--tolerancia', type=float, default=0.5,
+                            help='Margen admitido sobre p99 y memoria de la línea base (0.5 = 50%%)')
+        parser.add_argument('--guardar', action='store_true', help='Reemplaza la línea base con esta corrida')
+
+    def handle(self, *args, **options):
+        # Todo ocurre en una base de datos de prueba desechable: nunca toca los datos reales
+        setup_test_environment(debug=False)
+        escalas = [int(escala) for escala in options['escalas'].split(',')]
+        if min(escalas) < 2:
+            raise CommandError('Cada escala necesita al menos 2 usuarios para transferir entre contactos')
+        configuracion = setup_databases(verbosity=0, interactive=False, aliases={'default'})
+        try:
+            resultados = {str(escala): self.medir_escala(escala, options) for escala in escalas}
+        finally:
+            teardown_databases(configuracion, verbosity=0)
+
+        for escala, rutas in resultados.items():
+            for ruta, medicion in rutas.items():
+                self.stdout.write(f"{escala:>7} {ruta:<24} p50 {medicion['p50_ms']:>8} ms  p99 "
+                                  f"{medicion['p99_ms']:>8} ms  {medicion['consultas']:>3} consultas  "
+                                  f"{medicion['memoria_kb']:>8} KiB")
+
+        ruta_base = Path(options['base'])
+        lineas_base = json.loads(ruta_base.read_text()) if ruta_base.exists() else {}
+        if options['guardar']:
+            lineas_base[connection.vendor] = resultados
+            ruta_base.parent.mkdir(parents=True, exist_ok=True)
+            ruta_base.write_text(json.dumps(lineas_base, indent=2, sort_keys=True) + '\n')
+            self.stdout.write(self.style.SUCCESS(f'Línea base de {connection.vendor} guardada en {ruta_base}'))
+            return
+
+        base = lineas_base.get(connection.vendor)
+        if base is None:
+            self.stdout.write(self.style.WARNING(f'Sin línea base de {connection.vendor}; usa --guardar'))
+            return
+        excedidos = comparar(resultados, base, options['tolerancia'])
+        if excedidos:
+            raise CommandError('Presupuesto superado:\n' + '\n'.join(excedidos))
+        self.stdout.write(self.style.SUCCESS('Dentro de la línea base'))
+
+    def medir_escala(self, escala, options):
+        call_command('flush', interactive=False, verbosity=0)
+        call_command('populate_db', usuarios=escala, cuentas_por_usuario=2,
+                     contactos_por_usuario=min(escala - 1, 100), transferencias=escala * 10, semilla=escala, password=PASSWORD, stdout=StringIO())
+        usuario = User.objects.order_by('id').first()
+        # flush reinicia los ids: la caché de lecturas podría tener los datos de la escala anterior
+        obtener_cache().delete_many([f'{recurso}:{usuario.pk}' for recurso in (CUENTAS, CONTACTOS)])
+        Token.objects.bulk_create(Token(cliente=usuario, token=f'{i:06d}', es_valido=False)
+                                  for i in range(min(escala, 1000)))
+        # Las lecturas cacheadas se miden en su estado estable: la primera petición calienta la caché.
+        # Sin límites de login: todas las peticiones salen del mismo usuario e IP y se mide el hash.
+        with override_settings(LOGIN_LIMITES=None):
+            return {ruta: medir(peticion, options['peticiones'], options['muestras_memoria'], preparar=preparar)
+                    for ruta, (peticion, preparar) in escenarios(usuario).items()}
@@ -0,0 +1,67 @@
+import json
+import random
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand
+from django.core.serializers.json import DjangoJSONEncoder
+from django.test import override_settings
+from django.utils import timezone
+
+from accounts import json_rapido
+from accounts.medicion import medir
+from accounts.views import pagina_tokens
+
+
+def _tokens_anterior(tokens):
+    # Serialización anterior de obtener_tokens_cliente: strftime por fila y DjangoJSONEncoder
+    return json.dumps({'tokens': [{
+        'token': token,
+        'generado_en': generado_en.strftime("%m/%d/%Y, %H:%M:%S"),
+        'usado_en': usado_en.strftime("%m/%d/%Y, %H:%M:%S") if usado_en else None,
+        'es_valido': es_valido,
+    } for _, token, generado_en, usado_en, es_valido in tokens]}, cls=DjangoJSONEncoder).encode()
+
+
+def _cuentas(cuentas):
+    return {'cuentas': [{'numero': numero, 'tipo': tipo, 'saldo': saldo} for numero, tipo, saldo in cuentas]}
+
+
+class Command(BaseCommand):
+    help = ('Mide el costo de serializar respuestas de N filas (tokens y cuentas) con la serialización anterior '
+            '(json + DjangoJSONEncoder) y con cada motor de accounts.json_rapido instalado')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--filas', type=int, default=10000)
+        parser.add_argument('--repeticiones', type=int, default=50)
+
+    def handle(self, *args, **options):
+        azar = random.Random(0)
+        ahora = timezone.now()
+        filas = options['filas']
+        # Las mismas tuplas que devuelven los values_list de las vistas
+        tokens = [(i, f'{azar.randrange(10 ** 6):06d}', ahora - timedelta(seconds=i),
+                   ahora - timedelta(seconds=i - 5) if i % 2 else None, bool(i % 2)) for i in range(filas)]
+        cuentas = [(str(1_000_000_000 + i), 'Ahorro', Decimal(azar.randrange(10 ** 7)) / 100) for i in range(filas)]
+
+        escenarios = {
+            'anterior': (lambda: _tokens_anterior(tokens),
+                         lambda: json.dumps(_cuentas(cuentas), cls=DjangoJSONEncoder).encode()),
+        }
+        for nombre in json_rapido.MOTORES:
+            with override_settings(JSON_MOTOR=nombre):
+                try:
+                    dumps = json_rapido.motor()[1]
+                except ImproperlyConfigured:
+                    self.stdout.write(f'{nombre}: no instalado')
+                    continue
+            escenarios[nombre] = (lambda dumps=dumps: dumps(pagina_tokens(tokens, filas)),
+                                  lambda dumps=dumps: dumps(_cuentas(cuentas)))
+
+        self.stdout.write(f'{filas} filas, {options["repeticiones"]} repeticiones (p50 / p99 en ms, memoria en KB)')
+        for nombre, (serializar_tokens, serializar_cuentas) in escenarios.items():
+            for recurso, serializar in (('tokens', serializar_tokens), ('cuentas', serializar_cuentas)):
+                medicion = medir(serializar, options['repeticiones'], muestras_memoria=3)
+                self.stdout.write(f"{nombre:<9} {recurso:<8} {medicion['p50_ms']:>8} / {medicion['p99_ms']:>8} ms  "
+                                  f"{medicion['memoria_kb']:>9} KB  {len(serializar()):>9} bytes")
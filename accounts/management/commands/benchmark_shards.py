@@ -0,0 +1,88 @@
+import threading
+import time
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Sum
+from django.test.utils import setup_databases, setup_test_environment, teardown_databases
+
+from accounts import fracciones
+from accounts.models import CuentaBancaria, FraccionSaldo, Token
+from accounts.services import transferir
+
+SALDO_INICIAL = Decimal('1000000.00')
+
+
+class Command(BaseCommand):
+    help = ('Mide créditos por segundo a una sola cuenta caliente desde muchos hilos, con distintas cantidades '
+            'de fracciones, en una base de datos de prueba desechable')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fracciones', default='0,1,4,16,64', help='Fracciones a medir, separadas por coma')
+        parser.add_argument('--hilos', type=int, default=16, help='Transferencias simultáneas, cada una desde su cuenta')
+        parser.add_argument('--creditos', type=int, default=2000, help='Transferencias por medición')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            # SQLite bloquea la base completa en cada escritura: no hay filas que repartir
+            raise CommandError('El benchmark de fracciones necesita PostgreSQL')
+        setup_test_environment(debug=False)
+        configuracion = setup_databases(verbosity=0, interactive=False, aliases={'default'})
+        try:
+            origenes, destino = self.preparar(options['hilos'])
+            for n in (int(valor) for valor in options['fracciones'].split(',')):
+                fracciones.fraccionar(destino.id, n)
+                segundos = self.medir(origenes, destino, options['creditos'])
+                self.verificar(len(origenes))
+                self.stdout.write(f"{n:>4} fracciones  {options['creditos'] / segundos:>9.1f} créditos/s  "
+                                  f'({segundos:.2f} s)')
+        finally:
+            teardown_databases(configuracion, verbosity=0)
+
+    def preparar(self, hilos):
+        comercio = User.objects.create_user(username='benchmark_comercio')
+        destino = CuentaBancaria.objects.create(numero='BENCH-HOT', tipo='Corriente', saldo=0, usuario=comercio)
+        origenes = []
+        for i in range(hilos):
+            usuario = User.objects.create_user(username=f'benchmark_cliente{i}')
+            cuenta = CuentaBancaria.objects.create(numero=f'BENCH-{i}', tipo='Ahorro', saldo=SALDO_INICIAL,
+                                                   usuario=usuario)
+            origenes.append((usuario, cuenta))
+        return origenes, destino
+
+    def medir(self, origenes, destino, creditos):
+        # Los tokens se crean antes de medir: cada transferencia consume uno distinto
+        por_hilo = [range(i, creditos, len(origenes)) for i in range(len(origenes))]
+        Token.objects.bulk_create(Token(cliente=usuario, token=f'{j:06d}')
+                                  for (usuario, _), indices in zip(origenes, por_hilo) for j in indices)
+        errores = []
+
+        def trabajar(usuario, cuenta, indices):
+            try:
+                for j in indices:
+                    transferir(usuario, cuenta.numero, destino.numero, Decimal('1.00'), 'benchmark', f'{j:06d}')
+            except Exception as error:
+                errores.append(error)
+            finally:
+                connection.close()
+
+        hilos = [threading.Thread(target=trabajar, args=(usuario, cuenta, indices))
+                 for (usuario, cuenta), indices in zip(origenes, por_hilo)]
+        inicio = time.perf_counter()
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        segundos = time.perf_counter() - inicio
+        if errores:
+            raise CommandError(f'{len(errores)} hilos fallaron; el primero: {errores[0]!r}')
+        return segundos
+
+    def verificar(self, cuentas_origen):
+        # El dinero total no cambia: lo que salió de los orígenes está en la base o en las fracciones del destino
+        total = CuentaBancaria.objects.aggregate(t=Sum('saldo'))['t'] + \
+            (FraccionSaldo.objects.aggregate(t=Sum('saldo'))['t'] or 0)
+        if total != SALDO_INICIAL * cuentas_origen:
+            raise CommandError(f'El dinero total cambió: {total}')
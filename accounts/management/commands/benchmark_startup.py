@@ -0,0 +1,97 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Se ejecuta en un intérprete nuevo por medición: nada de lo importado por manage.py cuenta como ya cargado
+HIJO = r'''
+import importlib, sys, time
+inicio = time.perf_counter()
+modulo, servidor, ruta = sys.argv[1:4]
+aplicacion = importlib.import_module(modulo).application
+cargado = time.perf_counter()
+if servidor == 'wsgi':
+    from io import BytesIO
+    estados = []
+    entorno = {'REQUEST_METHOD': 'GET', 'PATH_INFO': ruta, 'QUERY_STRING': '', 'SERVER_NAME': 'localhost',
+               'SERVER_PORT': '80', 'SERVER_PROTOCOL': 'HTTP/1.1', 'wsgi.input': BytesIO(),
+               'wsgi.errors': sys.stderr, 'wsgi.url_scheme': 'http'}
+    b''.join(aplicacion(entorno, lambda estado, cabeceras, *_: estados.append(estado)))
+    status = int(estados[0].split()[0])
+else:
+    import asyncio
+    mensajes, pendientes = [], [{'type': 'http.request', 'body': b'', 'more_body': False}]
+
+    async def recibir():
+        if pendientes:
+            return pendientes.pop()
+        await asyncio.Future()  # Después del cuerpo, el cliente no se desconecta
+
+    async def enviar(mensaje):
+        mensajes.append(mensaje)
+
+    alcance = {'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+               'scheme': 'http', 'path': ruta, 'raw_path': ruta.encode(), 'query_string': b'', 'root_path': '',
+               'headers': [(b'host', b'localhost')], 'client': ('127.0.0.1', 0), 'server': ('localhost', 80)}
+    asyncio.run(aplicacion(alcance, recibir, enviar))
+    status = mensajes[0]['status']
+fin = time.perf_counter()
+
+import json, resource
+print(json.dumps({
+    'carga_ms': (cargado - inicio) * 1000,
+    'primera_peticion_ms': (fin - cargado) * 1000,
+    'status': status,
+    'modulos': len(sys.modules),
+    'memoria_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+}))
+'''
+
+
+class Command(BaseCommand):
+    help = ('Mide el arranque en frío de un worker con el perfil completo (settings) y el de solo API '
+            '(settings_api): carga del módulo WSGI/ASGI, tiempo hasta responder la primera petición, módulos '
+            'cargados y memoria, cada uno en un proceso nuevo')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--servidor', choices=('wsgi', 'asgi'), default='wsgi')
+        parser.add_argument('--ruta', default='/api/obtener_cuenta_origen/',
+                            help='Primera petición; sin credenciales responde 401 sin consultar la base de datos')
+        parser.add_argument('--repeticiones', type=int, default=5, help='Procesos por perfil; se informa la mediana')
+        parser.add_argument('--json', action='store_true', help='Imprime el resultado como JSON')
+
+    def handle(self, *args, **options):
+        resultados = {}
+        for perfil in (f"banking_system.{options['servidor']}", f"banking_system.{options['servidor']}_api"):
+            mediciones = [self.medir(perfil, options) for _ in range(options['repeticiones'])]
+            resultados[perfil] = {
+                campo: round(statistics.median(medicion[campo] for medicion in mediciones), 1)
+                for campo in ('proceso_ms', 'carga_ms', 'primera_peticion_ms', 'modulos', 'memoria_mb')
+            }
+            resultados[perfil]['status'] = mediciones[0]['status']
+
+        if options['json']:
+            self.stdout.write(json.dumps(resultados, indent=2))
+            return
+        for perfil, medicion in resultados.items():
+            self.stdout.write(f"{perfil:<28} proceso {medicion['proceso_ms']:>7} ms  carga {medicion['carga_ms']:>7} ms  "
+                              f"primera petición {medicion['primera_peticion_ms']:>6} ms ({medicion['status']})  "
+                              f"{medicion['modulos']:>5.0f} módulos  {medicion['memoria_mb']:>6} MB")
+
+    def medir(self, perfil, options):
+        # Sin DJANGO_SETTINGS_MODULE: cada módulo de entrada elige su perfil, como en el servidor
+        entorno = {clave: valor for clave, valor in os.environ.items() if clave != 'DJANGO_SETTINGS_MODULE'}
+        entorno['PYTHONPATH'] = os.pathsep.join(filter(None, [str(settings.BASE_DIR), entorno.get('PYTHONPATH')]))
+        inicio = time.perf_counter()
+        proceso = subprocess.run([sys.executable, '-c', HIJO, perfil, options['servidor'], options['ruta']],
+                                 capture_output=True, text=True, env=entorno, cwd=settings.BASE_DIR)
+        duracion = time.perf_counter() - inicio
+        if proceso.returncode:
+            raise CommandError(f'{perfil} no arrancó:\n{proceso.stderr}')
+        # proceso_ms incluye el arranque del intérprete
+        return {**json.loads(proceso.stdout.strip().splitlines()[-1]), 'proceso_ms': duracion * 1000}
@@ -0,0 +1,97 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date, timedelta
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Max, Min, Sum
+from django.utils import timezone
+
+from accounts import estados
+from accounts.models import CuentaBancaria, LoteEstadoCuenta
+
+
+def _iniciar_proceso():
+    django.setup()  # Con el método 'spawn' el proceso hijo empieza sin Django configurado
+
+
+class Command(BaseCommand):
+    help = ('Genera los estados de cuenta de un periodo: reparte las cuentas en rangos de ids, cada proceso '
+            'escribe un archivo comprimido por rango y los rangos terminados quedan registrados, de modo que '
+            'una ejecución interrumpida se reanuda donde quedó')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--desde', type=date.fromisoformat, default=None,
+                            help='Primer día (AAAA-MM-DD); por defecto el primero del mes anterior')
+        parser.add_argument('--hasta', type=date.fromisoformat, default=None,
+                            help='Último día (AAAA-MM-DD); por defecto el último del mes anterior')
+        parser.add_argument('--formato', choices=estados.FORMATOS, default='csv')
+        parser.add_argument('--directorio', default=None, help='Por defecto ESTADOS_CUENTA["DIRECTORIO"]')
+        parser.add_argument('--procesos', type=int, default=None, help='0 genera todo en este proceso')
+        parser.add_argument('--lote', type=int, default=None, help='Ids de cuenta por rango')
+        parser.add_argument('--reiniciar', action='store_true',
+                            help='Descarta los rangos ya generados del periodo y empieza de nuevo')
+
+    def handle(self, *args, **options):
+        configuracion = settings.ESTADOS_CUENTA
+        procesos = configuracion['PROCESOS'] if options['procesos'] is None else options['procesos']
+        lote = options['lote'] or configuracion['LOTE']
+        hoy = timezone.localdate()
+        hasta = options['hasta'] or hoy.replace(day=1) - timedelta(days=1)
+        desde = options['desde'] or hasta.replace(day=1)
+        # Hoy todavía recibe transferencias: el estado cambiaría después de escrito
+        if hasta >= hoy:
+            raise CommandError('Solo se pueden generar estados de días anteriores a hoy')
+        if desde > hasta:
+            raise CommandError('La fecha desde no puede ser posterior a hasta')
+
+        directorio = os.path.join(options['directorio'] or configuracion['DIRECTORIO'], f'{desde}_{hasta}')
+        os.makedirs(directorio, exist_ok=True)
+        puntos = LoteEstadoCuenta.objects.filter(desde=desde, hasta=hasta)
+        if options['reiniciar']:
+            puntos.delete()
+        hechos = set(puntos.values_list('cuenta_desde', 'cuenta_hasta'))
+        if any(fin - inicio != lote for inicio, fin in hechos):
+            raise CommandError('El periodo se empezó con otro --lote; use el mismo o --reiniciar')
+
+        ids = CuentaBancaria.objects.aggregate(minimo=Min('id'), maximo=Max('id'))
+        if ids['minimo'] is None:
+            self.stdout.write('No hay cuentas')
+            return
+        pendientes = [rango for rango in estados.rangos(ids['minimo'], ids['maximo'], lote) if rango not in hechos]
+        self.stdout.write(f'{len(hechos)} rangos ya generados, {len(pendientes)} pendientes')
+
+        tareas = [(inicio, fin, desde, hasta, os.path.join(directorio, estados.nombre_archivo(inicio, fin,
+                                                                                            options['formato'])),
+                   options['formato'], settings.HISTORIAL_CHUNK) for inicio, fin in pendientes]
+        fallidos = []
+        if procesos <= 0:
+            for tarea in tareas:
+                self.registrar(tarea, estados.generar(*tarea))
+        else:
+            connections.close_all()  # Los procesos hijos no deben heredar conexiones abiertas
+            with ProcessPoolExecutor(max_workers=procesos, initializer=_iniciar_proceso) as pool:
+                futuros = {pool.submit(estados.generar, *tarea): tarea for tarea in tareas}
+                for futuro in as_completed(futuros):
+                    tarea = futuros[futuro]
+                    try:
+                        self.registrar(tarea, futuro.result())
+                    except Exception as error:
+                        fallidos.append(tarea)
+                        self.stderr.write(f'Rango {tarea[0]}-{tarea[1]}: {error}')
+
+        if fallidos:
+            raise CommandError(f'{len(fallidos)} rangos fallaron; vuelva a ejecutar el comando para reintentarlos')
+        total = puntos.aggregate(cuentas=Sum('cuentas'), movimientos=Sum('movimientos'))
+        self.stdout.write(self.style.SUCCESS(
+            f"{total['cuentas'] or 0} estados con {total['movimientos'] or 0} movimientos en {directorio}"))
+
+    def registrar(self, tarea, resultado):
+        # El punto de control se escribe después de renombrar el archivo: un rango registrado está completo
+        inicio, fin, desde, hasta, ruta = tarea[:5]
+        cuentas, movimientos = resultado
+        LoteEstadoCuenta.objects.create(desde=desde, hasta=hasta, cuenta_desde=inicio, cuenta_hasta=fin,
+                                        archivo=ruta, cuentas=cuentas, movimientos=movimientos)
+        self.stdout.write(f'Rango {inicio}-{fin}: {cuentas} cuentas, {movimientos} movimientos')
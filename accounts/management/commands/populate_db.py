@@ -0,0 +1,241 @@
+import csv
+import io
+import random
+import time
+from datetime import timedelta
+from decimal import Decimal
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import F, Max
+from django.utils import timezone
+
+from accounts.models import CargaDatos, CuentaBancaria, Contacto, Transferencia
+
+# Opciones que determinan las filas generadas: una carga interrumpida se reanuda solo si coinciden
+PARAMETROS = ('usuarios', 'cuentas_por_usuario', 'contactos_por_usuario', 'transferencias', 'semilla', 'dias',
+              'prefijo')
+
+# Números de cuenta de 10 dígitos: (índice * MULTIPLICADOR) mod ESPACIO es una permutación del espacio
+# porque el multiplicador es coprimo con él, así que dos índices distintos nunca dan el mismo número.
+ESPACIO = 9_000_000_000
+MULTIPLICADOR = 2_654_435_761
+TIPOS = ('Ahorro', 'Corriente')
+
+
+def numero_de_cuenta(indice):
+    return str(1_000_000_000 + (indice * MULTIPLICADOR) % ESPACIO)
+
+
+def _lotes(filas, tamano):
+    filas = iter(filas)
+    while lote := list(islice(filas, tamano)):
+        yield lote
+
+
+class _FlujoCopy(io.TextIOBase):
+    # Archivo de solo lectura que genera las líneas de COPY bajo demanda: la carga no guarda las filas en memoria
+    def __init__(self, filas):
+        self.filas = iter(filas)
+        self.pendiente = ''
+        self.linea = io.StringIO()
+        self.escritor = csv.writer(self.linea, lineterminator='\n')
+
+    def readable(self):
+        return True
+
+    def read(self, tamano=-1):
+        while tamano < 0 or len(self.pendiente) < tamano:
+            fila = next(self.filas, None)
+            if fila is None:
+                break
+            self.escritor.writerow(fila)
+            self.pendiente += self.linea.getvalue()
+            self.linea.seek(0)
+            self.linea.truncate()
+        if tamano < 0:
+            tamano = len(self.pendiente)
+        datos, self.pendiente = self.pendiente[:tamano], self.pendiente[tamano:]
+        return datos
+
+
+class Command(BaseCommand):
+    help = ('Genera datos de prueba por lotes (usuarios, cuentas, contactos y transferencias) con memoria constante, '
+            'apto para millones de filas')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--usuarios', type=int, default=5)
+        parser.add_argument('--cuentas-por-usuario', type=int, default=1)
+        parser.add_argument('--contactos-por-usuario', type=int, default=4)
+        parser.add_argument('--transferencias', type=int, default=10)
+        parser.add_argument('--semilla', type=int, default=None, help='Semilla para generar los mismos datos')
+        parser.add_argument('--dias', type=int, default=365,
+                            help='Las transferencias se reparten en los últimos N días')
+        parser.add_argument('--lote', type=int, default=5000,
+                            help='Filas por lote; cada lote se confirma en su propia transacción')
+        parser.add_argument('--password', default='password.3', help='Contraseña de todos los usuarios')
+        parser.add_argument('--prefijo', default='usuario', help='Prefijo de los nombres de usuario')
+        parser.add_argument('--copy', action='store_true', help='(PostgreSQL) Carga las filas con COPY')
+        parser.add_argument('--reiniciar', action='store_true',
+                            help='Descarta una carga interrumpida (sus filas quedan) y empieza una nueva')
+
+    def handle(self, *args, **options):
+        if options['copy'] and connection.vendor != 'postgresql':
+            raise CommandError('--copy solo está disponible en PostgreSQL')
+        if options['usuarios'] < 1 or options['cuentas_por_usuario'] < 1:
+            raise CommandError('Se necesita al menos un usuario con una cuenta')
+        cuentas_totales = options['usuarios'] * options['cuentas_por_usuario']
+        if options['transferencias'] and cuentas_totales < 2:
+            raise CommandError('Las transferencias necesitan al menos dos cuentas')
+
+        self.opciones = options
+        self.cargar = self.cargar_copy if options['copy'] else self.cargar_bulk
+        self.cuentas_totales = cuentas_totales
+        self.carga = self.carga_en_curso(options)
+
+        inicio = time.monotonic()
+        self.cargar('usuarios', User, ('id', 'username', 'email', 'password', 'is_staff', 'is_superuser',
+                                       'is_active', 'first_name', 'last_name', 'date_joined'), self.filas_usuarios)
+        self.cargar('cuentas', CuentaBancaria, ('id', 'numero', 'tipo', 'saldo', 'usuario_id', 'fracciones'),
+                    self.filas_cuentas)
+        self.cargar('contactos', Contacto, ('usuario_id', 'cuenta_bancaria_id', 'numero', 'nombre'),
+                    self.filas_contactos)
+        self.cargar('transferencias', Transferencia, ('cuenta_origen_id', 'cuenta_destino_id', 'monto', 'motivo',
+                                                      'fecha'), self.filas_transferencias)
+        with transaction.atomic():
+            self.reiniciar_secuencias()
+            CargaDatos.objects.filter(pk=self.carga.pk).update(terminada=True)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{options['usuarios']} usuarios, {cuentas_totales} cuentas y {options['transferencias']} "
+            f'transferencias creadas en {time.monotonic() - inicio:.1f} s. '
+            'Ejecuta reconcile_ledger --abrir para abrir las cuentas en el libro mayor.'
+        ))
+
+    def carga_en_curso(self, options):
+        # Reanuda la carga interrumpida o empieza una nueva. Los ids se asignan al empezar, a continuación de los
+        # existentes: cada fila se genera sin consultar las anteriores y las relaciones se calculan (cuenta j
+        # pertenece al usuario j // cuentas_por_usuario).
+        parametros = {clave: options[clave] for clave in PARAMETROS}
+        pendientes = CargaDatos.objects.filter(terminada=False)
+        if options['reiniciar']:
+            pendientes.delete()
+        carga = pendientes.order_by('-id').first()
+        if carga is not None:
+            if carga.parametros != parametros:
+                raise CommandError('Hay una carga interrumpida con otras opciones; repítela con las mismas o usa '
+                                   '--reiniciar')
+            self.stdout.write(f'Reanudando la carga desde el usuario {carga.primer_usuario}')
+            return carga
+        return CargaDatos.objects.create(
+            parametros=parametros,
+            semilla=random.SystemRandom().randrange(2 ** 62) if options['semilla'] is None else options['semilla'],
+            referencia=timezone.now(),
+            primer_usuario=(User.objects.aggregate(m=Max('id'))['m'] or 0) + 1,
+            primera_cuenta=(CuentaBancaria.objects.aggregate(m=Max('id'))['m'] or 0) + 1,
+        )
+
+    def aleatorio(self, tabla):
+        # Un generador por tabla: al reanudar, las filas de una tabla se regeneran sin recorrer las anteriores
+        return random.Random(f'{self.carga.semilla}:{tabla}')
+
+    def filas_usuarios(self):
+        # Un solo hash para todos: calcularlo por usuario haría que la carga dure horas
+        password = make_password(self.opciones['password'])
+        prefijo = self.opciones['prefijo']
+        for i in range(self.opciones['usuarios']):
+            usuario_id = self.carga.primer_usuario + i
+            yield (usuario_id, f'{prefijo}{usuario_id}', f'{prefijo}{usuario_id}@ejemplo.com', password,
+                   True, False, True, '', '', self.carga.referencia)
+
+    def filas_cuentas(self):
+        por_usuario = self.opciones['cuentas_por_usuario']
+        aleatorio = self.aleatorio('cuentas')
+        for j in range(self.cuentas_totales):
+            cuenta_id = self.carga.primera_cuenta + j
+            saldo = Decimal(aleatorio.randrange(100000, 500000)) / 100  # Saldo entre 1000 y 5000
+            yield (cuenta_id, numero_de_cuenta(cuenta_id), aleatorio.choice(TIPOS), saldo,
+                   self.carga.primer_usuario + j // por_usuario, 0)
+
+    def filas_contactos(self):
+        # Contactos al azar entre las cuentas de otros usuarios, sin repetir: O(usuarios × contactos)
+        por_usuario = self.opciones['cuentas_por_usuario']
+        prefijo = self.opciones['prefijo']
+        cantidad = min(self.opciones['contactos_por_usuario'], self.cuentas_totales - por_usuario)
+        aleatorio = self.aleatorio('contactos')
+        primer_usuario, primera_cuenta = self.carga.primer_usuario, self.carga.primera_cuenta
+        for i in range(self.opciones['usuarios']):
+            propias = range(i * por_usuario, (i + 1) * por_usuario)
+            elegidas = set()
+            while len(elegidas) < cantidad:
+                j = aleatorio.randrange(self.cuentas_totales)
+                if j not in propias:
+                    elegidas.add(j)
+            for j in sorted(elegidas):
+                cuenta_id = primera_cuenta + j
+                yield (primer_usuario + i, cuenta_id, numero_de_cuenta(cuenta_id),
+                       f'{prefijo}{primer_usuario + j // por_usuario}')
+
+    def filas_transferencias(self):
+        segundos = self.opciones['dias'] * 86400
+        aleatorio = self.aleatorio('transferencias')
+        primera_cuenta = self.carga.primera_cuenta
+        for _ in range(self.opciones['transferencias']):
+            origen = aleatorio.randrange(self.cuentas_totales)
+            destino = aleatorio.randrange(self.cuentas_totales - 1)
+            destino += destino >= origen  # Nunca la misma cuenta
+            monto = Decimal(aleatorio.randrange(5000, 50000)) / 100  # Monto entre 50 y 500
+            fecha = self.carga.referencia - timedelta(seconds=aleatorio.randrange(segundos or 1))
+            yield (primera_cuenta + origen, primera_cuenta + destino, monto, 'Pago de servicios', fecha)
+
+    def lotes_pendientes(self, tabla, generar):
+        # Lotes de `tabla` aún no confirmados: las filas ya cargadas se regeneran y se saltan sin tocar la base
+        hechas = getattr(self.carga, tabla)
+        return _lotes(islice(generar(), hechas, None), self.opciones['lote']), hechas
+
+    def confirmar(self, tabla, cantidad):
+        # Dentro de la transacción del lote: el avance se guarda en el mismo commit que las filas
+        CargaDatos.objects.filter(pk=self.carga.pk).update(**{tabla: F(tabla) + cantidad})
+
+    def cargar_bulk(self, tabla, modelo, columnas, generar):
+        # INSERT de varias filas con los valores preparados por cada campo, sin pre_save: la fecha de las
+        # transferencias (auto_now_add) se guarda tal como se generó
+        campos = [modelo._meta.get_field(columna) for columna in columnas]
+        por_sentencia = max(1, connection.ops.bulk_batch_size(campos, self.opciones['lote']))
+        prefijo = f'INSERT INTO {connection.ops.quote_name(modelo._meta.db_table)} ' \
+                  f"({', '.join(connection.ops.quote_name(campo.column) for campo in campos)}) VALUES "
+        grupo = f"({', '.join(['%s'] * len(campos))})"
+        lotes, total = self.lotes_pendientes(tabla, generar)
+        for lote in lotes:
+            with transaction.atomic(), connection.cursor() as cursor:
+                for parte in _lotes(lote, por_sentencia):
+                    cursor.execute(prefijo + ', '.join([grupo] * len(parte)),
+                                   [campo.get_db_prep_save(valor, connection)
+                                    for fila in parte for campo, valor in zip(campos, fila)])
+                self.confirmar(tabla, len(lote))
+            total += len(lote)
+        self.stdout.write(f'{modelo._meta.verbose_name_plural}: {total}')
+
+    def cargar_copy(self, tabla, modelo, columnas, generar):
+        # Un COPY por lote, cada uno en su transacción: COPY tampoco pasa por pre_save
+        nombre = modelo._meta.db_table
+        campos = ', '.join(modelo._meta.get_field(columna).column for columna in columnas)
+        lotes, total = self.lotes_pendientes(tabla, generar)
+        for lote in lotes:
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.cursor.copy_expert(f'COPY {nombre} ({campos}) FROM STDIN WITH (FORMAT csv)', _FlujoCopy(lote),
+                                          size=1 << 20)
+                self.confirmar(tabla, len(lote))
+            total += len(lote)
+        self.stdout.write(f'{modelo._meta.verbose_name_plural}: {total}')
+
+    def reiniciar_secuencias(self):
+        # Con ids explícitos las secuencias de PostgreSQL no avanzan; el próximo INSERT normal chocaría
+        sentencias = connection.ops.sequence_reset_sql(no_style(), [User, CuentaBancaria, Contacto, Transferencia])
+        with connection.cursor() as cursor:
+            for sentencia in sentencias:
+                cursor.execute(sentencia)
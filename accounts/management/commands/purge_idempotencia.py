@@ -0,0 +1,26 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from accounts.models import ClaveIdempotencia
+
+
+class Command(BaseCommand):
+    help = 'Elimina por lotes las claves de idempotencia vencidas'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=5000, help='Filas eliminadas por transacción')
+
+    def handle(self, *args, **options):
+        limite = timezone.now() - timedelta(seconds=settings.IDEMPOTENCIA_TTL)
+        total = 0
+        while True:
+            ids = list(ClaveIdempotencia.objects.filter(creada_en__lt=limite).order_by('id')
+                       .values_list('id', flat=True)[:options['lote']])
+            if not ids:
+                break
+            eliminadas, _ = ClaveIdempotencia.objects.filter(id__in=ids).delete()
+            total += eliminadas
+        self.stdout.write(self.style.SUCCESS(f'{total} claves de idempotencia eliminadas'))
@@ -0,0 +1,129 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from accounts.models import Token
+
+TABLA = Token._meta.db_table
+# Índices de Token.Meta que particionar() recrea en la tabla nueva (obtener_tokens_cliente pagina con
+# token_cliente_generado_idx)
+INDICES = {indice.name: ', '.join(Token._meta.get_field(campo).column for campo in indice.fields)
+           for indice in Token._meta.indexes}
+
+
+class Command(BaseCommand):
+    help = 'Elimina por lotes los tokens más antiguos que la ventana de retención'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dias', type=int, default=settings.TOKENS_RETENCION_DIAS,
+                            help='Días de retención de los tokens')
+        parser.add_argument('--lote', type=int, default=5000, help='Filas eliminadas por transacción')
+        parser.add_argument('--pausa', type=float, default=0,
+                            help='Segundos de espera entre lotes para no saturar la base de datos')
+        parser.add_argument('--particionar', action='store_true',
+                            help='(PostgreSQL) Convierte la tabla de tokens en una tabla particionada por día')
+        parser.add_argument('--dias-adelante', type=int, default=7,
+                            help='(PostgreSQL) Particiones futuras que deben existir')
+
+    def handle(self, *args, **options):
+        limite = timezone.now() - timedelta(days=options['dias'])
+
+        if options['particionar']:
+            if connection.vendor != 'postgresql':
+                raise CommandError('El particionamiento solo está disponible en PostgreSQL')
+            if not self.esta_particionada():
+                self.particionar(options['dias_adelante'])
+
+        if self.esta_particionada():
+            self.mantener_particiones(limite, options['dias_adelante'])
+        # En una tabla particionada solo quedan por borrar las filas antiguas de la partición por defecto
+        self.eliminar_por_lotes(limite, options['lote'], options['pausa'])
+
+    def eliminar_por_lotes(self, limite, lote, pausa):
+        # Lotes pequeños por id: cada DELETE es una transacción corta que no bloquea la tabla
+        total = 0
+        while True:
+            ids = list(Token.objects.filter(generado_en__lt=limite).order_by('id').values_list('id', flat=True)[:lote])
+            if not ids:
+                break
+            eliminados, _ = Token.objects.filter(id__in=ids).delete()
+            total += eliminados
+            if pausa:
+                time.sleep(pausa)
+        self.stdout.write(self.style.SUCCESS(f'{total} tokens eliminados'))
+
+    def esta_particionada(self):
+        if connection.vendor != 'postgresql':
+            return False
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1 FROM pg_partitioned_table WHERE partrelid = %s::regclass', [TABLA])
+            return cursor.fetchone() is not None
+
+    @staticmethod
+    def nombre_particion(dia):
+        return f'{TABLA}_{dia:%Y%m%d}'
+
+    def crear_particion(self, cursor, dia):
+        cursor.execute(
+            f'CREATE TABLE IF NOT EXISTS {self.nombre_particion(dia)} PARTITION OF {TABLA} '
+            f'FOR VALUES FROM (%s) TO (%s)', [dia.isoformat(), (dia + timedelta(days=1)).isoformat()]
+        )
+
+    def mantener_particiones(self, limite, dias_adelante):
+        # Con particiones la retención es un DROP TABLE por día: no genera filas muertas ni VACUUM.
+        # Debe ejecutarse al menos una vez cada `dias_adelante` días para que siempre exista la partición del día.
+        hoy = timezone.now().date()
+        with connection.cursor() as cursor:
+            for desplazamiento in range(dias_adelante + 1):
+                self.crear_particion(cursor, hoy + timedelta(days=desplazamiento))
+
+            cursor.execute(
+                "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+                "WHERE i.inhparent = %s::regclass", [TABLA]
+            )
+            eliminadas = [nombre for (nombre,) in cursor.fetchall()
+                          if nombre[-8:].isdigit() and nombre < self.nombre_particion(limite.date())]
+            for nombre in eliminadas:
+                cursor.execute(f'DROP TABLE {nombre}')
+        self.stdout.write(self.style.SUCCESS(f'{len(eliminadas)} particiones eliminadas'))
+
+    @transaction.atomic
+    def particionar(self, dias_adelante):
+        # Conversión única: la clave primaria pasa a (id, generado_en) porque PostgreSQL exige incluir la clave de partición
+        anterior = f'{TABLA}_anterior'
+        with connection.cursor() as cursor:
+            cursor.execute(f'LOCK TABLE {TABLA} IN ACCESS EXCLUSIVE MODE')
+            cursor.execute(f'ALTER TABLE {TABLA} RENAME TO {anterior}')
+            for indice in INDICES:
+                cursor.execute(f'ALTER INDEX {indice} RENAME TO {indice}_anterior')
+            cursor.execute(f'CREATE SEQUENCE IF NOT EXISTS {TABLA}_particionada_id_seq')
+            cursor.execute(
+                f'CREATE TABLE {TABLA} ('
+                f"  id bigint NOT NULL DEFAULT nextval('{TABLA}_particionada_id_seq'),"
+                f'  token varchar(6) NOT NULL,'
+                f'  generado_en timestamp with time zone NOT NULL,'
+                f'  usado_en timestamp with time zone NULL,'
+                f'  es_valido boolean NOT NULL,'
+                f'  cliente_id integer NOT NULL REFERENCES auth_user (id) DEFERRABLE INITIALLY DEFERRED,'
+                f'  PRIMARY KEY (id, generado_en)'
+                f') PARTITION BY RANGE (generado_en)'
+            )
+            cursor.execute(f'ALTER SEQUENCE {TABLA}_particionada_id_seq OWNED BY {TABLA}.id')
+            for indice, columnas in INDICES.items():
+                cursor.execute(f'CREATE INDEX {indice} ON {TABLA} ({columnas})')
+            # Las filas anteriores a hoy caen en la partición por defecto y se purgan por lotes
+            cursor.execute(f'CREATE TABLE {TABLA}_historico PARTITION OF {TABLA} DEFAULT')
+            hoy = timezone.now().date()
+            for desplazamiento in range(dias_adelante + 1):
+                self.crear_particion(cursor, hoy + timedelta(days=desplazamiento))
+
+            cursor.execute(f'INSERT INTO {TABLA} SELECT id, token, generado_en, usado_en, es_valido, cliente_id '
+                           f'FROM {anterior}')
+            cursor.execute(f"SELECT setval('{TABLA}_particionada_id_seq', COALESCE(MAX(id), 0) + 1, false) "
+                           f'FROM {TABLA}')
+            cursor.execute(f'DROP TABLE {anterior}')
+        self.stdout.write(self.style.SUCCESS('Tabla de tokens particionada por generado_en'))
@@ -0,0 +1,49 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from accounts import resumenes
+from accounts.models import CuentaBancaria, Transferencia
+
+
+class Command(BaseCommand):
+    help = ('Recalcula los resúmenes diarios desde las transferencias, por bloques de ids de cuenta. '
+            'Sirve para cargar el historial previo o corregir resúmenes; las transferencias nuevas ya los '
+            'actualizan al confirmarse')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--desde', type=date.fromisoformat, default=None,
+                            help='Primer día (AAAA-MM-DD); por defecto el de la transferencia más antigua')
+        parser.add_argument('--hasta', type=date.fromisoformat, default=None,
+                            help='Último día (AAAA-MM-DD); por defecto ayer')
+        parser.add_argument('--lote', type=int, default=5000, help='Ids de cuenta recalculados por transacción')
+
+    def handle(self, *args, **options):
+        hoy = timezone.localdate()
+        hasta = options['hasta'] or hoy - timedelta(days=1)
+        # Hoy lo escriben las transferencias en curso: recalcularlo pisaría sus incrementos
+        if hasta >= hoy:
+            raise CommandError('Solo se pueden recalcular días anteriores a hoy')
+        desde = options['desde']
+        if desde is None:
+            primera = Transferencia.objects.order_by('fecha').values_list('fecha', flat=True).first()
+            if primera is None:
+                self.stdout.write('No hay transferencias')
+                return
+            desde = timezone.localdate(primera)
+
+        ids = CuentaBancaria.objects.aggregate(minimo=Min('id'), maximo=Max('id'))
+        if ids['minimo'] is None:
+            self.stdout.write('No hay cuentas')
+            return
+
+        # Por bloque de cuentas y no por día: cada bloque recorre su historial del periodo una sola vez
+        filas = 0
+        for inicio in range(ids['minimo'], ids['maximo'] + 1, options['lote']):
+            with transaction.atomic():
+                filas += resumenes.reconstruir(desde, hasta, inicio, inicio + options['lote'])
+
+        self.stdout.write(self.style.SUCCESS(f'{filas} resúmenes recalculados entre {desde} y {hasta}'))
@@ -0,0 +1,83 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from accounts import fracciones, libro
+from accounts.models import CuentaBancaria, MovimientoLibro, CorteSaldo
+
+
+class Command(BaseCommand):
+    help = 'Verifica el saldo de cada cuenta contra el libro mayor en una pasada por bloques de ids'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=2000, help='Cuentas verificadas por consulta')
+        parser.add_argument('--corte', action='store_true',
+                            help='Guarda un corte de saldo por cuenta para acotar las próximas verificaciones')
+        parser.add_argument('--margen', type=int, default=300,
+                            help='Segundos hacia atrás desde ahora en que se fija el corte, para no dejar fuera '
+                                 'transacciones que aún no confirman')
+        parser.add_argument('--abrir', action='store_true',
+                            help='Crea el asiento de apertura de las cuentas que no tienen movimientos ni cortes (las '
+                                 'cargadas sin post_save, como las de populate_db)')
+
+    def handle(self, *args, **options):
+        nuevo_corte = timezone.now() - timedelta(seconds=options['margen']) if options['corte'] else None
+
+        if options['abrir']:
+            self.abrir_cuentas(options['lote'])
+
+        # Saldo según el libro = último corte de la cuenta + neto posterior. Todo se lee en una sola sentencia
+        # por bloque para que saldo y libro salgan de la misma instantánea de la base de datos.
+        consulta = CuentaBancaria.objects.annotate(
+            en_fracciones=fracciones.en_fracciones(),
+            fecha_corte=Coalesce(libro.corte_vigente('fecha', nuevo_corte), libro.SIN_CORTE),
+            base=Coalesce(libro.corte_vigente('saldo', nuevo_corte), libro.CERO),
+            neto=libro.neto_entre(OuterRef('fecha_corte'), None),
+        )
+        if nuevo_corte is not None:
+            consulta = consulta.annotate(neto_corte=libro.neto_entre(OuterRef('fecha_corte'), nuevo_corte))
+
+        revisadas = diferencias = 0
+        desde_id = 0
+        while True:
+            bloque = list(consulta.filter(id__gt=desde_id).order_by('id')[:options['lote']])
+            if not bloque:
+                break
+            desde_id = bloque[-1].id
+
+            for cuenta in bloque:
+                esperado = cuenta.base + cuenta.neto
+                saldo = fracciones.total(cuenta.saldo, cuenta.en_fracciones)
+                if esperado != saldo:
+                    diferencias += 1
+                    self.stdout.write(f'{cuenta.numero}: saldo {saldo:.2f}, libro {esperado:.2f}')
+            revisadas += len(bloque)
+
+            if nuevo_corte is not None:
+                CorteSaldo.objects.bulk_create([
+                    CorteSaldo(cuenta_id=cuenta.id, fecha=nuevo_corte, saldo=cuenta.base + cuenta.neto_corte)
+                    for cuenta in bloque
+                ])
+
+        estilo = self.style.SUCCESS if not diferencias else self.style.ERROR
+        self.stdout.write(estilo(f'{revisadas} cuentas revisadas, {diferencias} con diferencias'))
+
+    def abrir_cuentas(self, lote):
+        sin_libro = CuentaBancaria.objects.filter(
+            ~Exists(MovimientoLibro.objects.filter(cuenta=OuterRef('pk'))),
+            ~Exists(CorteSaldo.objects.filter(cuenta=OuterRef('pk'))),
+        )
+        desde_id = 0
+        while True:
+            with transaction.atomic():
+                # Bloqueadas para que ninguna transferencia cambie el saldo entre la lectura y la apertura
+                cuentas = list(sin_libro.filter(id__gt=desde_id).select_for_update().order_by('id')
+                               .values_list('id', 'saldo', fracciones.en_fracciones())[:lote])
+                if not cuentas:
+                    break
+                libro.abrir([(cuenta_id, fracciones.total(saldo, extra)) for cuenta_id, saldo, extra in cuentas])
+            desde_id = cuentas[-1][0]
@@ -0,0 +1,318 @@
+import asyncio
+import json
+import multiprocessing
+import queue
+import time
+import urllib.error
+import urllib.request
+import zlib
+from collections import Counter, defaultdict
+from decimal import Decimal
+from urllib.parse import urlencode
+
+import django
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Sum
+from django.test import AsyncClient, Client
+from django.test.utils import setup_test_environment
+
+from accounts.medicion import resumen
+from accounts.models import CuentaBancaria, FraccionSaldo, Transferencia
+from accounts.serializers import CustomTokenObtainPairSerializer
+
+# Cada línea del archivo es una llamada a la API:
+#   {"usuario": "usuario12", "metodo": "POST", "ruta": "/api/transferencia/", "datos": {...}}
+# `usuario` es el username con el que se firma el JWT (se omite en /api/login/, que lleva sus credenciales).
+# Si una transferencia no trae "token" se usa el último que devolvió generarToken a ese usuario.
+
+
+def _clave_usuario(llamada):
+    # Las llamadas de un mismo usuario van siempre al mismo proceso y se ejecutan en el orden del archivo
+    datos = llamada.get('datos') or {}
+    return str(llamada.get('usuario') or datos.get('username') or '')
+
+
+def _particion(llamada, procesos):
+    return zlib.crc32(_clave_usuario(llamada).encode()) % procesos
+
+
+class _Conductor:
+    # Ejecuta llamadas con el handler WSGI o ASGI en el mismo proceso, o contra un servidor HTTP
+    def __init__(self, modo, url):
+        self.modo = modo
+        self.url = url
+        self.jwt = {}
+        self.tokens = {}
+        if modo == 'wsgi':
+            self.cliente = Client()
+        elif modo == 'asgi':
+            self.cliente = AsyncClient()
+            self.loop = asyncio.new_event_loop()
+
+    def cabeceras(self, username):
+        if not username:
+            return {}
+        if username not in self.jwt:
+            usuario = User.objects.get(username=username)
+            self.jwt[username] = f'Bearer {CustomTokenObtainPairSerializer.get_token(usuario).access_token}'
+        return {'Authorization': self.jwt[username]}
+
+    def ejecutar(self, llamada):
+        # Devuelve (status, cuerpo JSON o None)
+        metodo = llamada.get('metodo', 'GET').upper()
+        ruta = llamada['ruta']
+        datos = dict(llamada.get('datos') or {})
+        username = llamada.get('usuario')
+        if 'transferencia' in ruta and 'token' not in datos and username in self.tokens:
+            datos['token'] = self.tokens[username]
+        cabeceras = self.cabeceras(username)
+
+        if self.modo == 'http':
+            status, cuerpo = self.http(metodo, ruta, datos, cabeceras)
+        else:
+            if metodo == 'GET':
+                ruta, cuerpo_peticion = (f'{ruta}?{urlencode(datos)}' if datos else ruta), ''
+            else:
+                cuerpo_peticion = json.dumps(datos)
+            peticion = self.cliente.generic(metodo, ruta, cuerpo_peticion, content_type='application/json',
+                                            headers=cabeceras)
+            respuesta = self.loop.run_until_complete(peticion) if self.modo == 'asgi' else peticion
+            status, cuerpo = respuesta.status_code, respuesta.content
+
+        try:
+            cuerpo = json.loads(cuerpo) if cuerpo else None
+        except ValueError:
+            cuerpo = None
+        if status == 200 and ruta.rstrip('/').endswith('generarToken') and isinstance(cuerpo, dict):
+            self.tokens[username] = cuerpo.get('token')
+        return status, cuerpo
+
+    def http(self, metodo, ruta, datos, cabeceras):
+        url = self.url + ruta
+        cuerpo = None
+        if metodo == 'GET':
+            url = f'{url}?{urlencode(datos)}' if datos else url
+        else:
+            cuerpo = json.dumps(datos).encode()
+            cabeceras = {**cabeceras, 'Content-Type': 'application/json'}
+        try:
+            with urllib.request.urlopen(urllib.request.Request(url, data=cuerpo, headers=cabeceras,
+                                                               method=metodo)) as respuesta:
+                return respuesta.status, respuesta.read()
+        except urllib.error.HTTPError as error:
+            return error.code, error.read()
+
+
+def procesar(llamadas, modo, url):
+    # Ejecuta las llamadas en orden y devuelve {ruta: {'latencias': [...], 'errores': Counter}}
+    conductor = _Conductor(modo, url)
+    estadisticas = defaultdict(lambda: {'latencias': [], 'errores': Counter()})
+    for llamada in llamadas:
+        ruta = llamada.get('ruta', '?')
+        inicio = time.perf_counter()
+        try:
+            status, _ = conductor.ejecutar(llamada)
+        except Exception as error:
+            # Fallos del cliente o del transporte (conexión rechazada, usuario inexistente...)
+            estadisticas[ruta]['errores'][type(error).__name__] += 1
+            continue
+        estadisticas[ruta]['latencias'].append(time.perf_counter() - inicio)
+        if status >= 400:
+            estadisticas[ruta]['errores'][str(status)] += 1
+    return {ruta: {'latencias': valores['latencias'], 'errores': dict(valores['errores'])}
+            for ruta, valores in estadisticas.items()}
+
+
+def _entorno_de_pruebas():
+    # Admite el host 'testserver' del cliente de pruebas y no acumula connection.queries
+    try:
+        setup_test_environment(debug=False)
+    except RuntimeError:
+        pass  # Ya configurado: proceso hijo creado con fork o ejecución dentro de la suite de pruebas
+
+
+def _trabajador(numero, cola, resultados, modo, url):
+    # Siempre deja un resultado, aunque falle antes de la primera llamada: el padre no espera para siempre
+    try:
+        django.setup()  # Con el método 'spawn' el proceso hijo empieza sin Django configurado
+        _entorno_de_pruebas()
+        resultados.put((numero, procesar(iter(cola.get, None), modo, url), None))
+    except BaseException as error:
+        resultados.put((numero, None, f'{type(error).__name__}: {error}'))
+    finally:
+        connections.close_all()
+
+
+def dinero_total():
+    cuentas = CuentaBancaria.objects.aggregate(total=Sum('saldo'))['total'] or Decimal('0')
+    return cuentas + (FraccionSaldo.objects.aggregate(total=Sum('saldo'))['total'] or Decimal('0'))
+
+
+class Command(BaseCommand):
+    help = ('Reproduce un archivo JSONL de llamadas a la API (tráfico capturado) contra una copia de staging: '
+            'reparte las llamadas entre procesos manteniendo el orden por usuario y reporta throughput, '
+            'latencias, errores y los invariantes de saldos. Modifica la base de datos configurada')
+
+    def add_arguments(self, parser):
+        parser.add_argument('archivo', help='Archivo JSONL, una llamada por línea')
+        parser.add_argument('--procesos', type=int, default=4, help='0 ejecuta todo en este proceso')
+        parser.add_argument('--modo', choices=('wsgi', 'asgi', 'http'), default='wsgi',
+                            help='Handler en el mismo proceso o servidor local (http, requiere --url)')
+        parser.add_argument('--url', help='Servidor ya levantado, p. ej. http://127.0.0.1:8000')
+        parser.add_argument('--cola', type=int, default=1000, help='Llamadas pendientes por proceso')
+        parser.add_argument('--json', action='store_true', help='Imprime el resultado como JSON')
+
+    def handle(self, *args, **options):
+        if options['modo'] == 'http' and not options['url']:
+            raise CommandError('--modo http requiere --url')
+        url = (options['url'] or '').rstrip('/')
+        _entorno_de_pruebas()
+        total_antes = dinero_total()
+        transferencias_antes = Transferencia.objects.count()
+
+        self.invalidas = 0
+        inicio = time.perf_counter()
+        if options['procesos'] <= 0:
+            parciales = [procesar(self.leer(options['archivo']), options['modo'], url)]
+        else:
+            parciales = self.repartir(options, url)
+        duracion = time.perf_counter() - inicio
+
+        reporte = self.reporte(parciales, duracion)
+        reporte['invariantes'] = self.invariantes(total_antes, transferencias_antes)
+        if options['json']:
+            self.stdout.write(json.dumps(reporte, indent=2, default=str))
+        else:
+            self.imprimir(reporte)
+        if not reporte['invariantes']['ok']:
+            raise CommandError('Los saldos no cumplen los invariantes')
+
+    def leer(self, archivo):
+        # El archivo se lee línea por línea y nunca completo en memoria
+        with open(archivo, encoding='utf-8') as entrada:
+            for linea in entrada:
+                if not linea.strip():
+                    continue
+                try:
+                    llamada = json.loads(linea)
+                except ValueError:
+                    llamada = None
+                if not isinstance(llamada, dict) or 'ruta' not in llamada:
+                    self.invalidas += 1
+                    continue
+                yield llamada
+
+    def repartir(self, options, url):
+        contexto = multiprocessing.get_context()
+        resultados = contexto.Queue()
+        colas = [contexto.Queue(maxsize=options['cola']) for _ in range(options['procesos'])]
+        connections.close_all()  # Los hijos no deben heredar conexiones abiertas
+        procesos = [contexto.Process(target=_trabajador, args=(numero, cola, resultados, options['modo'], url))
+                    for numero, cola in enumerate(colas)]
+        for proceso in procesos:
+            proceso.start()
+
+        parciales, fallos = {}, {}
+        try:
+            for llamada in self.leer(options['archivo']):
+                numero = _particion(llamada, len(colas))
+                self.encolar(colas[numero], llamada, procesos[numero], resultados, parciales, fallos)
+                if fallos or not procesos[numero].is_alive():
+                    break  # Un proceso murió: el resto del archivo no se reproduce
+            for numero, cola in enumerate(colas):
+                self.encolar(cola, None, procesos[numero], resultados, parciales, fallos)
+
+            while len(parciales) + len(fallos) < len(procesos):
+                self.recibir(resultados, parciales, fallos)
+                for numero, proceso in enumerate(procesos):
+                    if numero in parciales or numero in fallos or proceso.is_alive():
+                        continue
+                    # Terminó: su resultado, si lo dejó, ya está en la cola
+                    self.recibir(resultados, parciales, fallos)
+                    if numero not in parciales and numero not in fallos:
+                        fallos[numero] = f'terminó con código {proceso.exitcode} sin resultado'
+        finally:
+            for proceso in procesos:
+                if fallos and proceso.is_alive():
+                    proceso.terminate()
+                proceso.join()
+            if fallos:
+                for cola in colas:
+                    cola.cancel_join_thread()  # Llamadas que ya nadie leerá no deben bloquear la salida
+
+        if fallos:
+            raise CommandError('\n'.join(f'El proceso {numero} falló: {error}'
+                                          for numero, error in sorted(fallos.items())))
+        return list(parciales.values())
+
+    def encolar(self, cola, llamada, proceso, resultados, parciales, fallos):
+        # Espera mientras el proceso va atrasado, pero no si terminó o algún proceso ya falló
+        while True:
+            try:
+                return cola.put(llamada, timeout=1)
+            except queue.Full:
+                self.recibir(resultados, parciales, fallos)
+                if fallos or not proceso.is_alive():
+                    return
+
+    def recibir(self, resultados, parciales, fallos, espera=0.1):
+        # Vacía la cola de resultados: {número: parcial} y {número: error}
+        while True:
+            try:
+                numero, parcial, error = resultados.get(timeout=espera)
+            except queue.Empty:
+                return
+            if error is None:
+                parciales[numero] = parcial
+            else:
+                fallos[numero] = error
+            espera = 0.01
+
+    def reporte(self, parciales, duracion):
+        latencias, errores = defaultdict(list), defaultdict(Counter)
+        for parcial in parciales:
+            for ruta, valores in parcial.items():
+                latencias[ruta] += valores['latencias']
+                errores[ruta].update(valores['errores'])
+        rutas = {}
+        for ruta in sorted(latencias.keys() | errores.keys()):
+            rutas[ruta] = resumen(latencias[ruta], duracion)
+            rutas[ruta]['errores'] = dict(errores[ruta])
+        completadas = sum(len(valores) for valores in latencias.values())
+        return {
+            'duracion_s': round(duracion, 2),
+            'llamadas_s': round(completadas / duracion, 1) if duracion else 0.0,
+            'lineas_invalidas': self.invalidas,
+            'rutas': rutas,
+            'global': resumen([latencia for valores in latencias.values() for latencia in valores], duracion),
+        }
+
+    def invariantes(self, total_antes, transferencias_antes):
+        # Las transferencias mueven dinero entre cuentas: el total no cambia y ningún saldo queda negativo
+        total_despues = dinero_total()
+        negativas = (CuentaBancaria.objects.filter(saldo__lt=0).count()
+                     + FraccionSaldo.objects.filter(saldo__lt=0).count())
+        return {
+            'ok': total_despues == total_antes and not negativas,
+            'dinero_antes': total_antes,
+            'dinero_despues': total_despues,
+            'saldos_negativos': negativas,
+            'transferencias_creadas': Transferencia.objects.count() - transferencias_antes,
+        }
+
+    def imprimir(self, reporte):
+        self.stdout.write(f"{reporte['duracion_s']} s, {reporte['llamadas_s']} llamadas/s, "
+                          f"{reporte['lineas_invalidas']} líneas inválidas")
+        for ruta, medicion in reporte['rutas'].items():
+            errores = ', '.join(f'{clase}: {n}' for clase, n in sorted(medicion['errores'].items())) or '-'
+            self.stdout.write(f"{ruta:<36} {medicion['peticiones']:>8}  p50 {medicion['p50_ms']:>8} ms  "
+                              f"p95 {medicion['p95_ms']:>8} ms  p99 {medicion['p99_ms']:>8} ms  errores {errores}")
+        invariantes = reporte['invariantes']
+        estilo = self.style.SUCCESS if invariantes['ok'] else self.style.ERROR
+        self.stdout.write(estilo(
+            f"Dinero total {invariantes['dinero_antes']} -> {invariantes['dinero_despues']}, "
+            f"{invariantes['saldos_negativos']} saldos negativos, "
+            f"{invariantes['transferencias_creadas']} transferencias creadas"))
+
@@ -0,0 +1,41 @@
+import signal
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from accounts import eventos
+
+
+class Command(BaseCommand):
+    help = ('Entrega los eventos de la bandeja de salida a sus manejadores. Se pueden ejecutar varios workers '
+            'en paralelo (PostgreSQL): cada lote se reclama con FOR UPDATE SKIP LOCKED')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hilos', type=int, default=None, help='Eventos entregados en paralelo')
+        parser.add_argument('--lote', type=int, default=None, help='Eventos reclamados por transacción')
+        parser.add_argument('--espera', type=float, default=1.0,
+                            help='Segundos entre consultas cuando no hay eventos pendientes')
+        parser.add_argument('--una-vez', action='store_true', help='Termina cuando no quedan eventos disponibles')
+
+    def handle(self, *args, **options):
+        hilos = options['hilos'] or settings.EVENTOS['HILOS']
+        lote = options['lote'] or settings.EVENTOS['LOTE']
+        self.detener = False
+        # SIGTERM termina el lote en curso antes de salir, sin dejar eventos a medio entregar
+        signal.signal(signal.SIGTERM, lambda *_: setattr(self, 'detener', True))
+
+        total = 0
+        with ThreadPoolExecutor(max_workers=hilos, thread_name_prefix='bandeja') as pool:
+            while not self.detener:
+                procesados = eventos.procesar_lote(pool, lote)
+                total += procesados
+                if procesados:
+                    continue
+                if options['una_vez']:
+                    break
+                close_old_connections()  # Respeta CONN_MAX_AGE y descarta conexiones caídas entre consultas
+                time.sleep(options['espera'])
+        self.stdout.write(self.style.SUCCESS(f'{total} eventos procesados'))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts import fracciones
+from accounts.models import CuentaBancaria
+
+
+class Command(BaseCommand):
+    help = ('Reparte el saldo de cuentas calientes (comercios, tesorería) en N fracciones para que los créditos '
+            'simultáneos no esperen por la misma fila; con --fracciones 0 las devuelve al modo normal')
+
+    def add_arguments(self, parser):
+        parser.add_argument('numeros', nargs='+', help='Números de cuenta')
+        parser.add_argument('--fracciones', type=int, required=True,
+                            help='Fracciones por cuenta; 0 consolida el saldo en la cuenta')
+
+    def handle(self, *args, **options):
+        if not 0 <= options['fracciones'] <= 1000:
+            raise CommandError('--fracciones debe estar entre 0 y 1000')
+        ids = dict(CuentaBancaria.objects.filter(numero__in=options['numeros']).values_list('numero', 'id'))
+        faltantes = [numero for numero in options['numeros'] if numero not in ids]
+        if faltantes:
+            raise CommandError(f"No existen las cuentas: {', '.join(faltantes)}")
+
+        for numero in options['numeros']:
+            anteriores = fracciones.fraccionar(ids[numero], options['fracciones'])
+            self.stdout.write(f"{numero}: {anteriores} -> {options['fracciones']} fracciones")
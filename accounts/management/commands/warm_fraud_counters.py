@@ -0,0 +1,19 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from accounts import fraude
+
+
+class Command(BaseCommand):
+    help = ('Recarga en la caché los contadores de velocidad (FRAUDE) desde las transferencias recientes. '
+            'Se ejecuta después de vaciar o reemplazar la caché, antes de recibir tráfico')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bloque', type=int, default=500, help='Cuentas escritas en la caché por set_many')
+
+    def handle(self, *args, **options):
+        if not settings.FRAUDE['REGLAS']:
+            self.stdout.write('No hay reglas configuradas en FRAUDE')
+            return
+        cuentas = fraude.reconstruir(chunk_size=settings.HISTORIAL_CHUNK, bloque=options['bloque'])
+        self.stdout.write(self.style.SUCCESS(f'Contadores recargados para {cuentas} cuentas'))
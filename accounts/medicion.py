@@ -0,0 +1,82 @@
+import math
+import time
+import tracemalloc
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+
+def percentil(valores, p):
+    # Percentil por rango más cercano sobre una lista ya ordenada
+    if not valores:
+        return 0.0
+    indice = max(0, math.ceil(p / 100 * len(valores)) - 1)
+    return valores[indice]
+
+
+def resumen(latencias, duracion):
+    # latencias en segundos; devuelve peticiones por segundo y percentiles en milisegundos
+    ordenadas = sorted(latencias)
+    return {
+        'peticiones': len(ordenadas),
+        'req_s': round(len(ordenadas) / duracion, 1) if duracion else 0.0,
+        'p50_ms': round(percentil(ordenadas, 50) * 1000, 2),
+        'p95_ms': round(percentil(ordenadas, 95) * 1000, 2),
+        'p99_ms': round(percentil(ordenadas, 99) * 1000, 2),
+    }
+
+
+def _preparada(peticion, preparar):
+    if preparar is None:
+        return peticion
+    valor = preparar()
+    return lambda: peticion(valor)
+
+
+def medir(peticion, repeticiones, muestras_memoria=20, preparar=None):
+    # Ejecuta `peticion()` (sin concurrencia) y mide latencia, consultas SQL por petición y memoria asignada.
+    # La memoria se mide aparte con tracemalloc porque su instrumentación infla la latencia.
+    # Con `preparar`, antes de cada petición se llama fuera de la medición y se mide `peticion(preparar())`.
+    latencias, consultas = [], []
+    inicio = time.perf_counter()
+    for _ in range(repeticiones):
+        llamada = _preparada(peticion, preparar)
+        with CaptureQueriesContext(connection) as contexto:
+            t0 = time.perf_counter()
+            llamada()
+            latencias.append(time.perf_counter() - t0)
+        consultas.append(len(contexto))
+    medicion = resumen(latencias, time.perf_counter() - inicio)
+
+    picos = []
+    tracemalloc.start()
+    try:
+        for _ in range(muestras_memoria):
+            llamada = _preparada(peticion, preparar)
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+            llamada()
+            picos.append(tracemalloc.get_traced_memory()[1] - base)
+    finally:
+        tracemalloc.stop()
+
+    medicion['consultas'] = max(consultas, default=0)
+    medicion['memoria_kb'] = round(percentil(sorted(picos), 50) / 1024, 1)
+    return medicion
+
+
+def comparar(resultados, base, tolerancia):
+    # Devuelve las mediciones que superan la línea base. Las consultas no admiten tolerancia: una más ya es
+    # una regresión (típicamente un N+1). Latencia y memoria varían entre corridas y sí la admiten.
+    excedidos = []
+    for escala, rutas in base.items():
+        for ruta, limite in rutas.items():
+            actual = resultados.get(escala, {}).get(ruta)
+            if actual is None:
+                continue
+            if 'consultas' in limite and actual['consultas'] > limite['consultas']:
+                excedidos.append(f"{escala} {ruta}: {actual['consultas']} consultas (base {limite['consultas']})")
+            for metrica in ('p99_ms', 'memoria_kb'):
+                if metrica in limite and actual[metrica] > limite[metrica] * (1 + tolerancia):
+                    excedidos.append(f'{escala} {ruta}: {metrica} {actual[metrica]} (base {limite[metrica]})')
+    return excedidos
@@ -0,0 +1,222 @@
+import cProfile
+import contextvars
+import json
+import logging
+import random
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.urls import Resolver404, resolve
+
+logger = logging.getLogger('accounts.metricas')
+
+# Medición de la solicitud en curso. Una variable de contexto (y no un execute_wrapper por solicitud) porque
+# las vistas async ejecutan el ORM en otro hilo vía sync_to_async, que copia el contexto pero no la conexión.
+_solicitud = contextvars.ContextVar('metricas_solicitud', default=None)
+
+
+class Medicion:
+    __slots__ = ('consultas', 'sql', 'bloqueo', 'filas')
+
+    def __init__(self):
+        self.consultas = 0
+        self.sql = 0.0
+        self.bloqueo = 0.0  # Tiempo de los SELECT ... FOR UPDATE: incluye la espera por filas bloqueadas
+        self.filas = 0
+
+
+def _medir_sql(execute, sql, params, many, context):
+    medicion = _solicitud.get()
+    if medicion is None:
+        return execute(sql, params, many, context)
+    inicio = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duracion = time.perf_counter() - inicio
+        medicion.consultas += 1
+        medicion.sql += duracion
+        if 'FOR UPDATE' in sql:
+            medicion.bloqueo += duracion
+        filas = getattr(context['cursor'], 'rowcount', -1)
+        if filas and filas > 0:
+            medicion.filas += filas
+
+
+@receiver(connection_created)
+def _instalar(connection, **kwargs):
+    # connection_created se emite en cada reconexión; el wrapper vive en el objeto de Django y no se repite
+    if _medir_sql not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_medir_sql)
+
+
+class _Registro:
+    # Acumulado por proceso; con varios workers cada uno expone sus propias series
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.vistas = defaultdict(self._nueva)
+
+    @staticmethod
+    def _nueva():
+        buckets = settings.METRICAS['BUCKETS']
+        return {'buckets': [0] * len(buckets), 'suma': 0.0, 'cuenta': 0, 'consultas': 0, 'sql': 0.0,
+                'bloqueo': 0.0, 'filas': 0, 'errores': 0}
+
+    def registrar(self, vista, duracion, status, medicion):
+        limites = settings.METRICAS['BUCKETS']
+        with self.lock:
+            serie = self.vistas[vista]
+            for i, limite in enumerate(limites):
+                if duracion <= limite:
+                    serie['buckets'][i] += 1
+            serie['suma'] += duracion
+            serie['cuenta'] += 1
+            serie['consultas'] += medicion.consultas
+            serie['sql'] += medicion.sql
+            serie['bloqueo'] += medicion.bloqueo
+            serie['filas'] += medicion.filas
+            serie['errores'] += status >= 500
+
+    def copia(self):
+        with self.lock:
+            return {vista: {**serie, 'buckets': list(serie['buckets'])} for vista, serie in self.vistas.items()}
+
+    def reiniciar(self):
+        with self.lock:
+            self.vistas.clear()
+
+
+registro = _Registro()
+
+_CONTADORES = (
+    ('banco_sql_consultas_total', 'consultas', 'Consultas SQL ejecutadas'),
+    ('banco_sql_segundos_total', 'sql', 'Tiempo en la base de datos'),
+    ('banco_bloqueo_segundos_total', 'bloqueo', 'Tiempo en SELECT ... FOR UPDATE, incluida la espera por bloqueos'),
+    ('banco_sql_filas_total', 'filas', 'Filas devueltas o modificadas según el driver'),
+    ('banco_solicitudes_error_total', 'errores', 'Respuestas 5xx'),
+)
+
+
+def texto_prometheus():
+    # Formato de exposición de texto de Prometheus 0.0.4
+    series = registro.copia()
+    limites = settings.METRICAS['BUCKETS']
+    lineas = ['# HELP banco_solicitud_segundos Latencia de las solicitudes por vista',
+              '# TYPE banco_solicitud_segundos histogram']
+    for vista, serie in sorted(series.items()):
+        for limite, cantidad in zip(limites, serie['buckets']):
+            lineas.append(f'banco_solicitud_segundos_bucket{{vista="{vista}",le="{limite}"}} {cantidad}')
+        lineas.append(f'banco_solicitud_segundos_bucket{{vista="{vista}",le="+Inf"}} {serie["cuenta"]}')
+        lineas.append(f'banco_solicitud_segundos_sum{{vista="{vista}"}} {serie["suma"]:.6f}')
+        lineas.append(f'banco_solicitud_segundos_count{{vista="{vista}"}} {serie["cuenta"]}')
+    for nombre, campo, ayuda in _CONTADORES:
+        lineas += [f'# HELP {nombre} {ayuda}', f'# TYPE {nombre} counter']
+        lineas += [f'{nombre}{{vista="{vista}"}} {serie[campo]:g}' for vista, serie in sorted(series.items())]
+    return '\n'.join(lineas) + '\n'
+
+
+def _perfilar(request):
+    # Devuelve el perfilador si esta solicitud entra en la muestra de la vista configurada. La URL aún no
+    # está resuelta al entrar al middleware; solo se resuelve aquí, y después de sortear la muestra.
+    perfil = settings.METRICAS.get('PERFIL')
+    if not perfil or random.random() >= perfil.get('MUESTREO', 0.01):
+        return None
+    try:
+        if resolve(request.path_info).url_name != perfil['VISTA']:
+            return None
+    except Resolver404:
+        return None
+    if perfil.get('MOTOR', 'cprofile') == 'pyinstrument':
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            raise ImproperlyConfigured("METRICAS['PERFIL']['MOTOR'] = 'pyinstrument' requiere instalar pyinstrument")
+        return Profiler()
+    return cProfile.Profile()
+
+
+def _guardar_perfil(perfilador, vista):
+    directorio = Path(settings.METRICAS['PERFIL'].get('DIRECTORIO', 'perfiles'))
+    directorio.mkdir(parents=True, exist_ok=True)
+    nombre = directorio / f'{vista}-{time.time_ns()}'
+    if isinstance(perfilador, cProfile.Profile):
+        perfilador.dump_stats(f'{nombre}.prof')  # Se lee con `python -m pstats` o snakeviz
+    else:
+        nombre.with_suffix('.html').write_text(perfilador.output_html())
+
+
+class MetricasMiddleware:
+    # Mide cada solicitud por nombre de URL: latencia, consultas y tiempo SQL, espera por bloqueos y filas.
+    # Debe ir primero en MIDDLEWARE para que la latencia incluya al resto de middlewares.
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.es_async = iscoroutinefunction(get_response)
+        if self.es_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.es_async:
+            return self.__acall__(request)
+        if not settings.METRICAS['ACTIVAS']:
+            return self.get_response(request)
+
+        medicion, token = self._iniciar()
+        inicio = time.perf_counter()
+        try:
+            perfilador = _perfilar(request)
+            if perfilador is None:
+                respuesta = self.get_response(request)
+            else:
+                with perfilador:
+                    respuesta = self.get_response(request)
+                _guardar_perfil(perfilador, _vista(request))
+        finally:
+            _solicitud.reset(token)
+        self._terminar(request, respuesta, time.perf_counter() - inicio, medicion)
+        return respuesta
+
+    async def __acall__(self, request):
+        # Sin perfilador: cProfile solo ve el hilo que lo activa y la vista async salta entre hilos
+        if not settings.METRICAS['ACTIVAS']:
+            return await self.get_response(request)
+        medicion, token = self._iniciar()
+        inicio = time.perf_counter()
+        try:
+            respuesta = await self.get_response(request)
+        finally:
+            _solicitud.reset(token)
+        self._terminar(request, respuesta, time.perf_counter() - inicio, medicion)
+        return respuesta
+
+    @staticmethod
+    def _iniciar():
+        medicion = Medicion()
+        return medicion, _solicitud.set(medicion)
+
+    @staticmethod
+    def _terminar(request, respuesta, duracion, medicion):
+        vista = _vista(request)
+        registro.registrar(vista, duracion, respuesta.status_code, medicion)
+        if settings.METRICAS['LOG']:
+            logger.info(json.dumps({
+                'vista': vista, 'metodo': request.method, 'status': respuesta.status_code,
+                'duracion_ms': round(duracion * 1000, 2), 'sql_consultas': medicion.consultas,
+                'sql_ms': round(medicion.sql * 1000, 2), 'bloqueo_ms': round(medicion.bloqueo * 1000, 2),
+                'filas': medicion.filas,
+            }))
+
+
+def _vista(request):
+    # Nombre de la URL y no la ruta: /api/historial/?cuenta=... no debe crear una serie por cuenta
+    coincidencia = getattr(request, 'resolver_match', None)
+    return coincidencia.url_name or coincidencia.view_name if coincidencia else 'sin_ruta'
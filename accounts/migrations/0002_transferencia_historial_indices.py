@@ -0,0 +1,21 @@
+# Generated by Django 5.1.1 on 2026-10-18 17:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transferencia',
+            index=models.Index(fields=['cuenta_origen', 'fecha', 'id'], name='transf_origen_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transferencia',
+            index=models.Index(fields=['cuenta_destino', 'fecha', 'id'], name='transf_destino_fecha_idx'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.1.1 on 2026-10-18 17:30
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_transferencia_historial_indices'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='token',
+            index=models.Index(fields=['cliente', 'es_valido', 'generado_en'], name='token_cliente_valido_idx'),
+        ),
+    ]
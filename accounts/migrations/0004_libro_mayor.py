@@ -0,0 +1,43 @@
+# Generated by Django 5.1.1 on 2026-10-18 17:38
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_token_indice_cliente'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CorteSaldo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateTimeField()),
+                ('saldo', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('cuenta', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cortes', to='accounts.cuentabancaria')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['fecha'], name='corte_fecha_idx')],
+                'constraints': [models.UniqueConstraint(fields=('cuenta', 'fecha'), name='corte_cuenta_fecha_unico')],
+            },
+        ),
+        migrations.CreateModel(
+            name='MovimientoLibro',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('D', 'Débito'), ('C', 'Crédito'), ('A', 'Apertura')], max_length=1)),
+                ('monto', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('saldo_resultante', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('fecha', models.DateTimeField(default=django.utils.timezone.now)),
+                ('cuenta', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='movimientos', to='accounts.cuentabancaria')),
+                ('transferencia', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='movimientos', to='accounts.transferencia')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['cuenta', 'fecha', 'id'], name='movimiento_cuenta_fecha_idx')],
+            },
+        ),
+    ]
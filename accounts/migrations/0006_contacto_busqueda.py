@@ -0,0 +1,68 @@
+# Generated by Django 5.1.1 on 2026-10-18 17:55
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Exists, OuterRef, Subquery
+
+INDICES_PREFIJO = (
+    ('contacto_busqueda_numero_idx', '(usuario_id, numero varchar_pattern_ops)'),
+    ('contacto_busqueda_nombre_idx', '(usuario_id, UPPER(nombre::text) text_pattern_ops)'),
+)
+
+
+def deduplicar_y_copiar(apps, schema_editor):
+    Contacto = apps.get_model('accounts', 'Contacto')
+    CuentaBancaria = apps.get_model('accounts', 'CuentaBancaria')
+    # Conserva el contacto más antiguo de cada (usuario, cuenta); un solo DELETE con subconsulta
+    Contacto.objects.filter(Exists(Contacto.objects.filter(
+        usuario=OuterRef('usuario'), cuenta_bancaria=OuterRef('cuenta_bancaria'), id__lt=OuterRef('id')
+    ))).delete()
+    cuenta = CuentaBancaria.objects.filter(pk=OuterRef('cuenta_bancaria'))
+    Contacto.objects.update(numero=Subquery(cuenta.values('numero')),
+                            nombre=Subquery(cuenta.values('usuario__username')))
+
+
+def crear_indices_prefijo(apps, schema_editor):
+    # LIKE 'abc%' solo usa un btree con *_pattern_ops cuando la base de datos no usa la intercalación C
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for nombre, columnas in INDICES_PREFIJO:
+        schema_editor.execute(f'CREATE INDEX IF NOT EXISTS {nombre} ON accounts_contacto {columnas}')
+
+
+def eliminar_indices_prefijo(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for nombre, _ in INDICES_PREFIJO:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {nombre}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0005_clave_idempotencia'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='contacto',
+            name='nombre',
+            field=models.CharField(default='', max_length=150),
+        ),
+        migrations.AddField(
+            model_name='contacto',
+            name='numero',
+            field=models.CharField(default='', max_length=20),
+        ),
+        migrations.RunPython(deduplicar_y_copiar, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='contacto',
+            index=models.Index(fields=['usuario', 'numero', 'id'], name='contacto_usuario_numero_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='contacto',
+            constraint=models.UniqueConstraint(fields=('usuario', 'cuenta_bancaria'), name='contacto_usuario_cuenta_unico'),
+        ),
+        migrations.RunPython(crear_indices_prefijo, eliminar_indices_prefijo),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.1.1 on 2026-10-18 17:57
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0006_contacto_busqueda'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumenDiario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dia', models.DateField()),
+                ('entradas', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('salidas', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('n_entradas', models.PositiveIntegerField(default=0)),
+                ('n_salidas', models.PositiveIntegerField(default=0)),
+                ('contraparte', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='accounts.cuentabancaria')),
+                ('cuenta', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='resumenes', to='accounts.cuentabancaria')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('cuenta', 'dia', 'contraparte'), name='resumen_cuenta_dia_unico')],
+            },
+        ),
+    ]
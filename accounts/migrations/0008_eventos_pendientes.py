@@ -0,0 +1,30 @@
+# Generated by Django 5.1.1 on 2026-10-18 17:59
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0007_resumen_diario'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventoPendiente',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(max_length=50)),
+                ('datos', models.JSONField()),
+                ('creado', models.DateTimeField(default=django.utils.timezone.now)),
+                ('disponible', models.DateTimeField(default=django.utils.timezone.now)),
+                ('intentos', models.PositiveSmallIntegerField(default=0)),
+                ('ultimo_error', models.TextField(blank=True, default='')),
+                ('descartado', models.BooleanField(default=False)),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('descartado', False)), fields=['disponible', 'id'], name='evento_pendiente_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.1.1 on 2026-10-18 18:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0008_eventos_pendientes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cuentabancaria',
+            name='fracciones',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='movimientolibro',
+            name='saldo_resultante',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True),
+        ),
+        migrations.CreateModel(
+            name='FraccionSaldo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('indice', models.PositiveSmallIntegerField()),
+                ('saldo', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('cuenta', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='fracciones_saldo', to='accounts.cuentabancaria')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('cuenta', 'indice'), name='fraccion_cuenta_indice_unica')],
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.1.1 on 2026-10-18 18:11
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0009_fracciones_saldo'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LoteEstadoCuenta',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('desde', models.DateField()),
+                ('hasta', models.DateField()),
+                ('cuenta_desde', models.BigIntegerField()),
+                ('cuenta_hasta', models.BigIntegerField()),
+                ('archivo', models.CharField(max_length=255)),
+                ('cuentas', models.PositiveIntegerField()),
+                ('movimientos', models.PositiveBigIntegerField()),
+                ('completado', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('desde', 'hasta', 'cuenta_desde'), name='lote_estado_cuenta_unico')],
+            },
+        ),
+    ]
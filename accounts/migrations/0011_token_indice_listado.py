@@ -0,0 +1,19 @@
+# Generated by Django 5.1.1 on 2026-10-18 18:35
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0010_lotes_estados_cuenta'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='token',
+            index=models.Index(fields=['cliente', 'generado_en', 'id'], name='token_cliente_generado_idx'),
+        ),
+    ]
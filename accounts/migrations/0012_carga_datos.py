@@ -0,0 +1,29 @@
+# Generated by Django 5.1.1 on 2026-10-18 18:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0011_token_indice_listado'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CargaDatos',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('parametros', models.JSONField()),
+                ('semilla', models.BigIntegerField()),
+                ('referencia', models.DateTimeField()),
+                ('primer_usuario', models.BigIntegerField()),
+                ('primera_cuenta', models.BigIntegerField()),
+                ('usuarios', models.PositiveBigIntegerField(default=0)),
+                ('cuentas', models.PositiveBigIntegerField(default=0)),
+                ('contactos', models.PositiveBigIntegerField(default=0)),
+                ('transferencias', models.PositiveBigIntegerField(default=0)),
+                ('terminada', models.BooleanField(default=False)),
+            ],
+        ),
+    ]
@@ -11,6 +11,13 @@ class Token(models.Model):
     usado_en = models.DateTimeField(null=True, blank=True)
     es_valido = models.BooleanField(default=True)  # Puedes seguir usando este campo si es necesario
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['cliente', 'es_valido', 'generado_en'], name='token_cliente_valido_idx'),
+            # Listado paginado de obtener_tokens_cliente: orden y cursor por (generado_en, id)
+            models.Index(fields=['cliente', 'generado_en', 'id'], name='token_cliente_generado_idx'),
+        ]
+
     def __str__(self):
         return f'Token {self.token} de {self.cliente.username}'
 
@@ -36,6 +43,9 @@ class CuentaBancaria(models.Model):
     tipo = models.CharField(max_length=10, choices=TIPO_CUENTA)
     saldo = models.DecimalField(max_digits=10, decimal_places=2)
     usuario = models.ForeignKey(User, on_delete=models.CASCADE, related_name='cuentas')
+    # Cuentas calientes (comercios, tesorería): con N > 0 los créditos van a N filas de FraccionSaldo y el
+    # saldo total es saldo + la suma de las fracciones. Se cambia con shard_accounts.
+    fracciones = models.PositiveSmallIntegerField(default=0)
 
     def __str__(self):
         return f'{self.numero} - {self.tipo}'
@@ -49,6 +59,13 @@ class Transferencia(models.Model):
     motivo = models.CharField(max_length=255, blank=True, null=True)
     fecha = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        # Historial por cuenta: permiten recorrer (fecha, id) en orden sin escanear la tabla completa
+        indexes = [
+            models.Index(fields=['cuenta_origen', 'fecha', 'id'], name='transf_origen_fecha_idx'),
+            models.Index(fields=['cuenta_destino', 'fecha', 'id'], name='transf_destino_fecha_idx'),
+        ]
+
     def __str__(self):
         return f'Transferencia de {self.cuenta_origen} a {self.cuenta_destino} por {self.monto}'
 
@@ -57,6 +74,204 @@ class Transferencia(models.Model):
 class Contacto(models.Model):
     usuario = models.ForeignKey(User, on_delete=models.CASCADE, related_name='contactos')
     cuenta_bancaria = models.ForeignKey(CuentaBancaria, on_delete=models.CASCADE)
+    # Copias del número de la cuenta y del username de su dueño: la búsqueda y el orden se resuelven con un
+    # índice por usuario sin JOIN. Se mantienen al día con las señales de accounts.contactos.
+    numero = models.CharField(max_length=20, default='')
+    nombre = models.CharField(max_length=150, default='')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['usuario', 'cuenta_bancaria'], name='contacto_usuario_cuenta_unico'),
+        ]
+        # En PostgreSQL la migración 0006 agrega además índices con varchar_pattern_ops para los prefijos
+        indexes = [
+            models.Index(fields=['usuario', 'numero', 'id'], name='contacto_usuario_numero_idx'),
+        ]
+
+    def __str__(self):
+        return f'Contacto {self.usuario} - {self.numero}'
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instancia = super().from_db(db, field_names, values)
+        instancia._cuenta_cargada = instancia.__dict__.get('cuenta_bancaria_id')
+        return instancia
+
+    def save(self, *args, update_fields=None, **kwargs):
+        # Las copias se recalculan al crear el contacto y cada vez que cambia su cuenta
+        if not self.numero or self.cuenta_bancaria_id != getattr(self, '_cuenta_cargada', None):
+            self.numero, self.nombre = CuentaBancaria.objects.filter(pk=self.cuenta_bancaria_id) \
+                .values_list('numero', 'usuario__username').get()
+            if update_fields is not None:
+                update_fields = {*update_fields, 'numero', 'nombre'}
+        super().save(*args, update_fields=update_fields, **kwargs)
+        self._cuenta_cargada = self.cuenta_bancaria_id
+
+
+# Libro mayor de partida doble: cada transferencia escribe un débito y un crédito inmutables
+class MovimientoLibro(models.Model):
+    DEBITO = 'D'
+    CREDITO = 'C'
+    APERTURA = 'A'
+    TIPO_MOVIMIENTO = [
+        (DEBITO, 'Débito'),
+        (CREDITO, 'Crédito'),
+        (APERTURA, 'Apertura'),
+    ]
+    cuenta = models.ForeignKey(CuentaBancaria, on_delete=models.PROTECT, related_name='movimientos')
+    transferencia = models.ForeignKey(Transferencia, on_delete=models.PROTECT, null=True, blank=True,
+                                      related_name='movimientos')
+    tipo = models.CharField(max_length=1, choices=TIPO_MOVIMIENTO)
+    monto = models.DecimalField(max_digits=10, decimal_places=2)  # Siempre positivo; el signo lo da el tipo
+    # Nulo en cuentas fraccionadas: sus créditos no bloquean la cuenta y el saldo total no se conoce al registrar
+    saldo_resultante = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    fecha = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['cuenta', 'fecha', 'id'], name='movimiento_cuenta_fecha_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.get_tipo_display()} de {self.monto} en la cuenta {self.cuenta_id}'
+
+
+# Cortes periódicos del libro: el saldo a una fecha parte del corte más cercano y suma un rango acotado
+class CorteSaldo(models.Model):
+    cuenta = models.ForeignKey(CuentaBancaria, on_delete=models.CASCADE, related_name='cortes')
+    fecha = models.DateTimeField()
+    saldo = models.DecimalField(max_digits=10, decimal_places=2)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['cuenta', 'fecha'], name='corte_cuenta_fecha_unico'),
+        ]
+        indexes = [
+            models.Index(fields=['fecha'], name='corte_fecha_idx'),
+        ]
+
+    def __str__(self):
+        return f'Corte de la cuenta {self.cuenta_id} al {self.fecha}: {self.saldo}'
+
+
+# Respuestas de POST /api/transferencia/ guardadas por Idempotency-Key para responder reintentos sin repetir la operación
+class ClaveIdempotencia(models.Model):
+    EN_CURSO = 'en_curso'
+    COMPLETADA = 'completada'
+    ESTADOS = [
+        (EN_CURSO, 'En curso'),
+        (COMPLETADA, 'Completada'),
+    ]
+    usuario = models.ForeignKey(User, on_delete=models.CASCADE, related_name='claves_idempotencia')
+    clave = models.CharField(max_length=64)
+    huella = models.CharField(max_length=64)  # SHA-256 de la solicitud original
+    estado = models.CharField(max_length=10, choices=ESTADOS, default=EN_CURSO)
+    status = models.PositiveSmallIntegerField(null=True, blank=True)
+    respuesta = models.JSONField(null=True, blank=True)
+    creada_en = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['usuario', 'clave'], name='idempotencia_usuario_clave_unica'),
+        ]
+        indexes = [
+            models.Index(fields=['creada_en'], name='idempotencia_creada_en_idx'),
+        ]
+
+    def __str__(self):
+        return f'Clave {self.clave} de {self.usuario_id} ({self.estado})'
+
+
+# Totales diarios por cuenta y contraparte, mantenidos por las transferencias y reconstruibles con rebuild_rollups
+class ResumenDiario(models.Model):
+    cuenta = models.ForeignKey(CuentaBancaria, on_delete=models.CASCADE, related_name='resumenes')
+    contraparte = models.ForeignKey(CuentaBancaria, on_delete=models.CASCADE, related_name='+')
+    dia = models.DateField()
+    entradas = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    salidas = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    n_entradas = models.PositiveIntegerField(default=0)
+    n_salidas = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        # También es el índice de las consultas por rango: (cuenta, dia) ya ordenado
+        constraints = [
+            models.UniqueConstraint(fields=['cuenta', 'dia', 'contraparte'], name='resumen_cuenta_dia_unico'),
+        ]
+
+    def __str__(self):
+        return f'Resumen de la cuenta {self.cuenta_id} con {self.contraparte_id} el {self.dia}'
+
+
+# Bandeja de salida: efectos secundarios de una transferencia (auditoría, notificaciones, fraude) escritos en el
+# mismo commit y entregados después por run_outbox_worker. Los eventos entregados se eliminan.
+class EventoPendiente(models.Model):
+    tipo = models.CharField(max_length=50)
+    datos = models.JSONField()
+    creado = models.DateTimeField(default=timezone.now)
+    disponible = models.DateTimeField(default=timezone.now)  # No se entrega antes; los reintentos lo posponen
+    intentos = models.PositiveSmallIntegerField(default=0)
+    ultimo_error = models.TextField(blank=True, default='')
+    descartado = models.BooleanField(default=False)  # Agotó los intentos; queda para revisión manual
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['disponible', 'id'], condition=models.Q(descartado=False),
+                         name='evento_pendiente_idx'),
+        ]
+
+    def __str__(self):
+        return f'Evento {self.tipo} {self.id} ({self.intentos} intentos)'
+
+
+# Fracción del saldo de una cuenta caliente: cada crédito suma a una fracción al azar y solo bloquea esa fila
+class FraccionSaldo(models.Model):
+    cuenta = models.ForeignKey(CuentaBancaria, on_delete=models.CASCADE, related_name='fracciones_saldo')
+    indice = models.PositiveSmallIntegerField()
+    saldo = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['cuenta', 'indice'], name='fraccion_cuenta_indice_unica'),
+        ]
+
+    def __str__(self):
+        return f'Fracción {self.indice} de la cuenta {self.cuenta_id}: {self.saldo}'
+
+
+# Punto de control de generate_statements: un rango de ids de cuenta cuyo archivo de estados ya se escribió
+class LoteEstadoCuenta(models.Model):
+    desde = models.DateField()
+    hasta = models.DateField()
+    cuenta_desde = models.BigIntegerField()  # Id inicial, incluido
+    cuenta_hasta = models.BigIntegerField()  # Id final, excluido
+    archivo = models.CharField(max_length=255)
+    cuentas = models.PositiveIntegerField()
+    movimientos = models.PositiveBigIntegerField()
+    completado = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['desde', 'hasta', 'cuenta_desde'], name='lote_estado_cuenta_unico'),
+        ]
+
+    def __str__(self):
+        return f'Estados del {self.desde} al {self.hasta}, cuentas {self.cuenta_desde}-{self.cuenta_hasta}'
+
+
+# Punto de control de populate_db: cada lote se confirma junto con el avance de su tabla, así una carga
+# interrumpida se reanuda desde la última fila confirmada generando las mismas filas
+class CargaDatos(models.Model):
+    parametros = models.JSONField()  # Opciones que determinan las filas; solo se reanuda con las mismas
+    semilla = models.BigIntegerField()
+    referencia = models.DateTimeField()  # Fecha base de date_joined y de las fechas de las transferencias
+    primer_usuario = models.BigIntegerField()
+    primera_cuenta = models.BigIntegerField()
+    # Filas ya confirmadas de cada tabla
+    usuarios = models.PositiveBigIntegerField(default=0)
+    cuentas = models.PositiveBigIntegerField(default=0)
+    contactos = models.PositiveBigIntegerField(default=0)
+    transferencias = models.PositiveBigIntegerField(default=0)
+    terminada = models.BooleanField(default=False)
 
     def __str__(self):
-        return f'Contacto {self.usuario} - {self.cuenta_bancaria.numero}'
+        return f'Carga de datos desde el usuario {self.primer_usuario}'
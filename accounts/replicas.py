@@ -0,0 +1,134 @@
+import contextvars
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections
+
+# Estado de la solicitud en curso: si la vista pidió leer de la réplica y si hubo escrituras.
+# Es un dict mutable para que el router lo actualice también desde los hilos de sync_to_async.
+_solicitud = contextvars.ContextVar('replicas_solicitud', default=None)
+
+
+def _alias():
+    # La réplica solo se usa si está configurada; sin ella todo va a la primaria como antes
+    alias = settings.REPLICA['ALIAS']
+    return alias if alias in settings.DATABASES else None
+
+
+def _clave(usuario_id):
+    return f'primaria:{usuario_id}'
+
+
+def _cache():
+    return caches[settings.REPLICA['CACHE']]
+
+
+def fijar_primaria(usuario_ids):
+    # Durante FIJACION segundos las lecturas de estos usuarios van a la primaria: ven sus propias escrituras
+    # aunque la réplica tenga retraso. Debe llamarse después del commit.
+    if _alias() is None or not usuario_ids:
+        return
+    _cache().set_many({_clave(usuario_id): True for usuario_id in usuario_ids}, timeout=settings.REPLICA['FIJACION'])
+
+
+class RouterReplica:
+    # Envía a la réplica solo las lecturas de las vistas marcadas con @lectura_replica; el resto de lecturas y
+    # todas las escrituras quedan en 'default'.
+
+    def db_for_read(self, model, **hints):
+        estado = _solicitud.get()
+        if estado is None or not estado['replica'] or estado['escrituras']:
+            return None
+        if connections['default'].in_atomic_block:
+            return None  # Dentro de una transacción la lectura debe ver lo que la transacción escribió
+        return _alias()
+
+    def db_for_write(self, model, **hints):
+        estado = _solicitud.get()
+        if estado is not None:
+            estado['escrituras'] = True
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # La réplica es una copia de la primaria: los objetos de ambas se pueden relacionar
+        alias = {'default', settings.REPLICA['ALIAS']}
+        if obj1._state.db in alias and obj2._state.db in alias:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, **hints):
+        if db == settings.REPLICA['ALIAS']:
+            return False  # Se replica desde la primaria
+        return None
+
+
+def lectura_replica(vista):
+    # Va debajo de @api_view / jwt_requerido para conocer al usuario ya autenticado
+    if iscoroutinefunction(vista):
+        @wraps(vista)
+        async def envoltura_async(request, *args, **kwargs):
+            fijado = _alias() is not None and await _cache().aget(_clave(request.user.pk))
+            _marcar(not fijado)
+            return await vista(request, *args, **kwargs)
+        return envoltura_async
+
+    @wraps(vista)
+    def envoltura(request, *args, **kwargs):
+        fijado = _alias() is not None and _cache().get(_clave(request.user.pk))
+        _marcar(not fijado)
+        return vista(request, *args, **kwargs)
+    return envoltura
+
+
+def _marcar(replica):
+    estado = _solicitud.get()
+    if estado is not None:
+        estado['replica'] = replica
+
+
+class ReplicaMiddleware:
+    # Abre el estado de cada solicitud y, si la solicitud escribió, fija al usuario a la primaria
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.es_async = iscoroutinefunction(get_response)
+        if self.es_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.es_async:
+            return self.__acall__(request)
+        estado = {'replica': False, 'escrituras': False}
+        token = _solicitud.set(estado)
+        try:
+            respuesta = self.get_response(request)
+        finally:
+            _solicitud.reset(token)
+        usuario_id = _escritor(request, estado)
+        if usuario_id is not None:
+            fijar_primaria([usuario_id])
+        return respuesta
+
+    async def __acall__(self, request):
+        estado = {'replica': False, 'escrituras': False}
+        token = _solicitud.set(estado)
+        try:
+            respuesta = await self.get_response(request)
+        finally:
+            _solicitud.reset(token)
+        usuario_id = _escritor(request, estado)
+        if usuario_id is not None:
+            await _cache().aset_many({_clave(usuario_id): True}, timeout=settings.REPLICA['FIJACION'])
+        return respuesta
+
+
+def _escritor(request, estado):
+    # DRF deja en request.user al usuario autenticado por JWT
+    if not estado['escrituras'] or _alias() is None:
+        return None
+    usuario = getattr(request, 'user', None)
+    return usuario.pk if usuario is not None and usuario.is_authenticated else None
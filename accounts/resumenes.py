@@ -0,0 +1,140 @@
+import heapq
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from operator import itemgetter
+
+from django.conf import settings
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate, TruncMonth
+from django.utils import timezone
+
+from .models import CuentaBancaria, ResumenDiario, Transferencia
+
+CAMPOS = ('entradas', 'salidas', 'n_entradas', 'n_salidas')
+
+
+def _vacio():
+    return {'entradas': Decimal('0'), 'salidas': Decimal('0'), 'n_entradas': 0, 'n_salidas': 0}
+
+
+def acumular(transferencias):
+    # Suma las transferencias recién creadas a los resúmenes de su día. Se llama dentro de la transacción que
+    # bloqueó ambas cuentas: toda fila (cuenta, dia, contraparte) que se toca aquí pertenece a cuentas
+    # bloqueadas, así que leer y reescribir no compite con otra transferencia.
+    if not settings.RESUMENES_INCREMENTALES:
+        return
+    deltas = defaultdict(_vacio)
+    for transferencia in transferencias:
+        dia = timezone.localdate(transferencia.fecha)
+        salida = deltas[(transferencia.cuenta_origen_id, dia, transferencia.cuenta_destino_id)]
+        salida['salidas'] += transferencia.monto
+        salida['n_salidas'] += 1
+        entrada = deltas[(transferencia.cuenta_destino_id, dia, transferencia.cuenta_origen_id)]
+        entrada['entradas'] += transferencia.monto
+        entrada['n_entradas'] += 1
+
+    existentes = ResumenDiario.objects.filter(
+        cuenta_id__in={cuenta for cuenta, _, _ in deltas},
+        dia__in={dia for _, dia, _ in deltas},
+        contraparte_id__in={contraparte for _, _, contraparte in deltas},
+    )
+    actualizar = []
+    for resumen in existentes:
+        delta = deltas.pop((resumen.cuenta_id, resumen.dia, resumen.contraparte_id), None)
+        if delta is not None:
+            for campo in CAMPOS:
+                setattr(resumen, campo, getattr(resumen, campo) + delta[campo])
+            actualizar.append(resumen)
+
+    bloque = settings.TRANSFERENCIA_LOTE_BLOQUE
+    ResumenDiario.objects.bulk_update(actualizar, CAMPOS, batch_size=bloque)
+    ResumenDiario.objects.bulk_create([
+        ResumenDiario(cuenta_id=cuenta, dia=dia, contraparte_id=contraparte, **delta)
+        for (cuenta, dia, contraparte), delta in deltas.items()
+    ], batch_size=bloque)
+
+
+def _limites_del_dia(dia):
+    inicio = timezone.make_aware(datetime.combine(dia, time.min))
+    return inicio, inicio + timedelta(days=1)
+
+
+def _agrupadas(cuenta, contraparte, desde_id, hasta_id, inicio, fin, chunk_size):
+    # Transferencias de las cuentas del bloque agrupadas por (cuenta, día, contraparte), en ese orden. El filtro
+    # por rango de cuenta y de fecha recorre el índice (cuenta, fecha, id) una sola vez para todo el periodo.
+    return Transferencia.objects.filter(**{f'{cuenta}__gte': desde_id, f'{cuenta}__lt': hasta_id},
+                                        fecha__gte=inicio, fecha__lt=fin) \
+        .annotate(dia=TruncDate('fecha')).values_list(cuenta, 'dia', contraparte) \
+        .annotate(total=Sum('monto'), n=Count('id')).order_by(cuenta, 'dia', contraparte) \
+        .iterator(chunk_size=chunk_size)
+
+
+def reconstruir(desde, hasta, desde_id, hasta_id, chunk_size=2000):
+    # Recalcula desde Transferencia los resúmenes de los días [desde, hasta] de las cuentas con id en
+    # [desde_id, hasta_id). Salidas (por cuenta origen) y entradas (por cuenta destino) se leen con una consulta
+    # cada una, ya ordenadas, y se combinan en un recorrido: cada fila sale completa y se escribe por lotes, así
+    # que en memoria queda solo un lote.
+    inicio, fin = _limites_del_dia(desde)[0], _limites_del_dia(hasta)[1]
+    salidas = ((cuenta, dia, contraparte, 'salidas', total, n) for cuenta, dia, contraparte, total, n in
+               _agrupadas('cuenta_origen_id', 'cuenta_destino_id', desde_id, hasta_id, inicio, fin, chunk_size))
+    entradas = ((cuenta, dia, contraparte, 'entradas', total, n) for cuenta, dia, contraparte, total, n in
+                _agrupadas('cuenta_destino_id', 'cuenta_origen_id', desde_id, hasta_id, inicio, fin, chunk_size))
+
+    ResumenDiario.objects.filter(cuenta_id__gte=desde_id, cuenta_id__lt=hasta_id, dia__gte=desde,
+                                 dia__lte=hasta).delete()
+    escritas, lote, actual = 0, [], None
+    for cuenta, dia, contraparte, campo, total, n in heapq.merge(salidas, entradas, key=itemgetter(0, 1, 2)):
+        if actual is None or (actual.cuenta_id, actual.dia, actual.contraparte_id) != (cuenta, dia, contraparte):
+            if len(lote) >= chunk_size:
+                ResumenDiario.objects.bulk_create(lote, batch_size=settings.TRANSFERENCIA_LOTE_BLOQUE)
+                escritas += len(lote)
+                lote = []
+            actual = ResumenDiario(cuenta_id=cuenta, dia=dia, contraparte_id=contraparte)
+            lote.append(actual)
+        setattr(actual, campo, total)
+        setattr(actual, f'n_{campo}', n)
+    ResumenDiario.objects.bulk_create(lote, batch_size=settings.TRANSFERENCIA_LOTE_BLOQUE)
+    return escritas + len(lote)
+
+
+def resumir(cuenta_id, desde, hasta):
+    # Totales por mes y contrapartes principales entre las fechas `desde` y `hasta` (incluidas). Los días
+    # anteriores a hoy salen de ResumenDiario; hoy, de las transferencias del día. El costo depende del rango
+    # pedido y no de la antigüedad de la cuenta.
+    hoy = timezone.localdate()
+    meses = defaultdict(_vacio)
+    contrapartes = defaultdict(_vacio)
+
+    resumenes = ResumenDiario.objects.filter(cuenta_id=cuenta_id, dia__gte=desde, dia__lte=min(hasta, hoy - timedelta(days=1)))
+    sumas = {campo: Sum(campo) for campo in CAMPOS}
+    for fila in resumenes.annotate(mes=TruncMonth('dia')).values('mes').annotate(**sumas).order_by():
+        _sumar(meses[fila['mes'].strftime('%Y-%m')], fila)
+    for fila in resumenes.values('contraparte_id').annotate(**sumas).order_by():
+        _sumar(contrapartes[fila['contraparte_id']], fila)
+
+    if desde <= hoy <= hasta:
+        inicio, fin = _limites_del_dia(hoy)
+        del_dia = Transferencia.objects.filter(fecha__gte=inicio, fecha__lt=fin)
+        for campo, cuenta, contraparte in (('salidas', 'cuenta_origen_id', 'cuenta_destino_id'),
+                                           ('entradas', 'cuenta_destino_id', 'cuenta_origen_id')):
+            filas = del_dia.filter(**{cuenta: cuenta_id}).values(contraparte) \
+                .annotate(total=Sum('monto'), n=Count('id')).order_by()
+            for fila in filas:
+                valores = {campo: fila['total'], f'n_{campo}': fila['n']}
+                _sumar(meses[hoy.strftime('%Y-%m')], valores)
+                _sumar(contrapartes[fila[contraparte]], valores)
+
+    principales = sorted(contrapartes.items(), key=lambda item: (-(item[1]['entradas'] + item[1]['salidas']), item[0]))
+    principales = principales[:settings.RESUMEN_CONTRAPARTES]
+    numeros = dict(CuentaBancaria.objects.filter(id__in=[cuenta for cuenta, _ in principales])
+                   .values_list('id', 'numero'))
+    return {
+        'meses': [{'mes': mes, **valores} for mes, valores in sorted(meses.items())],
+        'contrapartes': [{'numero': numeros[cuenta], **valores} for cuenta, valores in principales],
+    }
+
+
+def _sumar(destino, valores):
+    for campo in CAMPOS:
+        destino[campo] += valores.get(campo) or 0
@@ -0,0 +1,308 @@
+import random
+import time
+from contextlib import contextmanager
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db import OperationalError, transaction
+from django.db.models import Case, F, Value, When
+
+from . import eventos, fraude, fracciones, libro, resumenes
+from .cache_lecturas import invalidar, CUENTAS
+from .models import CuentaBancaria, Transferencia
+from .tokens import obtener_almacen
+
+# Códigos SQLSTATE de PostgreSQL que indican que la transacción puede reintentarse
+CODIGOS_REINTENTABLES = {'40001', '40P01'}  # serialization_failure, deadlock_detected
+
+
+class TransferenciaError(Exception):
+    # Error de negocio de una transferencia; el mensaje se devuelve tal cual al cliente
+    def __init__(self, mensaje, status=400, **extra):
+        super().__init__(mensaje)
+        self.mensaje = mensaje
+        self.status = status
+        self.extra = extra
+
+    def respuesta(self):
+        return {'error': self.mensaje, **self.extra}
+
+
+class TokenNoConsumido(Exception):
+    pass
+
+
+def leer_monto(valor):
+    # Monto recibido del cliente: número finito, mayor que 0 y con a lo sumo 2 decimales
+    try:
+        monto = Decimal(str(valor))
+    except InvalidOperation:
+        raise TransferenciaError('El monto no es válido')
+    if not monto.is_finite() or monto <= 0:
+        raise TransferenciaError('El monto debe ser mayor que 0')
+    if monto.normalize().as_tuple().exponent < -2:
+        raise TransferenciaError('El monto no puede tener más de 2 decimales')
+    return monto
+
+
+def es_error_reintentable(error):
+    causa = error.__cause__
+    if getattr(causa, 'pgcode', None) in CODIGOS_REINTENTABLES:
+        return True
+    # SQLite no tiene bloqueos por fila: la base completa queda bloqueada
+    return 'database is locked' in str(error) or 'database table is locked' in str(error)
+
+
+def con_reintentos(funcion, *args, **kwargs):
+    # Ejecuta la función reintentando ante deadlocks o fallos de serialización con backoff exponencial
+    intentos = getattr(settings, 'TRANSFERENCIA_REINTENTOS', 5)
+    espera = getattr(settings, 'TRANSFERENCIA_BACKOFF_BASE', 0.01)
+    for intento in range(intentos):
+        try:
+            return funcion(*args, **kwargs)
+        except OperationalError as error:
+            if intento == intentos - 1 or not es_error_reintentable(error):
+                raise
+            time.sleep(espera * (2 ** intento) * random.uniform(0.5, 1.5))
+
+
+def bloquear_cuentas(ids):
+    # Bloquea las cuentas siempre en orden de id para que dos transferencias cruzadas no se bloqueen mutuamente
+    return {cuenta.id: cuenta for cuenta in
+            CuentaBancaria.objects.select_for_update().filter(id__in=set(ids)).order_by('id')}
+
+
+def saldos_exactos(cuentas):
+    # Saldo de las cuentas bloqueadas para el libro; el de las fraccionadas no se conoce sin bloquear sus fracciones
+    return {cuenta.id: cuenta.saldo for cuenta in cuentas.values() if not cuenta.fracciones}
+
+
+def consumir_token(usuario, token_valor, compensaciones):
+    # Con el almacén en base de datos el consumo se confirma en el mismo commit que la transferencia; con el de
+    # caché el rollback no lo deshace y el token se devuelve como compensación
+    almacen = obtener_almacen()
+    if not almacen.consumir(usuario, token_valor):
+        raise TokenNoConsumido()
+    compensaciones.append(lambda: almacen.devolver(usuario, token_valor))
+
+
+@contextmanager
+def transaccion_externa():
+    # transaction.atomic() para operaciones con efectos fuera de la base de datos (token en caché, contadores de
+    # FRAUDE) que el rollback no deshace. Entrega una lista donde se registran sus compensaciones; si la
+    # transacción no se confirma se ejecutan en orden inverso. Sin esto un reintento por deadlock o un fallo
+    # del débito dejaría al cliente sin token y sin transferencia.
+    compensaciones = []
+    try:
+        with transaction.atomic():
+            yield compensaciones
+    except BaseException:
+        for compensar in reversed(compensaciones):
+            compensar()
+        raise
+
+
+def debitar(cuenta_id, monto):
+    # UPDATE ... WHERE saldo >= monto: el saldo nunca queda negativo aunque haya escrituras concurrentes
+    return CuentaBancaria.objects.filter(id=cuenta_id, saldo__gte=monto).update(saldo=F('saldo') - monto)
+
+
+def acreditar(cuenta_id, monto):
+    return CuentaBancaria.objects.filter(id=cuenta_id).update(saldo=F('saldo') + monto)
+
+
+def verificar_velocidad(cuenta_id, movimientos, compensaciones):
+    # Reserva la operación en los límites de FRAUDE de la cuenta de origen; los destinos se marcan al commit
+    try:
+        reserva = fraude.reservar(cuenta_id, movimientos)
+    except fraude.LimiteSuperado as error:
+        raise TransferenciaError('La operación supera un límite de seguridad de la cuenta', status=429,
+                                 regla=error.regla)
+    compensaciones.append(lambda: fraude.liberar(reserva))
+    transaction.on_commit(lambda: fraude.registrar_destinos(cuenta_id, movimientos))
+
+
+def _token_rechazado(usuario, token_valor):
+    # Fuera de la transacción: si el token expiró el almacén lo invalida y entrega uno nuevo
+    nuevo_token = obtener_almacen().rechazado(usuario, token_valor)
+    if nuevo_token is None:
+        return TransferenciaError('El token no es válido o ha expirado')
+    return TransferenciaError('El token ha expirado', nuevo_token=nuevo_token)
+
+
+def _transferir(usuario, numero_origen, numero_destino, monto, motivo, token_valor, al_confirmar):
+    with transaccion_externa() as compensaciones:
+        leidas = {cuenta.numero: cuenta for cuenta in
+                  CuentaBancaria.objects.filter(numero__in=[numero_origen, numero_destino])}
+        if numero_origen not in leidas:
+            raise TransferenciaError('La cuenta de origen no existe o no pertenece al usuario', status=404)
+        if numero_destino not in leidas:
+            raise TransferenciaError('La cuenta de destino no existe', status=404)
+
+        # Un crédito a una cuenta fraccionada no bloquea su fila. Si el origen también es fraccionado se bloquean
+        # las dos: así los resúmenes diarios del par nunca se escriben desde dos transacciones a la vez.
+        origen_id, destino_id = leidas[numero_origen].id, leidas[numero_destino].id
+        sin_bloqueo = leidas[numero_destino].fracciones and not leidas[numero_origen].fracciones
+        cuentas = bloquear_cuentas([origen_id] if sin_bloqueo else [origen_id, destino_id])
+        cuenta_origen = cuentas[origen_id]
+        cuenta_destino = cuentas.get(destino_id, leidas[numero_destino])
+        if cuenta_origen.usuario_id != usuario.id:
+            raise TransferenciaError('La cuenta de origen no existe o no pertenece al usuario', status=404)
+
+        # La cuenta ya está bloqueada: el saldo leído es definitivo y el token no se consume en vano
+        if cuenta_origen.saldo < monto and cuenta_origen.fracciones:
+            cuenta_origen.saldo += fracciones.barrer(cuenta_origen.id, monto - cuenta_origen.saldo)
+        if cuenta_origen.saldo < monto:
+            raise TransferenciaError('Fondos insuficientes en la cuenta de origen')
+        verificar_velocidad(cuenta_origen.id, [(cuenta_destino.id, monto)], compensaciones)
+        consumir_token(usuario, token_valor, compensaciones)
+
+        if not debitar(cuenta_origen.id, monto):
+            raise TransferenciaError('Fondos insuficientes en la cuenta de origen')
+        if cuenta_destino.fracciones:
+            fracciones.acreditar(cuenta_destino.id, cuenta_destino.fracciones, monto)
+        else:
+            acreditar(cuenta_destino.id, monto)
+
+        transferencia = Transferencia.objects.create(
+            cuenta_origen=cuenta_origen,
+            cuenta_destino=cuenta_destino,
+            monto=monto,
+            motivo=motivo
+        )
+        libro.registrar([(transferencia, cuenta_origen.id, cuenta_destino.id, monto)], saldos_exactos(cuentas))
+        resumenes.acumular([transferencia])
+        eventos.publicar(eventos.TRANSFERENCIA_REALIZADA, [eventos.datos_transferencia(transferencia)])
+        if al_confirmar is not None:
+            al_confirmar(transferencia)
+        return transferencia
+
+
+def transferir(usuario, numero_origen, numero_destino, monto, motivo, token_valor, al_confirmar=None):
+    # Débito, crédito, registro de la transferencia y consumo del token se confirman en un único commit.
+    # `al_confirmar(transferencia)` se ejecuta dentro de esa misma transacción.
+    monto = leer_monto(monto)
+
+    try:
+        return con_reintentos(_transferir, usuario, numero_origen, numero_destino, monto, motivo, token_valor,
+                              al_confirmar)
+    except TokenNoConsumido:
+        raise _token_rechazado(usuario, token_valor)
+
+
+MODO_TODO_O_NADA = 'todo_o_nada'
+MODO_MEJOR_ESFUERZO = 'mejor_esfuerzo'
+
+
+def _resultado(indice, numero, error=None):
+    if error:
+        return {'indice': indice, 'cuenta_destino': numero, 'estado': 'rechazada', 'error': error}
+    return {'indice': indice, 'cuenta_destino': numero, 'estado': 'realizada'}
+
+
+def _preparar_tramos(tramos):
+    # Valida cada tramo sin tocar la base de datos; devuelve [(indice, numero, monto, motivo)] y los rechazos
+    validos, rechazos = [], {}
+    for indice, tramo in enumerate(tramos):
+        numero = tramo.get('cuenta_destino')
+        if not isinstance(numero, str):
+            rechazos[indice] = _resultado(indice, numero, 'La cuenta de destino no es válida')
+            continue
+        try:
+            monto = leer_monto(tramo.get('monto'))
+        except TransferenciaError as error:
+            rechazos[indice] = _resultado(indice, numero, error.mensaje)
+            continue
+        validos.append((indice, numero, monto, tramo.get('motivo', '')))
+    return validos, rechazos
+
+
+def acreditar_varias(montos_por_cuenta):
+    # Un solo UPDATE ... SET saldo = saldo + CASE id WHEN ... END por cada bloque de cuentas
+    saldo = CuentaBancaria._meta.get_field('saldo')
+    ids = list(montos_por_cuenta)
+    tamano = getattr(settings, 'TRANSFERENCIA_LOTE_BLOQUE', 500)
+    for inicio in range(0, len(ids), tamano):
+        bloque = ids[inicio:inicio + tamano]
+        incremento = Case(*[When(id=cuenta_id, then=Value(montos_por_cuenta[cuenta_id])) for cuenta_id in bloque],
+                          default=Value(Decimal('0')), output_field=saldo)
+        CuentaBancaria.objects.filter(id__in=bloque).update(saldo=F('saldo') + incremento)
+
+
+def _transferir_lote(usuario, numero_origen, tramos, token_valor, modo):
+    validos, rechazos = _preparar_tramos(tramos)
+
+    with transaccion_externa() as compensaciones:
+        try:
+            origen = CuentaBancaria.objects.only('id', 'fracciones').get(numero=numero_origen, usuario=usuario)
+        except CuentaBancaria.DoesNotExist:
+            raise TransferenciaError('La cuenta de origen no existe o no pertenece al usuario', status=404)
+
+        # Todas las cuentas destino se resuelven con una sola consulta IN
+        filas = list(CuentaBancaria.objects.filter(numero__in={numero for _, numero, _, _ in validos})
+                     .values_list('numero', 'id', 'fracciones', 'usuario_id'))
+        destinos = {numero: cuenta_id for numero, cuenta_id, _, _ in filas}
+        fraccionadas = {cuenta_id: n for _, cuenta_id, n, _ in filas if n}
+        duenos = {cuenta_id: usuario_id for _, cuenta_id, _, usuario_id in filas}
+        # Como en _transferir, las cuentas fraccionadas reciben sin bloquearse salvo que el origen también lo sea
+        bloqueadas = destinos.values() if origen.fracciones else set(destinos.values()) - set(fraccionadas)
+        cuentas = bloquear_cuentas([origen.id, *bloqueadas])
+        disponible = cuentas[origen.id].saldo
+        if cuentas[origen.id].fracciones:
+            disponible += fracciones.barrer(origen.id)
+
+        aplicados = []
+        for indice, numero, monto, motivo in validos:
+            if numero not in destinos:
+                rechazos[indice] = _resultado(indice, numero, 'La cuenta de destino no existe')
+            elif monto > disponible:
+                rechazos[indice] = _resultado(indice, numero, 'Fondos insuficientes en la cuenta de origen')
+            else:
+                disponible -= monto
+                aplicados.append((indice, numero, monto, motivo))
+
+        resultados = sorted([*rechazos.values(), *(_resultado(indice, numero) for indice, numero, _, _ in aplicados)],
+                            key=lambda resultado: resultado['indice'])
+        if not aplicados or (rechazos and modo == MODO_TODO_O_NADA):
+            raise TransferenciaError('Ninguna transferencia del lote fue realizada', resultados=resultados)
+        verificar_velocidad(origen.id, [(destinos[numero], monto) for _, numero, monto, _ in aplicados],
+                            compensaciones)
+        consumir_token(usuario, token_valor, compensaciones)
+
+        montos_por_cuenta = {}
+        for _, numero, monto, _ in aplicados:
+            montos_por_cuenta[destinos[numero]] = montos_por_cuenta.get(destinos[numero], Decimal('0')) + monto
+
+        if not debitar(origen.id, sum(montos_por_cuenta.values())):
+            raise TransferenciaError('Fondos insuficientes en la cuenta de origen', resultados=resultados)
+        acreditar_varias({cuenta_id: total for cuenta_id, total in montos_por_cuenta.items()
+                          if cuenta_id not in fraccionadas})
+        for cuenta_id in montos_por_cuenta.keys() & fraccionadas.keys():
+            fracciones.acreditar(cuenta_id, fraccionadas[cuenta_id], montos_por_cuenta[cuenta_id])
+
+        # bulk_create no emite post_save: las cachés de saldos se invalidan explícitamente
+        invalidar(CUENTAS, [usuario.id, *(duenos[cuenta_id] for cuenta_id in montos_por_cuenta)])
+        transferencias = Transferencia.objects.bulk_create([
+            Transferencia(cuenta_origen_id=origen.id, cuenta_destino_id=destinos[numero], monto=monto, motivo=motivo)
+            for _, numero, monto, motivo in aplicados
+        ], batch_size=getattr(settings, 'TRANSFERENCIA_LOTE_BLOQUE', 500))
+        libro.registrar([(t, t.cuenta_origen_id, t.cuenta_destino_id, t.monto) for t in transferencias],
+                        saldos_exactos(cuentas))
+        resumenes.acumular(transferencias)
+        eventos.publicar(eventos.TRANSFERENCIA_REALIZADA, [eventos.datos_transferencia(t) for t in transferencias])
+        return resultados
+
+
+def transferir_lote(usuario, numero_origen, tramos, token_valor, modo=MODO_TODO_O_NADA):
+    # Paga varios destinos desde una misma cuenta con una sola validación de token y un solo débito
+    if modo not in (MODO_TODO_O_NADA, MODO_MEJOR_ESFUERZO):
+        raise TransferenciaError('El modo del lote no es válido')
+    if not tramos:
+        raise TransferenciaError('El lote no contiene transferencias')
+    if len(tramos) > getattr(settings, 'TRANSFERENCIA_LOTE_MAXIMO', 5000):
+        raise TransferenciaError('El lote excede el número máximo de transferencias')
+
+    try:
+        return con_reintentos(_transferir_lote, usuario, numero_origen, tramos, token_valor, modo)
+    except TokenNoConsumido:
+        raise _token_rechazado(usuario, token_valor)
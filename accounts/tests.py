@@ -1,3 +1,1613 @@
-from django.test import TestCase
+import csv
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from io import StringIO
+from types import SimpleNamespace
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import IntegrityError, OperationalError, connection, connections, router, transaction
+from django.db.models import F, Sum
+from django.http import HttpResponse
+from django.test import Client, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework.test import APIClient
+
+from .authentication import tokens_verificados
+from .idempotencia import huella
+from .medicion import comparar, medir
+from .metricas import registro
+from .replicas import lectura_replica, ReplicaMiddleware
+from .cache_lecturas import CUENTAS, estadisticas, obtener_cache, respuesta_cacheada
+from . import eventos, fracciones, json_rapido, libro, resumenes
+from .models import CargaDatos, Token, CuentaBancaria, Contacto, Transferencia, MovimientoLibro, CorteSaldo, \
+    ClaveIdempotencia, ResumenDiario, EventoPendiente, FraccionSaldo, LoteEstadoCuenta
+from .serializers import CustomTokenObtainPairSerializer
+from .services import debitar, transferir, transferir_lote, TransferenciaError
+from .tokens import obtener_almacen
+
+
+def huella_de(datos, ruta='/api/transferencia/'):
+    return huella(SimpleNamespace(data=datos, method='POST', path=ruta))
+
+
+def crear_cliente(username, *saldos):
+    usuario = User.objects.create_user(username=username)
+    cuentas = [CuentaBancaria.objects.create(numero=f'{username}-{i}', tipo='Ahorro', saldo=saldo, usuario=usuario)
+               for i, saldo in enumerate(saldos)]
+    return usuario, cuentas
+
+
+class RealizarTransferenciaTests(TestCase):
+    def setUp(self):
+        self.juan, (self.cuenta_juan,) = crear_cliente('juan', Decimal('100.00'))
+        self.maria, (self.cuenta_maria,) = crear_cliente('maria', Decimal('50.00'))
+        self.client = APIClient()
+        self.client.force_authenticate(self.juan)
+
+    def transferir(self, monto, token='123456', destino=None):
+        return self.client.post('/api/transferencia/', {
+            'cuenta_origen': self.cuenta_juan.numero,
+            'cuenta_destino': destino or self.cuenta_maria.numero,
+            'monto': monto,
+            'token': token,
+        }, format='json')
+
+    def test_transferencia_exitosa_consume_token(self):
+        Token.objects.create(cliente=self.juan, token='123456')
+
+        respuesta = self.transferir('30.00')
+
+        self.assertEqual(respuesta.status_code, 200)
+        self.cuenta_juan.refresh_from_db()
+        self.cuenta_maria.refresh_from_db()
+        self.assertEqual(self.cuenta_juan.saldo, Decimal('70.00'))
+        self.assertEqual(self.cuenta_maria.saldo, Decimal('80.00'))
+        self.assertEqual(Transferencia.objects.count(), 1)
+        token = Token.objects.get()
+        self.assertFalse(token.es_valido)
+        self.assertIsNotNone(token.usado_en)
+
+        self.assertEqual(self.transferir('1.00').status_code, 400)
+
+    def test_fondos_insuficientes_no_consume_token(self):
+        Token.objects.create(cliente=self.juan, token='123456')
+
+        respuesta = self.transferir('100.01')
+
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertEqual(respuesta.data['error'], 'Fondos insuficientes en la cuenta de origen')
+        self.assertTrue(Token.objects.get().es_valido)
+        self.assertFalse(Transferencia.objects.exists())
+
+    def test_token_expirado_genera_nuevo_token(self):
+        token = Token.objects.create(cliente=self.juan, token='123456')
+        Token.objects.filter(pk=token.pk).update(generado_en=timezone.now() - timedelta(seconds=61))
+
+        respuesta = self.transferir('10.00')
+
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertEqual(respuesta.data['error'], 'El token ha expirado')
+        self.assertEqual(len(respuesta.data['nuevo_token']), 6)
+        self.cuenta_juan.refresh_from_db()
+        self.assertEqual(self.cuenta_juan.saldo, Decimal('100.00'))
+
+    def test_montos_invalidos_responden_400_sin_tocar_saldos(self):
+        Token.objects.create(cliente=self.juan, token='123456')
+
+        for monto, error in ((None, 'El monto no es válido'), ('abc', 'El monto no es válido'),
+                             (['10'], 'El monto no es válido'), ('NaN', 'El monto debe ser mayor que 0'),
+                             ('Infinity', 'El monto debe ser mayor que 0'), ('0', 'El monto debe ser mayor que 0'),
+                             ('-5.00', 'El monto debe ser mayor que 0'),
+                             ('10.001', 'El monto no puede tener más de 2 decimales')):
+            with self.subTest(monto=monto):
+                respuesta = self.transferir(monto)
+                self.assertEqual((respuesta.status_code, respuesta.data['error']), (400, error))
+
+        self.assertFalse(Transferencia.objects.exists())
+        self.assertTrue(Token.objects.get().es_valido)
+        self.assertEqual(self.transferir('10.50').status_code, 200)  # Ceros o dos decimales sí son válidos
+
+    def test_cuenta_destino_inexistente(self):
+        Token.objects.create(cliente=self.juan, token='123456')
+
+        respuesta = self.transferir('10.00', destino='no-existe')
+
+        self.assertEqual(respuesta.status_code, 404)
+        self.assertTrue(Token.objects.get().es_valido)
+
+
+class IdempotenciaTests(TestCase):
+    def setUp(self):
+        self.juan, (self.cuenta_juan,) = crear_cliente('juan', Decimal('100.00'))
+        self.maria, (self.cuenta_maria,) = crear_cliente('maria', Decimal('50.00'))
+        Token.objects.create(cliente=self.juan, token='123456')
+        self.client = APIClient()
+        self.client.force_authenticate(self.juan)
+        self.datos = {'cuenta_origen': self.cuenta_juan.numero, 'cuenta_destino': self.cuenta_maria.numero,
+                      'monto': '30.00', 'token': '123456'}
+
+    def transferir(self, datos, clave='clave-1'):
+        return self.client.post('/api/transferencia/', datos, format='json', HTTP_IDEMPOTENCY_KEY=clave)
+
+    def test_reintento_repite_la_respuesta_sin_volver_a_transferir(self):
+        primera = self.transferir(self.datos)
+        with self.assertNumQueries(1):
+            segunda = self.transferir(self.datos)
+
+        self.assertEqual((primera.status_code, segunda.status_code), (200, 200))
+        self.assertEqual(segunda.json(), primera.json())
+        self.assertEqual(segunda['Idempotent-Replayed'], 'true')
+        self.assertEqual(Transferencia.objects.count(), 1)
+        self.cuenta_juan.refresh_from_db()
+        self.assertEqual(self.cuenta_juan.saldo, Decimal('70.00'))
+
+    def test_misma_clave_con_otra_solicitud_es_rechazada(self):
+        self.transferir(self.datos)
+        respuesta = self.transferir({**self.datos, 'monto': '31.00'})
+
+        self.assertEqual(respuesta.status_code, 422)
+
+    def test_errores_de_negocio_tambien_se_repiten(self):
+        datos = {**self.datos, 'monto': '1000.00'}
+        self.assertEqual(self.transferir(datos).status_code, 400)
+        self.assertEqual(self.transferir(datos)['Idempotent-Replayed'], 'true')
+
+    def test_un_limite_de_velocidad_no_se_guarda_y_el_reintento_vuelve_a_ejecutarse(self):
+        regla = {'NOMBRE': 'transferencias_por_minuto', 'MEDIDA': 'cantidad', 'VENTANA': 60, 'LIMITE': 0}
+        cache.clear()
+        with override_settings(FRAUDE={**settings.FRAUDE, 'REGLAS': [regla]}):
+            self.assertEqual(self.transferir(self.datos).status_code, 429)
+        self.assertFalse(ClaveIdempotencia.objects.exists())
+
+        respuesta = self.transferir(self.datos)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertNotIn('Idempotent-Replayed', respuesta)
+        self.assertEqual(Transferencia.objects.count(), 1)
+
+    @override_settings(IDEMPOTENCIA_RESERVA=0)
+    def test_reserva_abandonada_se_retoma(self):
+        ClaveIdempotencia.objects.create(usuario=self.juan, clave='clave-1', huella=huella_de(self.datos))
+
+        self.assertEqual(self.transferir(self.datos).status_code, 200)
+        self.assertEqual(Transferencia.objects.count(), 1)
+
+    def test_la_solicitud_original_no_confirma_si_otra_retomo_la_reserva(self):
+        def retomada_durante_el_debito(*args):
+            # Simula otra solicitud que retoma la reserva mientras esta sigue ejecutándose
+            ClaveIdempotencia.objects.update(creada_en=timezone.now() + timedelta(seconds=1))
+            return debitar(*args)
+
+        with mock.patch('accounts.services.debitar', side_effect=retomada_durante_el_debito):
+            respuesta = self.transferir(self.datos)
+
+        self.assertEqual(respuesta.status_code, 409)
+        self.assertFalse(Transferencia.objects.exists())
+        self.assertEqual(CuentaBancaria.objects.get(pk=self.cuenta_juan.pk).saldo, Decimal('100.00'))
+        # La reserva sigue siendo de la solicitud que la retomó
+        self.assertEqual(ClaveIdempotencia.objects.get().estado, ClaveIdempotencia.EN_CURSO)
+
+
+class RealizarTransferenciaLoteTests(TestCase):
+    def setUp(self):
+        self.juan, (self.cuenta_juan,) = crear_cliente('juan', Decimal('100.00'))
+        self.destinos = [crear_cliente(f'destino{i}', Decimal('0.00'))[1][0] for i in range(20)]
+        Token.objects.create(cliente=self.juan, token='123456')
+        self.client = APIClient()
+        self.client.force_authenticate(self.juan)
+
+    def transferir_lote(self, tramos, modo='todo_o_nada'):
+        return self.client.post('/api/transferencia/lote/', {
+            'cuenta_origen': self.cuenta_juan.numero,
+            'token': '123456',
+            'modo': modo,
+            'transferencias': tramos,
+        }, format='json')
+
+    def test_lote_completo_debita_una_vez_y_acredita_cada_destino(self):
+        tramos = [{'cuenta_destino': cuenta.numero, 'monto': '2.50'} for cuenta in self.destinos]
+        tramos.append({'cuenta_destino': self.destinos[0].numero, 'monto': '1.00'})
+
+        respuesta = self.transferir_lote(tramos)
+
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertTrue(all(r['estado'] == 'realizada' for r in respuesta.data['resultados']))
+        self.cuenta_juan.refresh_from_db()
+        self.assertEqual(self.cuenta_juan.saldo, Decimal('49.00'))
+        self.assertEqual(CuentaBancaria.objects.get(pk=self.destinos[0].pk).saldo, Decimal('3.50'))
+        self.assertEqual(Transferencia.objects.count(), 21)
+        self.assertFalse(Token.objects.get().es_valido)
+
+    def test_todo_o_nada_revierte_si_un_tramo_falla(self):
+        tramos = [{'cuenta_destino': self.destinos[0].numero, 'monto': '10.00'},
+                  {'cuenta_destino': 'no-existe', 'monto': '10.00'}]
+
+        respuesta = self.transferir_lote(tramos)
+
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertEqual([r['estado'] for r in respuesta.data['resultados']], ['realizada', 'rechazada'])
+        self.assertFalse(Transferencia.objects.exists())
+        self.assertTrue(Token.objects.get().es_valido)
+
+    def test_mejor_esfuerzo_aplica_los_tramos_validos(self):
+        tramos = [{'cuenta_destino': self.destinos[0].numero, 'monto': '60.00'},
+                  {'cuenta_destino': self.destinos[1].numero, 'monto': '60.00'},
+                  {'cuenta_destino': self.destinos[2].numero, 'monto': '-1'}]
+
+        respuesta = self.transferir_lote(tramos, modo='mejor_esfuerzo')
+
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual([r['estado'] for r in respuesta.data['resultados']],
+                         ['realizada', 'rechazada', 'rechazada'])
+        self.cuenta_juan.refresh_from_db()
+        self.assertEqual(self.cuenta_juan.saldo, Decimal('40.00'))
+        self.assertEqual(Transferencia.objects.count(), 1)
+
+    def test_rechaza_cuentas_destino_que_no_son_texto(self):
+        tramos = [{'cuenta_destino': self.destinos[0].numero, 'monto': '10.00'},
+                  {'cuenta_destino': ['destino1-0'], 'monto': '10.00'},
+                  {'cuenta_destino': {'numero': 'destino2-0'}, 'monto': '10.00'},
+                  {'monto': '10.00'}]
+
+        respuesta = self.transferir_lote(tramos, modo='mejor_esfuerzo')
+
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual([r['estado'] for r in respuesta.data['resultados']],
+                         ['realizada', 'rechazada', 'rechazada', 'rechazada'])
+        self.assertEqual(respuesta.data['resultados'][1]['error'], 'La cuenta de destino no es válida')
+        self.assertEqual(Transferencia.objects.count(), 1)
+
+    def test_consultas_constantes_sin_importar_el_tamano_del_lote(self):
+        # origen, destinos IN, bloqueo, token, débito, crédito CASE, bulk_create de transferencias y del libro,
+        # lectura e inserción de resúmenes diarios, eventos de la bandeja de salida (+ savepoint del test)
+        tramos = [{'cuenta_destino': cuenta.numero, 'monto': '1.00'} for cuenta in self.destinos]
+        with self.assertNumQueries(13):
+            self.assertEqual(self.transferir_lote(tramos).status_code, 200)
+
+
+class BuscarContactosTests(TestCase):
+    def setUp(self):
+        self.juan, (self.cuenta_juan,) = crear_cliente('juan', Decimal('0'))
+        for nombre in ('ana', 'andres', 'beatriz', 'anibal'):
+            _, (cuenta,) = crear_cliente(nombre, Decimal('0'))
+            Contacto.objects.create(usuario=self.juan, cuenta_bancaria=cuenta)
+        self.client = APIClient()
+        self.client.force_authenticate(self.juan)
+
+    def buscar(self, **parametros):
+        respuesta = self.client.get('/api/contactos/buscar/', parametros)
+        self.assertEqual(respuesta.status_code, 200)
+        return respuesta.json()
+
+    def test_prefijo_de_dueno_o_numero_paginado_por_cursor(self):
+        pagina = self.buscar(q='AN', limite=2)
+        self.assertEqual([c['nombre'] for c in pagina['contactos']], ['ana', 'andres'])
+        resto = self.buscar(q='AN', limite=2, cursor=pagina['siguiente'])
+        self.assertEqual(resto, {'contactos': [{'nombre': 'anibal', 'numero': 'anibal-0'}], 'siguiente': None})
+        self.assertEqual(self.buscar(q='beatriz-')['contactos'], [{'nombre': 'beatriz', 'numero': 'beatriz-0'}])
+        self.assertEqual(len(self.buscar()['contactos']), 4)
+
+    def test_una_consulta_por_pagina_y_parametros_invalidos(self):
+        with self.assertNumQueries(1):
+            self.client.get('/api/contactos/buscar/', {'q': 'a'})
+        self.assertEqual(self.client.get('/api/contactos/buscar/', {'cursor': '%%%'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/contactos/buscar/', {'limite': 0}).status_code, 400)
+
+    def test_contacto_unico_y_copias_al_dia(self):
+        contacto = Contacto.objects.get(usuario=self.juan, nombre='ana')
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Contacto.objects.create(usuario=self.juan, cuenta_bancaria=contacto.cuenta_bancaria)
+
+        ana = contacto.cuenta_bancaria.usuario
+        ana.username = 'ana-maria'
+        ana.save()
+        cuenta = contacto.cuenta_bancaria
+        cuenta.numero = '999'
+        cuenta.save()
+        contacto.refresh_from_db()
+        self.assertEqual((contacto.nombre, contacto.numero), ('ana-maria', '999'))
+
+    def test_cambiar_la_cuenta_del_contacto_recalcula_las_copias(self):
+        contacto = Contacto.objects.get(usuario=self.juan, nombre='ana')
+        _, (cuenta_nueva,) = crear_cliente('carla', Decimal('0'))
+        contacto.cuenta_bancaria = cuenta_nueva
+        contacto.save()
+
+        self.assertEqual(Contacto.objects.filter(pk=contacto.pk).values_list('nombre', 'numero').get(),
+                         ('carla', 'carla-0'))
+
+
+class TokensClienteTests(TestCase):
+    def setUp(self):
+        self.juan, _ = crear_cliente('juan')
+        ahora = timezone.now()
+        for i in range(5):
+            token = Token.objects.create(cliente=self.juan, token=f'{i:06d}')
+            Token.objects.filter(pk=token.pk).update(generado_en=ahora - timedelta(days=i * 20))
+        self.client = APIClient()
+        self.client.force_authenticate(self.juan)
+
+    def test_listado_paginado_calcula_la_expiracion_sin_escribir(self):
+        with self.assertNumQueries(1):
+            datos = self.client.get('/api/obtener_tokens_cliente/', {'limite': 3}).json()
+
+        # Del generado más recientemente al más antiguo, no por id
+        self.assertEqual([t['token'] for t in datos['tokens']], ['000000', '000001', '000002'])
+        self.assertEqual([t['es_valido'] for t in datos['tokens']], [True, False, False])
+        self.assertEqual(Token.objects.filter(es_valido=True).count(), 5)
+
+        datos = self.client.get('/api/obtener_tokens_cliente/', {'limite': 3, 'antes': datos['siguiente']}).json()
+        self.assertEqual([t['token'] for t in datos['tokens']], ['000003', '000004'])
+        self.assertIsNone(datos['siguiente'])
+        self.assertEqual(self.client.get('/api/obtener_tokens_cliente/', {'antes': '%%%'}).status_code, 400)
+
+    def test_purge_tokens_elimina_por_lotes_fuera_de_la_retencion(self):
+        call_command('purge_tokens', dias=30, lote=1, stdout=StringIO())
+
+        self.assertEqual(sorted(Token.objects.values_list('token', flat=True)), ['000000', '000001'])
+
+    def test_particionar_recrea_los_indices_del_modelo(self):
+        from .management.commands.purge_tokens import INDICES
+
+        # El listado por cursor de obtener_tokens_cliente depende de token_cliente_generado_idx
+        self.assertEqual(INDICES['token_cliente_generado_idx'], 'cliente_id, generado_en, id')
+        self.assertEqual(set(INDICES), {indice.name for indice in Token._meta.indexes})
+
+
+class JSONRapidoTests(TestCase):
+    def test_todos_los_motores_producen_el_mismo_json(self):
+        fecha = datetime(2024, 5, 1, 12, 30, 15, 250000, tzinfo=dt_timezone.utc)
+        datos = {'saldo': Decimal('1500.00'), 'fecha': fecha, 'dia': fecha.date(), 'usado_en': None, 'nombre': 'Núñez'}
+        esperado = ('{"saldo":"1500.00","fecha":"2024-05-01T12:30:15.250000+00:00","dia":"2024-05-01",'
+                    '"usado_en":null,"nombre":"Núñez"}').encode()
+        for motor in json_rapido.MOTORES:
+            with self.subTest(motor=motor), override_settings(JSON_MOTOR=motor):
+                try:
+                    json_rapido.motor()
+                except ImproperlyConfigured:
+                    continue  # No instalado
+                self.assertEqual(json_rapido.dumps(datos), esperado)
+                self.assertEqual(json_rapido.loads(esperado)['saldo'], '1500.00')
+
+    def test_fechas_de_tokens_en_iso_8601(self):
+        juan, _ = crear_cliente('juan')
+        token = Token.objects.create(cliente=juan, token='000001')
+        cliente = APIClient()
+        cliente.force_authenticate(juan)
+
+        datos = cliente.get('/api/obtener_tokens_cliente/').json()
+
+        self.assertEqual(parse_datetime(datos['tokens'][0]['generado_en']), token.generado_en)
+
+    def test_cuerpo_json_invalido_responde_400(self):
+        juan, _ = crear_cliente('juan')
+        cliente = APIClient()
+        cliente.force_authenticate(juan)
+
+        respuesta = cliente.post('/api/transferencia/lote/', '{"cuenta_origen": ', content_type='application/json')
+
+        self.assertEqual(respuesta.status_code, 400)
+
+    def test_solo_las_vistas_de_accounts_usan_el_renderer_rapido(self):
+        from rest_framework.renderers import JSONRenderer
+        from rest_framework.settings import api_settings
+        from .views import CustomTokenObtainPairView, obtener_historial
+
+        self.assertIn(JSONRenderer, api_settings.DEFAULT_RENDERER_CLASSES)
+        for vista in (obtener_historial.cls, CustomTokenObtainPairView):
+            self.assertIn(json_rapido.JSONRapidoRenderer, vista.renderer_classes)
+            self.assertIn(json_rapido.JSONRapidoParser, vista.parser_classes)
+            self.assertNotIn(JSONRenderer, vista.renderer_classes)
+
+
+@override_settings(TOKENS_ALMACEN={'BACKEND': 'accounts.tokens.AlmacenTokensCache'})
+class AlmacenTokensCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.juan, (self.cuenta_juan,) = crear_cliente('juan', Decimal('100.00'))
+        self.maria, (self.cuenta_maria,) = crear_cliente('maria', Decimal('50.00'))
+        self.client = APIClient()
+        self.client.force_authenticate(self.juan)
+
+    def test_generar_token_no_escribe_en_la_base_de_datos(self):
+        with self.assertNumQueries(0):
+            primero = self.client.get('/api/generarToken/').data
+            segundo = self.client.get('/api/generarToken/').data
+
+        self.assertEqual(primero['token'], segundo['token'])
+        self.assertFalse(Token.objects.exists())
+
+    def test_transferencia_consume_el_token_una_sola_vez(self):
+        token = self.client.get('/api/generarToken/').data['token']
+        datos = {'cuenta_origen': self.cuenta_juan.numero, 'cuenta_destino': self.cuenta_maria.numero,
+                 'monto': '10.00', 'token': token}
+
+        self.assertEqual(self.client.post('/api/transferencia/', datos, format='json').status_code, 200)
+        self.assertEqual(self.client.post('/api/transferencia/', datos, format='json').status_code, 400)
+        self.cuenta_juan.refresh_from_db()
+        self.assertEqual(self.cuenta_juan.saldo, Decimal('90.00'))
+
+    def test_consumo_concurrente_solo_gana_uno(self):
+        almacen = obtener_almacen()
+        token, _ = almacen.emitir(self.juan)
+        resultados = []
+        hilos = [threading.Thread(target=lambda: resultados.append(almacen.consumir(self.juan, token)))
+                 for _ in range(16)]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+
+        self.assertEqual(resultados.count(True), 1)
+
+    def test_un_deadlock_reintentado_no_pierde_el_token(self):
+        causa = Exception('deadlock detected')
+        causa.pgcode = '40P01'
+        deadlock = OperationalError('40P01')
+        deadlock.__cause__ = causa
+        fallos = [deadlock]
+
+        def debitar_con_deadlock(*args):
+            if fallos:
+                raise fallos.pop()
+            return debitar(*args)
+
+        token = self.client.get('/api/generarToken/').data['token']
+        with mock.patch('accounts.services.debitar', side_effect=debitar_con_deadlock):
+            respuesta = self.client.post('/api/transferencia/', {
+                'cuenta_origen': self.cuenta_juan.numero, 'cuenta_destino': self.cuenta_maria.numero,
+                'monto': '10.00', 'token': token}, format='json')
+
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(fallos, [])
+        self.assertEqual(CuentaBancaria.objects.get(pk=self.cuenta_juan.pk).saldo, Decimal('90.00'))
+        # El token se consumió en el intento confirmado y no queda disponible
+        self.assertFalse(obtener_almacen().consumir(self.juan, token))
+
+    def test_el_token_se_devuelve_si_la_transaccion_falla(self):
+        token = self.client.get('/api/generarToken/').data['token']
+        with mock.patch('accounts.services.acreditar', side_effect=IntegrityError('fallo')):
+            with self.assertRaises(IntegrityError):
+                transferir(self.juan, self.cuenta_juan.numero, self.cuenta_maria.numero, Decimal('10.00'), '', token)
+
+        self.assertTrue(obtener_almacen().consumir(self.juan, token))
+
+
+@override_settings(LECTURAS_CACHE={'BACKEND': 'local', 'TTL': 30, 'MAXIMO': 2})
+class CacheLecturasTests(TestCase):
+    def setUp(self):
+        self.juan, (self.cuenta_juan,) = crear_cliente('juan', Decimal('100.00'))
+        self.maria, (self.cuenta_maria,) = crear_cliente('maria', Decimal('50.00'))
+        Contacto.objects.create(usuario=self.juan, cuenta_bancaria=self.cuenta_maria)
+        self.client = APIClient()
+        self.client.force_authenticate(self.juan)
+
+    def test_segunda_lectura_sale_de_la_cache_y_etag_devuelve_304(self):
+        primera = self.client.get('/api/obtener_cuenta_origen/')
+        aciertos = estadisticas()['cuentas']['aciertos']
+        with self.assertNumQueries(0):
+            segunda = self.client.get('/api/obtener_cuenta_origen/')
+            no_modificada = self.client.get('/api/obtener_cuenta_origen/', HTTP_IF_NONE_MATCH=primera['ETag'])
+
+        self.assertEqual(primera.json(), {'cuentas': [{'numero': 'juan-0', 'tipo': 'Ahorro', 'saldo': '100.00'}]})
+        self.assertEqual(segunda.content, primera.content)
+        self.assertEqual(no_modificada.status_code, 304)
+        self.assertEqual(estadisticas()['cuentas']['aciertos'], aciertos + 2)
+
+    def test_transferencia_invalida_las_cuentas_de_ambos_usuarios(self):
+        etag = self.client.get('/api/obtener_cuenta_origen/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            Token.objects.create(cliente=self.juan, token='123456')
+            transferir(self.juan, 'juan-0', 'maria-0', Decimal('10.00'), '', '123456')
+
+        respuesta = self.client.get('/api/obtener_cuenta_origen/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.json()['cuentas'][0]['saldo'], '90.00')
+
+    def test_nuevo_contacto_invalida_la_lista_de_contactos(self):
+        self.assertEqual(len(self.client.get('/api/obtener_contactos/').json()['contactos']), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            _, (otra,) = crear_cliente('ana', Decimal('0'))
+            Contacto.objects.create(usuario=self.juan, cuenta_bancaria=otra)
+
+        self.assertEqual(len(self.client.get('/api/obtener_contactos/').json()['contactos']), 2)
+
+    def test_una_lectura_anterior_al_commit_no_queda_vigente(self):
+        def construir_antes_de_la_transferencia():
+            datos = {'cuentas': [{'numero': 'juan-0', 'tipo': 'Ahorro', 'saldo': '100.00'}]}
+            # La transferencia confirma e invalida mientras esta lectura todavía no guardó su entrada
+            with self.captureOnCommitCallbacks(execute=True):
+                Token.objects.create(cliente=self.juan, token='123456')
+                transferir(self.juan, 'juan-0', 'maria-0', Decimal('10.00'), '', '123456')
+            return datos
+
+        request = RequestFactory().get('/api/obtener_cuenta_origen/')
+        request.user = self.juan
+        respuesta_cacheada(request, CUENTAS, construir_antes_de_la_transferencia)
+
+        self.assertEqual(self.client.get('/api/obtener_cuenta_origen/').json()['cuentas'][0]['saldo'], '90.00')
+
+    def test_la_cache_local_descarta_la_entrada_menos_usada(self):
+        lru = obtener_cache()
+        lru.set('a', 1)
+        lru.set('b', 2)
+        lru.get('a')
+        lru.set('c', 3)
+
+        self.assertEqual((lru.get('a'), lru.get('b'), lru.get('c')), (1, None, 3))
+
+
+@override_settings(LECTURAS_CACHE={'BACKEND': 'local', 'TTL': 0})
+class PresupuestoConsultasTests(TestCase):
+    # Cada endpoint debe hacer el mismo número de consultas con 1 o con 30 filas: sin N+1
+
+    def poblar(self, username, filas):
+        usuario, (cuenta,) = crear_cliente(username, Decimal('1000.00'))
+        for i in range(filas):
+            _, (otra,) = crear_cliente(f'{username}-contacto{i}', Decimal('0'))
+            Contacto.objects.create(usuario=usuario, cuenta_bancaria=otra)
+            Token.objects.create(cliente=usuario, token=f'{i:06d}')
+            Transferencia.objects.create(cuenta_origen=cuenta, cuenta_destino=otra, monto=1)
+            Transferencia.objects.create(cuenta_origen=otra, cuenta_destino=cuenta, monto=1)
+        return usuario, cuenta
+
+    def consultas(self, cliente, url, parametros=None):
+        with CaptureQueriesContext(connection) as contexto:
+            respuesta = cliente.get(url, parametros)
+        self.assertEqual(respuesta.status_code, 200, url)
+        return len(contexto)
+
+    def assertConsultasConstantes(self, url, parametros=lambda cuenta: None):
+        conteos = []
+        for filas in (1, 30):
+            usuario, cuenta = self.poblar(f'u{filas}{len(url)}', filas)
+            cliente = APIClient()
+            cliente.force_authenticate(usuario)
+            conteos.append(self.consultas(cliente, url, parametros(cuenta)))
+        self.assertEqual(conteos[0], conteos[1], url)
+
+    def test_endpoints_de_lectura(self):
+        self.assertConsultasConstantes('/api/obtener_cuenta_origen/')
+        self.assertConsultasConstantes('/api/obtener_contactos/')
+        self.assertConsultasConstantes('/api/obtener_tokens_cliente/')
+        self.assertConsultasConstantes('/api/historial/', lambda cuenta: {'cuenta': cuenta.numero})
+
+    def test_medir_cuenta_consultas_y_comparar_detecta_regresiones(self):
+        usuario, _ = self.poblar('medido', 3)
+        cliente = APIClient()
+        cliente.force_authenticate(usuario)
+        medicion = medir(lambda: cliente.get('/api/obtener_tokens_cliente/'), 5, muestras_memoria=2)
+        self.assertEqual(medicion['consultas'], 1)
+        self.assertGreater(medicion['memoria_kb'], 0)
+
+        resultados = {'100': {'tokens': medicion}}
+        base = {'100': {'tokens': {'consultas': 1, 'p99_ms': medicion['p99_ms'], 'memoria_kb': 1e9}}}
+        self.assertEqual(comparar(resultados, base, tolerancia=0.5), [])
+        # Una consulta extra no tiene tolerancia; la latencia sí
+        base['100']['tokens'].update(consultas=0, p99_ms=medicion['p99_ms'] / 1.4)
+        self.assertEqual(comparar(resultados, base, tolerancia=0.5), ['100 tokens: 1 consultas (base 0)'])
+
+    def test_medir_prepara_fuera_de_la_medicion(self):
+        usuario, _ = self.poblar('preparado', 1)
+        emitidos = []
+        medicion = medir(lambda token: emitidos.append(token), 3, muestras_memoria=1,
+                         preparar=lambda: Token.objects.create(cliente=usuario, token='000000').token)
+
+        self.assertEqual(medicion['consultas'], 0)
+        self.assertEqual(emitidos, ['000000'] * 4)
+
+    def assertListadoAdminConstante(self, modelo):
+        # Ambos tamaños caben en una página del listado (list_per_page = 50)
+        admin = User.objects.create_superuser('admin', 'admin@ejemplo.com', 'password.3')
+        cliente = Client()
+        cliente.force_login(admin)
+        url = f'/admin/accounts/{modelo}/'
+        self.poblar('pocos', 1)
+        pocos = self.consultas(cliente, url)
+        self.poblar('muchos', 20)
+        self.assertEqual(self.consultas(cliente, url), pocos, url)
+
+    def test_admin_tokens(self):
+        self.assertListadoAdminConstante('token')
+
+    def test_admin_cuentas(self):
+        self.assertListadoAdminConstante('cuentabancaria')
+
+    def test_admin_contactos(self):
+        self.assertListadoAdminConstante('contacto')
+
+    def test_admin_transferencias(self):
+        self.assertListadoAdminConstante('transferencia')
+
+
+@override_settings(LECTURAS_CACHE={'BACKEND': 'local', 'TTL': 0})
+class VistasAsyncTests(TestCase):
+    def setUp(self):
+        self.juan, (self.cuenta_juan,) = crear_cliente('juan', Decimal('100.00'))
+        self.maria, (self.cuenta_maria,) = crear_cliente('maria', Decimal('50.00'))
+        Contacto.objects.create(usuario=self.juan, cuenta_bancaria=self.cuenta_maria)
+        Token.objects.create(cliente=self.juan, token='123456')
+        acceso = CustomTokenObtainPairSerializer.get_token(self.juan).access_token
+        self.headers = {'Authorization': f'Bearer {acceso}'}
+
+    async def test_respuestas_iguales_a_las_vistas_sincronas(self):
+        for ruta in ('obtener_cuenta_origen', 'obtener_contactos', 'obtener_tokens_cliente', 'generarToken'):
+            sincrona = await self.async_client.get(f'/api/{ruta}/', headers=self.headers)
+            asincrona = await self.async_client.get(f'/api/async/{ruta}/', headers=self.headers)
+            self.assertEqual(asincrona.status_code, 200, ruta)
+            self.assertEqual(asincrona.json(), sincrona.json(), ruta)
+
+    async def test_sin_token_o_con_token_invalido_responde_401(self):
+        self.assertEqual((await self.async_client.get('/api/async/obtener_contactos/')).status_code, 401)
+        respuesta = await self.async_client.get('/api/async/obtener_contactos/',
+                                                headers={'Authorization': 'Bearer no-es-un-jwt'})
+        self.assertEqual(respuesta.status_code, 401)
+
+
+@override_settings(LECTURAS_CACHE={'BACKEND': 'local', 'TTL': 0})
+class JWTLecturaTests(TestCase):
+    def setUp(self):
+        tokens_verificados().entradas.clear()
+        self.juan, (self.cuenta_juan,) = crear_cliente('juan', Decimal('100.00'))
+        self.acceso = CustomTokenObtainPairSerializer.get_token(self.juan).access_token
+        self.client = APIClient()
+
+    def test_lecturas_sin_consultar_el_usuario(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.acceso}')
+
+        # Solo la consulta de las cuentas: ni auth_user ni token_blacklist
+        with self.assertNumQueries(1):
+            respuesta = self.client.get('/api/obtener_cuenta_origen/')
+        self.assertEqual(respuesta.json()['cuentas'][0]['numero'], self.cuenta_juan.numero)
+
+        self.assertIsNotNone(tokens_verificados().get(hashlib.sha256(str(self.acceso).encode()).digest()))
+
+    def test_la_firma_de_un_token_verificado_no_sirve_con_otro_payload(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.acceso}')
+        self.assertEqual(self.client.get('/api/obtener_contactos/').status_code, 200)
+
+        cabecera, _, firma = str(self.acceso).split('.')
+        otro = CustomTokenObtainPairSerializer.get_token(crear_cliente('maria')[0]).access_token
+        falso = '.'.join([cabecera, str(otro).split('.')[1], firma])
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {falso}')
+        self.assertEqual(self.client.get('/api/obtener_contactos/').status_code, 401)
+
+    def test_token_expirado_se_rechaza_aunque_este_en_cache(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.acceso}')
+        self.assertEqual(self.client.get('/api/obtener_contactos/').status_code, 200)
+
+        despues = timezone.now() + timedelta(days=1)
+        with mock.patch('accounts.authentication.time.time', return_value=despues.timestamp()), \
+                mock.patch('rest_framework_simplejwt.tokens.aware_utcnow', return_value=despues):
+            self.assertEqual(self.client.get('/api/obtener_contactos/').status_code, 401)
+
+    def test_escrituras_siguen_cargando_el_usuario(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.acceso}')
+        self.assertEqual(self.client.get('/api/generarToken/').status_code, 200)
+        self.assertEqual(Token.objects.get().cliente, self.juan)
+
+
+class HistorialTests(TestCase):
+    def setUp(self):
+        self.juan, (self.cuenta_juan,) = crear_cliente('juan', Decimal('100.00'))
+        self.maria, (self.cuenta_maria,) = crear_cliente('maria', Decimal('100.00'))
+        fecha = timezone.now()
+        for i in range(15):
+            origen, destino = (self.cuenta_juan, self.cuenta_maria) if i % 3 else (self.cuenta_maria, self.cuenta_juan)
+            transferencia = Transferencia.objects.create(cuenta_origen=origen, cuenta_destino=destino, monto=i + 1)
+            # Varias transferencias comparten fecha para ejercitar el desempate por id del cursor
+            Transferencia.objects.filter(pk=transferencia.pk).update(fecha=fecha - timedelta(minutes=i // 2))
+        self.client = APIClient()
+        self.client.force_authenticate(self.juan)
+
+    def test_paginas_por_cursor_recorren_todo_el_historial_una_vez(self):
+        vistos, cursor = [], None
+        while True:
+            parametros = {'cuenta': self.cuenta_juan.numero, 'limite': 4}
+            if cursor:
+                parametros['cursor'] = cursor
+            datos = self.client.get('/api/historial/', parametros).json()
+            vistos += datos['movimientos']
+            cursor = datos['siguiente']
+            if cursor is None:
+                break
+
+        esperados = Transferencia.objects.order_by('-fecha', '-id').values_list('id', flat=True)
+        self.assertEqual([m['id'] for m in vistos], list(esperados))
+        self.assertEqual({m['tipo'] for m in vistos}, {'entrada', 'salida'})
+        self.assertTrue(all(m['cuenta'] == self.cuenta_maria.numero for m in vistos))
+
+    def test_cuenta_ajena_no_es_visible(self):
+        respuesta = self.client.get('/api/historial/', {'cuenta': self.cuenta_maria.numero})
+        self.assertEqual(respuesta.status_code, 404)
+
+    def test_exportar_csv_en_streaming(self):
+        respuesta = self.client.get('/api/historial/exportar/', {'cuenta': self.cuenta_juan.numero, 'formato': 'csv'})
+
+        self.assertTrue(respuesta.streaming)
+        lineas = b''.join(respuesta.streaming_content).decode().splitlines()
+        self.assertEqual(lineas[0], 'id,fecha,tipo,cuenta,monto,motivo')
+        self.assertEqual(len(lineas), 16)
+
+    def test_exportar_json_en_streaming(self):
+        respuesta = self.client.get('/api/historial/exportar/', {'cuenta': self.cuenta_juan.numero})
+
+        datos = json.loads(b''.join(respuesta.streaming_content))
+        self.assertEqual(len(datos['movimientos']), 15)
+
+    def test_exportar_con_fecha_imposible_responde_400(self):
+        respuesta = self.client.get('/api/historial/exportar/', {'cuenta': self.cuenta_juan.numero,
+                                                                 'desde': '2024-13-01T00:00'})
+        self.assertEqual(respuesta.status_code, 400)
+
+
+class ResumenDiarioTests(TestCase):
+    def setUp(self):
+        self.juan, (self.cuenta_juan,) = crear_cliente('juan', Decimal('1000.00'))
+        self.maria, (self.cuenta_maria,) = crear_cliente('maria', Decimal('1000.00'))
+        self.pedro, (self.cuenta_pedro,) = crear_cliente('pedro', Decimal('1000.00'))
+        self.client = APIClient()
+        self.client.force_authenticate(self.juan)
+
+    def filas(self):
+        return sorted(ResumenDiario.objects.values_list('cuenta_id', 'dia', 'contraparte_id', 'entradas', 'salidas',
+                                                        'n_entradas', 'n_salidas'))
+
+    def test_los_incrementos_coinciden_con_la_reconstruccion(self):
+        transferir(self.juan, self.cuenta_juan.numero, self.cuenta_maria.numero, Decimal('10.00'), '',
+                   Token.objects.create(cliente=self.juan, token='000001').token)
+        transferir(self.maria, self.cuenta_maria.numero, self.cuenta_juan.numero, Decimal('4.00'), '',
+                   Token.objects.create(cliente=self.maria, token='000002').token)
+        transferir_lote(self.juan, self.cuenta_juan.numero,
+                        [{'cuenta_destino': self.cuenta_maria.numero, 'monto': '1.50'},
+                         {'cuenta_destino': self.cuenta_pedro.numero, 'monto': '2.00'}],
+                        Token.objects.create(cliente=self.juan, token='000003').token)
+        incrementales = self.filas()
+        self.assertEqual(len(incrementales), 4)
+
+        resumenes.reconstruir(timezone.localdate(), timezone.localdate(), 0, self.cuenta_pedro.id + 1)
+        self.assertEqual(self.filas(), incrementales)
+
+    def test_resumen_combina_dias_anteriores_y_hoy(self):
+        hoy = timezone.localdate()
+        antes = Transferencia.objects.create(cuenta_origen=self.cuenta_juan, cuenta_destino=self.cuenta_pedro,
+                                             monto=Decimal('30.00'))
+        Transferencia.objects.filter(pk=antes.pk).update(fecha=timezone.now() - timedelta(days=40))
+        call_command('rebuild_rollups', stdout=StringIO())
+        transferir(self.maria, self.cuenta_maria.numero, self.cuenta_juan.numero, Decimal('5.00'), '',
+                   Token.objects.create(cliente=self.maria, token='000001').token)
+
+        parametros = {'cuenta': self.cuenta_juan.numero, 'desde': (hoy - timedelta(days=60)).isoformat()}
+        with self.assertNumQueries(6):  # cuenta, meses, contrapartes, salidas y entradas de hoy, números
+            datos = self.client.get('/api/resumen/', parametros).json()
+
+        self.assertEqual(datos['meses'][-1], {'mes': hoy.strftime('%Y-%m'), 'entradas': '5.00', 'salidas': '0.00',
+                                              'n_entradas': 1, 'n_salidas': 0})
+        self.assertEqual(sum(Decimal(mes['salidas']) for mes in datos['meses']), Decimal('30.00'))
+        self.assertEqual([c['numero'] for c in datos['contrapartes']],
+                         [self.cuenta_pedro.numero, self.cuenta_maria.numero])
+
+    def test_reconstruye_varios_dias_por_bloques_de_cuentas(self):
+        ayer = timezone.localdate() - timedelta(days=1)
+        for origen, destino, monto, dias in ((self.cuenta_juan, self.cuenta_maria, '10.00', 2),
+                                             (self.cuenta_juan, self.cuenta_maria, '5.00', 2),
+                                             (self.cuenta_maria, self.cuenta_juan, '3.00', 2),
+                                             (self.cuenta_pedro, self.cuenta_juan, '7.00', 1)):
+            transferencia = Transferencia.objects.create(cuenta_origen=origen, cuenta_destino=destino,
+                                                         monto=Decimal(monto))
+            Transferencia.objects.filter(pk=transferencia.pk).update(fecha=timezone.now() - timedelta(days=dias))
+
+        call_command('rebuild_rollups', lote=2, stdout=StringIO())
+
+        antier = ayer - timedelta(days=1)
+        juan, maria, pedro = self.cuenta_juan.id, self.cuenta_maria.id, self.cuenta_pedro.id
+        self.assertEqual([fila for fila in self.filas() if fila[1] >= antier], sorted([
+            (juan, antier, maria, Decimal('3.00'), Decimal('15.00'), 1, 2),
+            (maria, antier, juan, Decimal('15.00'), Decimal('3.00'), 2, 1),
+            (juan, ayer, pedro, Decimal('7.00'), Decimal('0.00'), 1, 0),
+            (pedro, ayer, juan, Decimal('0.00'), Decimal('7.00'), 0, 1),
+        ]))
+
+    def test_hoy_no_se_reconstruye(self):
+        with self.assertRaises(CommandError):
+            call_command('rebuild_rollups', hasta=timezone.localdate(), stdout=StringIO())
+
+
+ENTREGADOS = []
+
+
+def manejador_de_prueba(evento_id, datos):
+    if datos.get('fallar'):
+        raise ValueError('fallo de prueba')
+    ENTREGADOS.append((evento_id, datos))
+
+
+@override_settings(EVENTOS={**settings.EVENTOS, 'MANEJADORES': {
+    'transferencia_realizada': ['accounts.tests.manejador_de_prueba'],
+    'prueba': ['accounts.tests.manejador_de_prueba'],
+}, 'INTENTOS': 2})
+class BandejaSalidaTests(TestCase):
+    def setUp(self):
+        ENTREGADOS.clear()
+        self.juan, (self.cuenta_juan,) = crear_cliente('juan', Decimal('100.00'))
+        self.maria, (self.cuenta_maria,) = crear_cliente('maria', Decimal('100.00'))
+        self.pool = ThreadPoolExecutor(max_workers=2)
+        self.addCleanup(self.pool.shutdown)
+
+    def transferir(self, monto, token='000001'):
+        return transferir(self.juan, self.cuenta_juan.numero, self.cuenta_maria.numero, Decimal(monto), '',
+                          Token.objects.create(cliente=self.juan, token=token).token)
+
+    def test_el_evento_se_escribe_en_el_commit_de_la_transferencia(self):
+        transferencia = self.transferir('10.00')
+        with self.assertRaises(TransferenciaError):
+            self.transferir('500.00', token='000002')
+
+        evento = EventoPendiente.objects.get()
+        self.assertEqual(evento.datos['id'], transferencia.id)
+        self.assertEqual(evento.datos['monto'], '10.00')
+
+    def test_el_worker_entrega_y_elimina_los_eventos(self):
+        transferencia = self.transferir('10.00')
+
+        call_command('run_outbox_worker', una_vez=True, stdout=StringIO())
+
+        self.assertEqual([datos['id'] for _, datos in ENTREGADOS], [transferencia.id])
+        self.assertFalse(EventoPendiente.objects.exists())
+
+    def test_los_fallos_se_reintentan_con_espera_y_luego_se_descartan(self):
+        eventos.publicar('prueba', [{'fallar': True}, {'fallar': False}])
+
+        with self.assertLogs('accounts.auditoria', 'WARNING'):
+            self.assertEqual(eventos.procesar_lote(self.pool, 10), 2)
+        fallido = EventoPendiente.objects.get()
+        self.assertEqual(fallido.intentos, 1)
+        self.assertIn('fallo de prueba', fallido.ultimo_error)
+        self.assertGreater(fallido.disponible, timezone.now())
+        self.assertEqual(eventos.procesar_lote(self.pool, 10), 0)  # Aún en espera
+
+        EventoPendiente.objects.update(disponible=timezone.now())
+        with self.assertLogs('accounts.auditoria', 'WARNING'):
+            eventos.procesar_lote(self.pool, 10)
+        self.assertTrue(EventoPendiente.objects.get().descartado)
+        self.assertEqual(len(ENTREGADOS), 1)
+
+
+class LibroMayorTests(TestCase):
+    def setUp(self):
+        self.juan, (self.cuenta_juan,) = crear_cliente('juan', Decimal('100.00'))
+        self.maria, (self.cuenta_maria,) = crear_cliente('maria', Decimal('50.00'))
+
+    def transferir(self, usuario, origen, destino, monto):
+        valor = f'{Token.objects.count():06d}'
+        Token.objects.create(cliente=usuario, token=valor)
+        return transferir(usuario, origen.numero, destino.numero, Decimal(monto), '', valor)
+
+    def test_las_cuentas_nuevas_se_abren_en_el_libro_al_crearse(self):
+        # Sin reconcile_ledger --abrir: la apertura se escribe al crear la cuenta
+        self.transferir(self.juan, self.cuenta_juan, self.cuenta_maria, '30.00')
+        self.assertEqual(MovimientoLibro.objects.get(cuenta=self.cuenta_juan, tipo=MovimientoLibro.APERTURA).monto,
+                         Decimal('100.00'))
+        salida = StringIO()
+        call_command('reconcile_ledger', stdout=salida)
+        self.assertIn('2 cuentas revisadas, 0 con diferencias', salida.getvalue())
+
+        # Las cargadas con bulk_create (populate_db) siguen abriéndose con --abrir
+        (cargada,) = CuentaBancaria.objects.bulk_create([CuentaBancaria(numero='cargada', tipo='Ahorro',
+                                                                        saldo=Decimal('7.00'), usuario=self.juan)])
+        call_command('reconcile_ledger', abrir=True, stdout=StringIO())
+        self.assertEqual(MovimientoLibro.objects.get(cuenta_id=cargada.pk).monto, Decimal('7.00'))
+
+    def test_cada_transferencia_escribe_debito_y_credito_con_saldo_resultante(self):
+        transferencia = self.transferir(self.juan, self.cuenta_juan, self.cuenta_maria, '30.00')
+
+        movimientos = transferencia.movimientos.order_by('id').values_list('cuenta_id', 'tipo', 'monto',
+                                                                             'saldo_resultante')
+        self.assertEqual(list(movimientos), [
+            (self.cuenta_juan.id, MovimientoLibro.DEBITO, Decimal('30.00'), Decimal('70.00')),
+            (self.cuenta_maria.id, MovimientoLibro.CREDITO, Decimal('30.00'), Decimal('80.00')),
+        ])
+
+    def test_reconcile_detecta_saldos_que_no_cuadran_con_el_libro(self):
+        self.transferir(self.juan, self.cuenta_juan, self.cuenta_maria, '30.00')
+        salida = StringIO()
+        call_command('reconcile_ledger', lote=1, stdout=salida)
+        self.assertIn('2 cuentas revisadas, 0 con diferencias', salida.getvalue())
+
+        CuentaBancaria.objects.filter(pk=self.cuenta_maria.pk).update(saldo=Decimal('999.00'))
+        salida = StringIO()
+        call_command('reconcile_ledger', lote=1, stdout=salida)
+        self.assertIn(f'{self.cuenta_maria.numero}: saldo 999.00, libro 80.00', salida.getvalue())
+        self.assertIn('1 con diferencias', salida.getvalue())
+
+    def test_saldo_historico_desde_el_corte_mas_cercano(self):
+        self.transferir(self.juan, self.cuenta_juan, self.cuenta_maria, '30.00')
+        call_command('reconcile_ledger', corte=True, margen=0, stdout=StringIO())
+        antes_de_la_segunda = timezone.now()
+        self.transferir(self.maria, self.cuenta_maria, self.cuenta_juan, '5.00')
+
+        self.assertEqual(CorteSaldo.objects.get(cuenta=self.cuenta_juan).saldo, Decimal('70.00'))
+        self.assertEqual(libro.saldo_en(self.cuenta_juan.id, antes_de_la_segunda), Decimal('70.00'))
+        self.assertEqual(libro.saldo_en(self.cuenta_juan.id, timezone.now()), Decimal('75.00'))
+
+        salida = StringIO()
+        call_command('reconcile_ledger', stdout=salida)
+        self.assertIn('0 con diferencias', salida.getvalue())
+
+    def test_un_corte_interrumpido_no_deja_diferencias(self):
+        self.transferir(self.juan, self.cuenta_juan, self.cuenta_maria, '30.00')
+        call_command('reconcile_ledger', corte=True, margen=0, stdout=StringIO())
+        # Una segunda corrida con --corte que murió después del primer bloque: solo juan tiene el corte nuevo
+        self.transferir(self.maria, self.cuenta_maria, self.cuenta_juan, '5.00')
+        CorteSaldo.objects.create(cuenta=self.cuenta_juan, fecha=timezone.now(), saldo=Decimal('75.00'))
+        self.transferir(self.juan, self.cuenta_juan, self.cuenta_maria, '1.00')
+
+        salida = StringIO()
+        call_command('reconcile_ledger', stdout=salida)
+        self.assertIn('2 cuentas revisadas, 0 con diferencias', salida.getvalue())
+
+
+@override_settings(LECTURAS_CACHE={'BACKEND': 'local', 'TTL': 0})
+class CuentasFraccionadasTests(TestCase):
+    def setUp(self):
+        self.juan, (self.cuenta_juan,) = crear_cliente('juan', Decimal('100.00'))
+        self.maria, (self.cuenta_maria,) = crear_cliente('maria', Decimal('50.00'))
+        self.comercio, (self.cuenta_comercio,) = crear_cliente('comercio', Decimal('10.00'))
+        call_command('reconcile_ledger', abrir=True, stdout=StringIO())
+        call_command('shard_accounts', self.cuenta_comercio.numero, fracciones=4, stdout=StringIO())
+
+    def transferir(self, usuario, origen, destino, monto):
+        valor = f'{Token.objects.count():06d}'
+        Token.objects.create(cliente=usuario, token=valor)
+        return transferir(usuario, origen.numero, destino.numero, Decimal(monto), '', valor)
+
+    def saldo_visible(self, usuario):
+        cliente = APIClient()
+        cliente.force_authenticate(usuario)
+        return cliente.get('/api/obtener_cuenta_origen/').json()['cuentas'][0]['saldo']
+
+    def test_los_creditos_van_a_las_fracciones_y_las_lecturas_las_suman(self):
+        self.transferir(self.juan, self.cuenta_juan, self.cuenta_comercio, '30.00')
+        transferir_lote(self.maria, self.cuenta_maria.numero, [{'cuenta_destino': self.cuenta_comercio.numero,
+                                                                'monto': '20.00'}],
+                        Token.objects.create(cliente=self.maria, token='999999').token)
+
+        self.cuenta_comercio.refresh_from_db()
+        self.assertEqual(self.cuenta_comercio.saldo, Decimal('10.00'))
+        self.assertEqual(FraccionSaldo.objects.aggregate(total=Sum('saldo'))['total'], Decimal('50.00'))
+        self.assertEqual(self.saldo_visible(self.comercio), '60.00')
+        # El crédito no bloqueó al comercio: su saldo resultante no se conoce
+        self.assertIsNone(MovimientoLibro.objects.get(cuenta=self.cuenta_comercio, tipo=MovimientoLibro.CREDITO,
+                                                      monto=Decimal('30.00')).saldo_resultante)
+
+        salida = StringIO()
+        call_command('reconcile_ledger', stdout=salida)
+        self.assertIn('0 con diferencias', salida.getvalue())
+
+    def test_el_debito_barre_las_fracciones_necesarias(self):
+        self.transferir(self.juan, self.cuenta_juan, self.cuenta_comercio, '50.00')
+
+        self.transferir(self.comercio, self.cuenta_comercio, self.cuenta_maria, '45.00')
+        with self.assertRaises(TransferenciaError):
+            self.transferir(self.comercio, self.cuenta_comercio, self.cuenta_maria, '15.01')
+
+        self.assertEqual(self.saldo_visible(self.comercio), '15.00')
+        self.cuenta_maria.refresh_from_db()
+        self.assertEqual(self.cuenta_maria.saldo, Decimal('95.00'))
+
+    def test_volver_al_modo_normal_consolida_el_saldo(self):
+        self.transferir(self.juan, self.cuenta_juan, self.cuenta_comercio, '30.00')
+
+        call_command('shard_accounts', self.cuenta_comercio.numero, fracciones=0, stdout=StringIO())
+
+        self.cuenta_comercio.refresh_from_db()
+        self.assertEqual((self.cuenta_comercio.saldo, self.cuenta_comercio.fracciones), (Decimal('40.00'), 0))
+        self.assertFalse(FraccionSaldo.objects.exists())
+
+
+class FraccionarConcurrenteTests(TransactionTestCase):
+    # Los créditos corren en otro hilo, con su propia conexión: los datos tienen que estar confirmados
+    def setUp(self):
+        _, (self.cuenta,) = crear_cliente('comercio', Decimal('10.00'))
+        fracciones.fraccionar(self.cuenta.id, 4)
+        FraccionSaldo.objects.filter(cuenta=self.cuenta, indice=0).update(saldo=Decimal('30.00'))
+
+    def test_un_credito_a_una_fraccion_en_cero_durante_el_cambio_no_se_pierde(self):
+        barrer, termino, errores = fracciones.barrer, threading.Event(), []
+
+        def acreditar():
+            try:
+                fracciones.acreditar(self.cuenta.id, 4, Decimal('5.00'))
+            except Exception as error:  # pragma: no cover - se reporta en la aserción
+                errores.append(error)
+            finally:
+                connection.close()
+                termino.set()
+
+        def barrer_y_acreditar(cuenta_id, faltante=None):
+            # Tras el barrido, otro hilo acredita la fracción 3 (en cero, se va a eliminar) antes del borrado
+            movido = barrer(cuenta_id, faltante)
+            threading.Thread(target=acreditar).start()
+            termino.wait(timeout=1)
+            return movido
+
+        with mock.patch('accounts.fracciones.random.randrange', return_value=3), \
+                mock.patch('accounts.fracciones.barrer', side_effect=barrer_y_acreditar):
+            fracciones.fraccionar(self.cuenta.id, 0)
+            self.assertTrue(termino.wait(timeout=10))
+
+        self.assertEqual(errores, [])
+        self.cuenta.refresh_from_db()
+        self.assertEqual((self.cuenta.saldo, self.cuenta.fracciones), (Decimal('45.00'), 0))
+        self.assertFalse(FraccionSaldo.objects.exists())
+
+
+class ReplayWorkloadTests(TestCase):
+    def setUp(self):
+        self.juan, (self.cuenta_juan,) = crear_cliente('juan', Decimal('100.00'))
+        self.maria, (self.cuenta_maria,) = crear_cliente('maria', Decimal('50.00'))
+
+    def reproducir(self, *lineas):
+        with tempfile.NamedTemporaryFile('w', suffix='.jsonl', delete=False) as archivo:
+            archivo.write('\n'.join(lineas))
+        self.addCleanup(os.remove, archivo.name)
+        salida = StringIO()
+        call_command('replay_workload', archivo.name, procesos=0, json=True, stdout=salida)
+        return json.loads(salida.getvalue())
+
+    def test_reproduce_las_llamadas_en_orden_y_verifica_los_saldos(self):
+        transferencia = {'cuenta_origen': self.cuenta_juan.numero, 'cuenta_destino': self.cuenta_maria.numero,
+                         'monto': '30.00'}
+        reporte = self.reproducir(
+            json.dumps({'usuario': 'juan', 'ruta': '/api/generarToken/'}),
+            # Sin "token": usa el que devolvió la línea anterior
+            json.dumps({'usuario': 'juan', 'metodo': 'POST', 'ruta': '/api/transferencia/', 'datos': transferencia}),
+            json.dumps({'usuario': 'juan', 'metodo': 'POST', 'ruta': '/api/transferencia/', 'datos': transferencia}),
+            json.dumps({'usuario': 'maria', 'ruta': '/api/obtener_cuenta_origen/'}),
+            'no es json',
+        )
+
+        self.assertEqual(reporte['lineas_invalidas'], 1)
+        self.assertEqual(reporte['global']['peticiones'], 4)
+        # El token ya se usó: la segunda transferencia se rechaza
+        self.assertEqual(reporte['rutas']['/api/transferencia/']['errores'], {'400': 1})
+        self.assertEqual(reporte['invariantes']['transferencias_creadas'], 1)
+        self.assertTrue(reporte['invariantes']['ok'])
+        self.assertEqual(Decimal(reporte['invariantes']['dinero_antes']), Decimal('150.00'))
+        self.cuenta_maria.refresh_from_db()
+        self.assertEqual(self.cuenta_maria.saldo, Decimal('80.00'))
+
+    def test_las_llamadas_de_un_usuario_van_al_mismo_proceso(self):
+        from .management.commands.replay_workload import _particion
+
+        login = {'ruta': '/api/login/', 'datos': {'username': 'juan', 'password': 'x'}}
+        lectura = {'usuario': 'juan', 'ruta': '/api/historial/'}
+        self.assertEqual(_particion(login, 8), _particion(lectura, 8))
+
+
+class ReplayWorkloadProcesosTests(TransactionTestCase):
+    # Los procesos hijos usan sus propias conexiones: los datos tienen que estar confirmados
+    def setUp(self):
+        crear_cliente('juan', Decimal('100.00'))
+        crear_cliente('maria', Decimal('50.00'))
+        self.archivo = os.path.join(tempfile.mkdtemp(), 'llamadas.jsonl')
+        self.addCleanup(shutil.rmtree, os.path.dirname(self.archivo))
+        with open(self.archivo, 'w') as salida:
+            for _ in range(5):
+                for usuario in ('juan', 'maria'):
+                    salida.write(json.dumps({'usuario': usuario, 'ruta': '/api/obtener_cuenta_origen/'}) + '\n')
+
+    def test_reparte_las_llamadas_entre_procesos(self):
+        salida = StringIO()
+        call_command('replay_workload', self.archivo, procesos=2, cola=2, json=True, stdout=salida)
+
+        reporte = json.loads(salida.getvalue())
+        self.assertEqual(reporte['global']['peticiones'], 10)
+        self.assertEqual(reporte['rutas']['/api/obtener_cuenta_origen/']['errores'], {})
+        self.assertTrue(reporte['invariantes']['ok'])
+
+    def test_un_proceso_que_falla_al_arrancar_no_bloquea_al_padre(self):
+        from .management.commands.replay_workload import _Conductor
+
+        with mock.patch.object(_Conductor, '__init__', side_effect=RuntimeError('sin conexión')):
+            with self.assertRaisesMessage(CommandError, 'RuntimeError: sin conexión'):
+                call_command('replay_workload', self.archivo, procesos=2, cola=1, stdout=StringIO())
+
+
+class EstadosCuentaTests(TestCase):
+    def setUp(self):
+        self.juan, (self.cuenta_juan,) = crear_cliente('juan', Decimal('100.00'))
+        self.maria, (self.cuenta_maria,) = crear_cliente('maria', Decimal('50.00'))
+        self.ayer = timezone.localdate() - timedelta(days=1)
+        MovimientoLibro.objects.update(fecha=timezone.now() - timedelta(days=3))  # Aperturas antes del periodo
+        for valor, monto in (('000001', '30.00'), ('000002', '5.00')):
+            Token.objects.create(cliente=self.juan, token=valor)
+            transferir(self.juan, self.cuenta_juan.numero, self.cuenta_maria.numero, Decimal(monto), 'pago', valor)
+        # Las dos primeras fueron ayer; la de hoy queda fuera del periodo pero afecta el saldo actual
+        Transferencia.objects.update(fecha=timezone.make_aware(datetime.combine(self.ayer, datetime.min.time()))
+                                     + timedelta(hours=12))
+        Token.objects.create(cliente=self.maria, token='000003')
+        transferir(self.maria, self.cuenta_maria.numero, self.cuenta_juan.numero, Decimal('20.00'), '', '000003')
+        self.directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directorio)
+
+    def generar(self, **opciones):
+        opciones = {'desde': self.ayer, 'hasta': self.ayer, 'directorio': self.directorio, 'procesos': 0,
+                    'lote': 1000, **opciones}
+        call_command('generate_statements', stdout=StringIO(), **opciones)
+        (punto,) = LoteEstadoCuenta.objects.all()
+        with gzip.open(punto.archivo, 'rt', encoding='utf-8') as archivo:
+            return punto, archivo.read()
+
+    def test_escribe_saldo_inicial_movimientos_y_saldo_final_por_cuenta(self):
+        punto, contenido = self.generar()
+
+        filas = list(csv.DictReader(StringIO(contenido)))
+        self.assertEqual((punto.cuentas, punto.movimientos), (2, 4))
+        self.assertEqual([(fila['cuenta'], fila['concepto'], fila['monto'], fila['saldo']) for fila in filas], [
+            ('juan-0', 'saldo_inicial', '', '100.00'),
+            ('juan-0', 'salida', '30.00', '70.00'),
+            ('juan-0', 'salida', '5.00', '65.00'),
+            ('juan-0', 'saldo_final', '', '65.00'),
+            ('maria-0', 'saldo_inicial', '', '50.00'),
+            ('maria-0', 'entrada', '30.00', '80.00'),
+            ('maria-0', 'entrada', '5.00', '85.00'),
+            ('maria-0', 'saldo_final', '', '85.00'),
+        ])
+        self.assertEqual(filas[1]['contraparte'], 'maria-0')
+
+    def test_el_saldo_inicial_sale_del_libro_y_omite_cuentas_posteriores(self):
+        # Un ajuste de hoy fuera del libro no cambia el periodo; la cuenta abierta hoy no tiene estado de ayer
+        CuentaBancaria.objects.filter(id=self.cuenta_juan.id).update(saldo=F('saldo') + 1000)
+        crear_cliente('pedro', Decimal('10.00'))
+
+        punto, contenido = self.generar()
+
+        filas = list(csv.DictReader(StringIO(contenido)))
+        self.assertEqual(punto.cuentas, 2)
+        self.assertNotIn('pedro-0', {fila['cuenta'] for fila in filas})
+        self.assertEqual([fila['saldo'] for fila in filas if fila['cuenta'] == 'juan-0'],
+                         ['100.00', '70.00', '65.00', '65.00'])
+
+    def test_reanuda_sin_repetir_los_rangos_generados(self):
+        self.generar(formato='jsonl')
+
+        with mock.patch('accounts.estados.generar') as generar:
+            punto, contenido = self.generar(formato='jsonl')
+
+        generar.assert_not_called()
+        self.assertEqual(json.loads(contenido.splitlines()[0])['saldo'], '100.00')
+        with self.assertRaises(CommandError):
+            self.generar(lote=500)
+
+
+class PerfilApiTests(TestCase):
+    def test_el_perfil_api_arranca_con_menos_modulos_y_responde(self):
+        salida = StringIO()
+        call_command('benchmark_startup', repeticiones=1, json=True, stdout=salida)
+        resultados = json.loads(salida.getvalue())
+
+        completo, api = resultados['banking_system.wsgi'], resultados['banking_system.wsgi_api']
+        self.assertEqual((completo['status'], api['status']), (401, 401))
+        self.assertLess(api['modulos'], completo['modulos'])
+
+    def test_el_perfil_asgi_no_usa_conexiones_persistentes(self):
+        from banking_system import settings_api, settings_asgi_api
+
+        self.assertEqual(settings_api.DATABASES['default']['CONN_MAX_AGE'], 60)
+        self.assertEqual({base['CONN_MAX_AGE'] for base in settings_asgi_api.DATABASES.values()}, {0})
+        self.assertEqual(settings_asgi_api.ROOT_URLCONF, settings_api.ROOT_URLCONF)
+
+
+@override_settings(FRAUDE={**settings.FRAUDE, 'REGLAS': [
+    {'NOMBRE': 'monto_por_hora', 'MEDIDA': 'monto', 'VENTANA': 3600, 'LIMITE': 100},
+    {'NOMBRE': 'transferencias_por_minuto', 'MEDIDA': 'cantidad', 'VENTANA': 60, 'LIMITE': 3},
+    {'NOMBRE': 'destinos_nuevos_por_hora', 'MEDIDA': 'destinos_nuevos', 'VENTANA': 3600, 'LIMITE': 2},
+]})
+class VelocidadFraudeTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.juan, (self.cuenta_juan,) = crear_cliente('juan', Decimal('1000.00'))
+        self.destinos = [crear_cliente(f'destino{i}', Decimal('0.00'))[1][0] for i in range(3)]
+
+    def transferir(self, destino, monto='10.00'):
+        valor = f'{Token.objects.count():06d}'
+        Token.objects.create(cliente=self.juan, token=valor)
+        with self.captureOnCommitCallbacks(execute=True):
+            return transferir(self.juan, self.cuenta_juan.numero, destino.numero, Decimal(monto), '', valor)
+
+    def rechazo(self, destino, monto='10.00'):
+        with self.assertRaises(TransferenciaError) as contexto:
+            self.transferir(destino, monto)
+        self.assertEqual(contexto.exception.status, 429)
+        return contexto.exception.extra['regla']
+
+    def test_cantidad_por_minuto(self):
+        for _ in range(3):
+            self.transferir(self.destinos[0])
+
+        self.assertEqual(self.rechazo(self.destinos[0]), 'transferencias_por_minuto')
+        # El rechazo no consume el token ni mueve dinero
+        self.assertEqual(Token.objects.filter(usado_en__isnull=True).count(), 1)
+        self.assertEqual(Transferencia.objects.count(), 3)
+
+    def test_monto_y_destinos_nuevos(self):
+        self.transferir(self.destinos[0], '60.00')
+        self.assertEqual(self.rechazo(self.destinos[0], '40.01'), 'monto_por_hora')
+
+        self.transferir(self.destinos[1], '5.00')
+        self.assertEqual(self.rechazo(self.destinos[2], '5.00'), 'destinos_nuevos_por_hora')
+
+    def test_el_lote_cuenta_cada_tramo(self):
+        Token.objects.create(cliente=self.juan, token='999999')
+        tramos = [{'cuenta_destino': destino.numero, 'monto': '1.00'} for destino in self.destinos]
+        with self.assertRaises(TransferenciaError) as contexto:
+            transferir_lote(self.juan, self.cuenta_juan.numero, tramos, '999999')
+        self.assertEqual(contexto.exception.extra['regla'], 'destinos_nuevos_por_hora')
+
+    def test_un_intento_fallido_libera_la_reserva_y_no_marca_el_destino(self):
+        for destino in self.destinos[:2]:
+            with self.assertRaises(TransferenciaError):
+                transferir(self.juan, self.cuenta_juan.numero, destino.numero, Decimal('10.00'), '', 'invalido')
+
+        self.transferir(self.destinos[0])
+        self.transferir(self.destinos[1])
+        self.assertEqual(self.rechazo(self.destinos[2]), 'destinos_nuevos_por_hora')
+
+    def test_los_destinos_se_olvidan_despues_de_dos_generaciones(self):
+        periodo = settings.FRAUDE['DESTINOS_DIAS'] * 86400
+        inicio = time.time()
+        with mock.patch('accounts.fraude.time.time', return_value=inicio - 2 * periodo):
+            self.transferir(self.destinos[0])
+            self.transferir(self.destinos[1])
+
+        # Dos generaciones después ambos destinos vuelven a ser nuevos
+        self.transferir(self.destinos[0])
+        self.transferir(self.destinos[1])
+        self.assertEqual(self.rechazo(self.destinos[2]), 'destinos_nuevos_por_hora')
+
+    def test_warm_fraud_counters_recarga_desde_las_transferencias(self):
+        for destino in self.destinos[:2]:
+            Transferencia.objects.create(cuenta_origen=self.cuenta_juan, cuenta_destino=destino, monto=Decimal('45.00'))
+
+        call_command('warm_fraud_counters', stdout=StringIO())
+
+        # Los destinos ya pagados no cuentan como nuevos, pero el monto de la hora sí
+        self.assertEqual(self.rechazo(self.destinos[0], '10.01'), 'monto_por_hora')
+        self.transferir(self.destinos[1], '10.00')
+
+
+@override_settings(LOGIN_LIMITES={'IP': {'CAPACIDAD': 5, 'RECARGA': 0.01}, 'USUARIO': {'CAPACIDAD': 2, 'RECARGA': 0.01}})
+class LoginTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.juan = User.objects.create(username='juan', password=make_password('password.3', hasher='pbkdf2_sha256'))
+
+    def login(self, username='juan', password='password.3', url='/api/login/', **extra):
+        return self.client.post(url, {'username': username, 'password': password}, content_type='application/json',
+                                **extra)
+
+    def test_limite_por_usuario_antes_de_calcular_el_hash(self):
+        self.assertEqual(self.login(password='mala').status_code, 400)
+        self.assertEqual(self.login(password='mala').status_code, 400)
+        with mock.patch('accounts.views.authenticate') as authenticate:
+            respuesta = self.login()
+        self.assertEqual(respuesta.status_code, 429)
+        self.assertGreater(int(respuesta['Retry-After']), 0)
+        authenticate.assert_not_called()
+        # Otro usuario desde la misma IP aún tiene intentos
+        self.assertEqual(self.login(username='maria').status_code, 400)
+
+    def test_limite_por_ip_aplica_tambien_a_token(self):
+        for i in range(5):
+            self.login(username=f'usuario{i}', url='/api/token/')
+        self.assertEqual(self.login(username='otro', url='/api/token/').status_code, 429)
+        self.assertEqual(self.login(REMOTE_ADDR='10.0.0.2', url='/api/token/').status_code, 200)
+
+    def test_hash_pbkdf2_se_migra_a_scrypt_en_el_login(self):
+        self.assertEqual(self.login().status_code, 200)
+        self.juan.refresh_from_db()
+        self.assertTrue(self.juan.password.startswith('scrypt$16384$'))
+        self.assertEqual(self.login().json()['usuario_id'], self.juan.id)
+
+
+
+@override_settings(LOGIN_LIMITES={'USUARIO': {'CAPACIDAD': 2, 'RECARGA': 0.01}})
+class LoginAsyncTests(TransactionTestCase):
+    # TransactionTestCase: el hash y la consulta del usuario corren en otro hilo, con otra conexión
+
+    def setUp(self):
+        cache.clear()
+        self.juan = User.objects.create_user('juan', password='password.3')
+
+    async def test_login_en_hilos_acotados(self):
+        respuestas = [await self.async_client.post('/api/async/login/', {'username': 'juan', 'password': clave},
+                                                   content_type='application/json')
+                      for clave in ('mala', 'password.3', 'password.3')]
+        self.assertEqual([respuesta.status_code for respuesta in respuestas], [400, 200, 429])
+        self.assertEqual(respuestas[1].json()['usuario_id'], self.juan.id)
+
+    @override_settings(LOGIN_HASH_HILOS=1, LOGIN_HASH_COLA=0)
+    async def test_cola_llena_responde_503(self):
+        with mock.patch('accounts.acceso._pendientes', 1):
+            respuesta = await self.async_client.post('/api/async/login/', {'username': 'juan', 'password': 'x'},
+                                                     content_type='application/json')
+        self.assertEqual(respuesta.status_code, 503)
+
+
+class MetricasTests(TestCase):
+    def setUp(self):
+        registro.reiniciar()
+        self.juan, (self.cuenta_juan,) = crear_cliente('juan', Decimal('100.00'))
+        self.maria, (self.cuenta_maria,) = crear_cliente('maria', Decimal('0'))
+        self.client = APIClient()
+        self.client.force_authenticate(self.juan)
+
+    def test_registra_latencia_consultas_y_bloqueos_por_vista(self):
+        Token.objects.create(cliente=self.juan, token='123456')
+        with self.assertLogs('accounts.metricas') as logs, \
+                override_settings(METRICAS={**settings.METRICAS, 'LOG': True}):
+            self.client.post('/api/transferencia/', {
+                'cuenta_origen': self.cuenta_juan.numero, 'cuenta_destino': self.cuenta_maria.numero,
+                'monto': '10.00', 'token': '123456'}, format='json')
+
+        serie = registro.copia()['realizar_transferencia']
+        self.assertEqual(serie['cuenta'], 1)
+        self.assertGreater(serie['consultas'], 0)
+        if connection.features.has_select_for_update:  # SQLite no emite FOR UPDATE
+            self.assertGreater(serie['bloqueo'], 0)
+        linea = json.loads(logs.records[0].getMessage())
+        self.assertEqual((linea['vista'], linea['status'], linea['sql_consultas']),
+                         ('realizar_transferencia', 200, serie['consultas']))
+
+        texto = Client().get('/api/metricas/').content.decode()
+        self.assertIn('banco_solicitud_segundos_count{vista="realizar_transferencia"} 1', texto)
+        self.assertIn('banco_solicitud_segundos_bucket{vista="realizar_transferencia",le="+Inf"} 1', texto)
+        self.assertIn(f'banco_sql_consultas_total{{vista="realizar_transferencia"}} {serie["consultas"]}', texto)
+
+    @override_settings(METRICAS={**settings.METRICAS, 'TOKEN': 'secreto'})
+    def test_endpoint_protegido_por_token(self):
+        self.assertEqual(Client().get('/api/metricas/').status_code, 401)
+        respuesta = Client().get('/api/metricas/', headers={'Authorization': 'Bearer secreto'})
+        self.assertEqual(respuesta.status_code, 200)
+
+    def test_sin_token_solo_responde_a_las_redes_internas(self):
+        self.assertEqual(Client(REMOTE_ADDR='203.0.113.7').get('/api/metricas/').status_code, 403)
+        self.assertEqual(Client(REMOTE_ADDR='::1').get('/api/metricas/').status_code, 200)
+        with override_settings(METRICAS={**settings.METRICAS, 'REDES': ('10.0.0.0/8',)}):
+            self.assertEqual(Client(REMOTE_ADDR='10.1.2.3').get('/api/metricas/').status_code, 200)
+            self.assertEqual(Client().get('/api/metricas/').status_code, 403)
+
+    def test_perfil_muestreado_de_una_vista(self):
+        with tempfile.TemporaryDirectory() as directorio, override_settings(METRICAS={
+                **settings.METRICAS, 'PERFIL': {'VISTA': 'obtener_contactos', 'MUESTREO': 1, 'DIRECTORIO': directorio}}):
+            self.client.get('/api/obtener_cuenta_origen/')
+            self.client.get('/api/obtener_contactos/')
+            perfiles = os.listdir(directorio)
+        self.assertEqual(len(perfiles), 1)
+        self.assertTrue(perfiles[0].startswith('obtener_contactos-'))
+
+
+class ReplicaTests(TransactionTestCase):
+    # Sin la transacción de TestCase: dentro de un bloque atómico el router nunca elige la réplica
+    databases = {'default', 'replica'} if 'replica' in settings.DATABASES else {'default'}
+
+    def setUp(self):
+        self.juan, (self.cuenta_juan,) = crear_cliente('juan', Decimal('100.00'))
+        self.maria, (self.cuenta_maria,) = crear_cliente('maria', Decimal('0'))
+        cache.clear()  # Crear las cuentas ya fijó a ambos usuarios a la primaria
+        self.factory = RequestFactory()
+
+    def alias_de_lectura(self, usuario, metodo='get', escribir=False):
+        # Ejecuta una vista mínima a través del middleware y devuelve el alias que eligió el router
+        elegido = []
+
+        @lectura_replica
+        def vista(request):
+            elegido.append(router.db_for_read(CuentaBancaria))
+            if escribir:
+                Token.objects.create(cliente=usuario, token='000000')
+            return HttpResponse()
+
+        request = getattr(self.factory, metodo)('/')
+        request.user = usuario
+        with mock.patch('accounts.replicas._alias', return_value='replica'):
+            ReplicaMiddleware(vista)(request)
+        return elegido[0]
+
+    def test_lecturas_a_la_replica_salvo_tras_escribir(self):
+        self.assertEqual(self.alias_de_lectura(self.juan), 'replica')
+        # La solicitud que escribe fija al usuario a la primaria; a otros usuarios no les afecta
+        self.alias_de_lectura(self.juan, 'post', escribir=True)
+        self.assertEqual(self.alias_de_lectura(self.juan), 'default')
+        self.assertEqual(self.alias_de_lectura(self.maria), 'replica')
+
+        cache.clear()  # Vence la fijación
+        self.assertEqual(self.alias_de_lectura(self.juan), 'replica')
+
+    def test_fuera_de_las_vistas_marcadas_todo_va_a_la_primaria(self):
+        self.assertEqual(router.db_for_read(CuentaBancaria), 'default')
+
+    @skipUnless('replica' in settings.DATABASES, 'Requiere el alias replica (DB_REPLICA_HOST)')
+    def test_transferencia_fija_a_ambos_usuarios(self):
+        Token.objects.create(cliente=self.juan, token='123456')
+        cliente = APIClient()
+        cliente.force_authenticate(self.juan)
+        cliente.post('/api/transferencia/', {
+            'cuenta_origen': self.cuenta_juan.numero, 'cuenta_destino': self.cuenta_maria.numero,
+            'monto': '10.00', 'token': '123456'}, format='json')
+        self.assertEqual(self.alias_de_lectura(self.juan), 'default')
+        self.assertEqual(self.alias_de_lectura(self.maria), 'default')
+
+        cache.clear()
+        with CaptureQueriesContext(connections['replica']) as replica:
+            respuesta = cliente.get('/api/obtener_cuenta_origen/')
+        self.assertEqual(respuesta.json()['cuentas'][0]['saldo'], '90.00')
+        self.assertEqual(len(replica), 1)
+
+
+class PopulateDbTests(TestCase):
+    def test_genera_datos_consistentes_y_reproducibles(self):
+        opciones = dict(usuarios=20, cuentas_por_usuario=2, contactos_por_usuario=3, transferencias=100,
+                        semilla=7, lote=16, stdout=StringIO())
+        call_command('populate_db', **opciones)
+
+        self.assertEqual(User.objects.count(), 20)
+        self.assertEqual(CuentaBancaria.objects.values('numero').distinct().count(), 40)
+        self.assertFalse(Contacto.objects.filter(cuenta_bancaria__usuario=F('usuario')).exists())
+        self.assertEqual(Contacto.objects.values('usuario', 'cuenta_bancaria').distinct().count(), 60)
+        self.assertFalse(Transferencia.objects.filter(cuenta_origen=F('cuenta_destino')).exists())
+        self.assertLess(Transferencia.objects.order_by('fecha').first().fecha, timezone.now() - timedelta(days=1))
+
+        # Una segunda corrida continúa los ids y números sin chocar; la misma semilla repite saldos y montos
+        saldos = list(CuentaBancaria.objects.order_by('id').values_list('saldo', flat=True))
+        call_command('populate_db', **opciones)
+        self.assertEqual(CuentaBancaria.objects.values('numero').distinct().count(), 80)
+        self.assertEqual(list(CuentaBancaria.objects.order_by('id').values_list('saldo', flat=True)[40:]), saldos)
+        # Los usuarios generados pueden autenticarse con la contraseña compartida
+        self.assertTrue(User.objects.last().check_password('password.3'))
+
+    def test_una_carga_interrumpida_se_reanuda_desde_el_ultimo_lote(self):
+        from .management.commands.populate_db import Command
+
+        opciones = dict(usuarios=10, cuentas_por_usuario=1, contactos_por_usuario=2, transferencias=50,
+                        semilla=3, lote=8, stdout=StringIO())
+        confirmar, llamadas = Command.confirmar, []
+
+        def fallar_a_media_carga(comando, tabla, cantidad):
+            confirmar(comando, tabla, cantidad)
+            llamadas.append(tabla)
+            if llamadas.count('transferencias') == 3:
+                raise RuntimeError('conexión perdida')
+
+        with mock.patch.object(Command, 'confirmar', fallar_a_media_carga), self.assertRaises(RuntimeError):
+            call_command('populate_db', **opciones)
+        # Los lotes anteriores al fallo quedaron confirmados; el que falló se deshizo
+        carga = CargaDatos.objects.get()
+        self.assertEqual((carga.cuentas, carga.transferencias, carga.terminada), (10, 16, False))
+        self.assertEqual(Transferencia.objects.count(), 16)
+        with self.assertRaises(CommandError):
+            call_command('populate_db', **{**opciones, 'transferencias': 60})
+
+        call_command('populate_db', **opciones)
+
+        self.assertTrue(CargaDatos.objects.get().terminada)
+        self.assertEqual((User.objects.count(), Transferencia.objects.count()), (10, 50))
+        fechas = Transferencia.objects.values_list('fecha', flat=True)
+        self.assertLessEqual(max(fechas), carga.referencia)  # La fecha generada, no la de inserción
+        self.assertTrue(Transferencia._meta.get_field('fecha').auto_now_add)
+
+
+@override_settings(TRANSFERENCIA_REINTENTOS=50)
+class TransferenciasConcurrentesTests(TransactionTestCase):
+    HILOS = 8
+    TRANSFERENCIAS_POR_HILO = 25
+
+    def setUp(self):
+        self.juan, (self.cuenta_juan,) = crear_cliente('juan', Decimal('500.00'))
+        self.maria, (self.cuenta_maria,) = crear_cliente('maria', Decimal('500.00'))
+
+    def ejecutar_en_hilos(self, trabajos):
+        errores = []
+
+        def trabajar(trabajo):
+            try:
+                trabajo()
+            except Exception as error:  # pragma: no cover - se reporta en la aserción
+                errores.append(error)
+            finally:
+                connection.close()
+
+        hilos = [threading.Thread(target=trabajar, args=(trabajo,)) for trabajo in trabajos]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        self.assertEqual(errores, [])
+
+    def transferencias_cruzadas(self, indice):
+        # Los hilos pares van de juan a maria y los impares al revés: sin orden de bloqueo habría deadlocks
+        usuario, origen, destino = ((self.juan, self.cuenta_juan, self.cuenta_maria) if indice % 2 == 0
+                                    else (self.maria, self.cuenta_maria, self.cuenta_juan))
+
+        def trabajo():
+            for i in range(self.TRANSFERENCIAS_POR_HILO):
+                valor = f'{indice:02d}{i:04d}'
+                Token.objects.create(cliente=usuario, token=valor)
+                try:
+                    transferir(usuario, origen.numero, destino.numero, Decimal('7.00'), '', valor)
+                except TransferenciaError:
+                    pass
+        return trabajo
+
+    def test_el_dinero_total_se_conserva_en_un_par_caliente(self):
+        self.ejecutar_en_hilos([self.transferencias_cruzadas(i) for i in range(self.HILOS)])
+
+        total = CuentaBancaria.objects.aggregate(total=Sum('saldo'))['total']
+        self.assertEqual(total, Decimal('1000.00'))
+        self.assertFalse(CuentaBancaria.objects.filter(saldo__lt=0).exists())
+
+        # Cada transferencia registrada corresponde exactamente a un movimiento de saldo y a un token usado
+        movimientos = Transferencia.objects.filter(cuenta_origen=self.cuenta_juan).count() - \
+            Transferencia.objects.filter(cuenta_origen=self.cuenta_maria).count()
+        self.cuenta_juan.refresh_from_db()
+        self.assertEqual(self.cuenta_juan.saldo, Decimal('500.00') - movimientos * Decimal('7.00'))
+        self.assertEqual(Token.objects.filter(usado_en__isnull=False).count(), Transferencia.objects.count())
+
+    def test_duplicados_concurrentes_esperan_a_la_solicitud_en_curso(self):
+        Token.objects.create(cliente=self.juan, token='123456')
+        respuestas = []
+
+        def enviar():
+            cliente = APIClient()
+            cliente.force_authenticate(self.juan)
+            respuestas.append(cliente.post('/api/transferencia/', {
+                'cuenta_origen': self.cuenta_juan.numero, 'cuenta_destino': self.cuenta_maria.numero,
+                'monto': '10.00', 'token': '123456'}, format='json', HTTP_IDEMPOTENCY_KEY='misma-clave'))
+
+        self.ejecutar_en_hilos([enviar] * self.HILOS)
+
+        self.assertEqual([r.status_code for r in respuestas], [200] * self.HILOS)
+        self.assertEqual(Transferencia.objects.count(), 1)
+        self.assertEqual(CuentaBancaria.objects.get(pk=self.cuenta_juan.pk).saldo, Decimal('490.00'))
+
+    def test_transferencias_cruzadas_en_el_mismo_par_sin_deadlocks(self):
+        # Con saldo de sobra ninguna transferencia puede fallar: cualquier error (deadlock, bloqueo agotado) o
+        # transferencia perdida hace fallar la prueba
+        def trabajo_para(indice):
+            usuario, origen, destino = ((self.juan, self.cuenta_juan, self.cuenta_maria) if indice % 2 == 0
+                                        else (self.maria, self.cuenta_maria, self.cuenta_juan))
+
+            def trabajo():
+                for i in range(self.TRANSFERENCIAS_POR_HILO):
+                    valor = f'{indice:02d}{i:04d}'
+                    Token.objects.create(cliente=usuario, token=valor)
+                    transferir(usuario, origen.numero, destino.numero, Decimal('1.00'), '', valor)
+            return trabajo
+
+        self.ejecutar_en_hilos([trabajo_para(i) for i in range(self.HILOS)])
+
+        # Tantas transferencias en cada sentido: los saldos vuelven exactamente al inicial
+        por_sentido = self.HILOS // 2 * self.TRANSFERENCIAS_POR_HILO
+        self.assertEqual(Transferencia.objects.filter(cuenta_origen=self.cuenta_juan).count(), por_sentido)
+        self.assertEqual(Transferencia.objects.filter(cuenta_origen=self.cuenta_maria).count(), por_sentido)
+        self.assertEqual(CuentaBancaria.objects.get(pk=self.cuenta_juan.pk).saldo, Decimal('500.00'))
+        self.assertEqual(CuentaBancaria.objects.get(pk=self.cuenta_maria.pk).saldo, Decimal('500.00'))
+        self.assertFalse(Token.objects.filter(es_valido=True).exists())
@@ -0,0 +1,186 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from functools import lru_cache
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.db import close_old_connections, transaction
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.crypto import get_random_string
+from django.utils.module_loading import import_string
+
+from .models import Token
+
+
+def nuevo_valor():
+    return get_random_string(6, allowed_chars='0123456789')  # Token aleatorio de 6 dígitos
+
+
+class AlmacenTokens:
+    # Interfaz de los almacenes de tokens virtuales (OTP) usados para autorizar transferencias
+
+    def __init__(self, vigencia=60):
+        self.vigencia = vigencia
+
+    def emitir(self, usuario):
+        # Devuelve (token, segundos restantes): el token vigente del usuario o uno nuevo
+        raise NotImplementedError
+
+    async def aemitir(self, usuario):
+        return await sync_to_async(self.emitir)(usuario)
+
+    def consumir(self, usuario, valor):
+        # Marca el token como usado; True solo para el primer llamador mientras el token esté vigente
+        raise NotImplementedError
+
+    def rechazado(self, usuario, valor):
+        # Se llama cuando consumir() falla; devuelve un token de reemplazo si el rechazo fue por expiración
+        return None
+
+    def devolver(self, usuario, valor):
+        # Deshace un consumir() cuya transacción no se confirmó; los almacenes en la base de datos ya lo
+        # deshacen con el rollback
+        pass
+
+
+class AlmacenTokensDB(AlmacenTokens):
+    # Tokens en la tabla Token (comportamiento original); consumir() participa en la transacción del llamador
+
+    def emitir(self, usuario):
+        token_existente = Token.objects.filter(cliente=usuario, es_valido=True).last()
+
+        if token_existente:
+            if token_existente.has_expired():
+                token_existente.es_valido = False
+                token_existente.save(update_fields=['es_valido'])
+            else:
+                tiempo_restante = self.vigencia - (timezone.now() - token_existente.generado_en).seconds
+                return token_existente.token, tiempo_restante
+
+        nuevo_token = Token.objects.create(cliente=usuario, token=nuevo_valor(), es_valido=True)
+        return nuevo_token.token, self.vigencia
+
+    async def aemitir(self, usuario):
+        token_existente = await Token.objects.filter(cliente=usuario, es_valido=True).alast()
+
+        if token_existente:
+            if token_existente.has_expired():
+                token_existente.es_valido = False
+                await token_existente.asave(update_fields=['es_valido'])
+            else:
+                tiempo_restante = self.vigencia - (timezone.now() - token_existente.generado_en).seconds
+                return token_existente.token, tiempo_restante
+
+        nuevo_token = await Token.objects.acreate(cliente=usuario, token=nuevo_valor(), es_valido=True)
+        return nuevo_token.token, self.vigencia
+
+    def consumir(self, usuario, valor):
+        # Consumo condicional: solo una transacción puede pasar el token de válido a usado
+        limite = timezone.now() - timedelta(seconds=self.vigencia)
+        return bool(Token.objects.filter(
+            cliente=usuario, token=valor, es_valido=True, generado_en__gte=limite
+        ).update(es_valido=False, usado_en=timezone.now()))
+
+    def rechazado(self, usuario, valor):
+        token = Token.objects.filter(cliente=usuario, token=valor, es_valido=True).last()
+        if token is None:
+            return None
+
+        token.es_valido = False
+        token.save(update_fields=['es_valido'])
+        return Token.objects.create(cliente=usuario, token=nuevo_valor(), es_valido=True).token
+
+
+class AlmacenTokensCache(AlmacenTokens):
+    # Tokens en la caché compartida (Redis, Memcached o locmem) con expiración nativa.
+    # Cada token vive en su propia clave `otp:<usuario>:<valor>`, así borrar la clave es un
+    # compare-and-delete atómico: solo un llamador obtiene True de cache.delete().
+
+    def __init__(self, vigencia=60, alias='default', auditoria=False):
+        super().__init__(vigencia)
+        self.alias = alias
+        self.auditoria = ThreadPoolExecutor(max_workers=1, thread_name_prefix='auditoria-tokens') \
+            if auditoria else None
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def emitir(self, usuario):
+        puntero = f'otp:{usuario.pk}'
+        actual = self.cache.get(puntero)
+        if actual is not None and self.cache.get(f'otp:{usuario.pk}:{actual[0]}') is not None:
+            return actual[0], max(0, int(actual[1] + self.vigencia - time.time()))
+
+        valor, generado_en = nuevo_valor(), time.time()
+        self.cache.set_many({f'otp:{usuario.pk}:{valor}': generado_en, puntero: (valor, generado_en)},
+                            timeout=self.vigencia)
+        self._auditar(_registrar_emision, usuario.pk, valor)
+        return valor, self.vigencia
+
+    async def aemitir(self, usuario):
+        puntero = f'otp:{usuario.pk}'
+        actual = await self.cache.aget(puntero)
+        if actual is not None and await self.cache.aget(f'otp:{usuario.pk}:{actual[0]}') is not None:
+            return actual[0], max(0, int(actual[1] + self.vigencia - time.time()))
+
+        valor, generado_en = nuevo_valor(), time.time()
+        await self.cache.aset_many({f'otp:{usuario.pk}:{valor}': generado_en, puntero: (valor, generado_en)},
+                                   timeout=self.vigencia)
+        self._auditar(_registrar_emision, usuario.pk, valor)
+        return valor, self.vigencia
+
+    def consumir(self, usuario, valor):
+        if not valor or not self.cache.delete(f'otp:{usuario.pk}:{valor}'):
+            return False
+        usado_en = timezone.now()
+        transaction.on_commit(lambda: self._auditar(_registrar_consumo, usuario.pk, valor, usado_en))
+        return True
+
+    def devolver(self, usuario, valor):
+        # Restaura la clave con la vigencia que le quedaba, tomada del puntero al token vigente del usuario.
+        # add() no pisa la clave si otro llamador ya la volvió a crear.
+        actual = self.cache.get(f'otp:{usuario.pk}')
+        if actual is None or actual[0] != valor:
+            return
+        restante = actual[1] + self.vigencia - time.time()
+        if restante > 0:
+            self.cache.add(f'otp:{usuario.pk}:{valor}', actual[1], timeout=restante)
+
+    def _auditar(self, funcion, *args):
+        # La auditoría en la tabla Token se escribe en segundo plano, fuera del camino crítico
+        if self.auditoria is not None:
+            self.auditoria.submit(_en_hilo, funcion, *args)
+
+
+def _en_hilo(funcion, *args):
+    close_old_connections()
+    try:
+        funcion(*args)
+    finally:
+        close_old_connections()
+
+
+def _registrar_emision(usuario_id, valor):
+    Token.objects.create(cliente_id=usuario_id, token=valor, es_valido=True)
+
+
+def _registrar_consumo(usuario_id, valor, usado_en):
+    Token.objects.filter(cliente_id=usuario_id, token=valor, es_valido=True).update(es_valido=False, usado_en=usado_en)
+
+
+@lru_cache(maxsize=None)
+def obtener_almacen():
+    configuracion = dict(settings.TOKENS_ALMACEN)
+    clase = import_string(configuracion.pop('BACKEND'))
+    return clase(vigencia=settings.TOKENS_VIGENCIA, **{clave.lower(): valor for clave, valor in configuracion.items()})
+
+
+@receiver(setting_changed)
+def _reiniciar_almacen(setting, **kwargs):
+    if setting in ('TOKENS_ALMACEN', 'TOKENS_VIGENCIA'):
+        obtener_almacen.cache_clear()
@@ -1,5 +1,5 @@
 from django.urls import path
-from . import views
+from . import views, async_views
 from rest_framework_simplejwt.views import (
     TokenRefreshView,
 )
@@ -12,8 +12,21 @@ urlpatterns = [
     path('obtener_cuenta_origen/', views.obtener_cuenta_origen, name='obtener_cuenta_origen'),
     path('obtener_tokens_cliente/', views.obtener_tokens_cliente, name='obtener_tokens_cliente'),
     path('obtener_contactos/', views.obtener_contactos, name='obtener_contactos'),
+    path('contactos/buscar/', views.buscar_contactos, name='buscar_contactos'),
     path('token/', CustomTokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
     path('transferencia/', views.realizar_transferencia, name='realizar_transferencia'),
+    path('transferencia/lote/', views.realizar_transferencia_lote, name='realizar_transferencia_lote'),
+    path('historial/', views.obtener_historial, name='obtener_historial'),
+    path('historial/exportar/', views.exportar_historial, name='exportar_historial'),
+    path('resumen/', views.obtener_resumen, name='obtener_resumen'),
+    path('metricas/', views.metricas, name='metricas'),
+
+    # Variantes async del login, las lecturas y la emisión de tokens (servir con ASGI)
+    path('async/login/', async_views.login, name='login_async'),
+    path('async/generarToken/', async_views.generar_token, name='generar_token_async'),
+    path('async/obtener_cuenta_origen/', async_views.obtener_cuenta_origen, name='obtener_cuenta_origen_async'),
+    path('async/obtener_tokens_cliente/', async_views.obtener_tokens_cliente, name='obtener_tokens_cliente_async'),
+    path('async/obtener_contactos/', async_views.obtener_contactos, name='obtener_contactos_async'),
 
 ]
@@ -1,170 +1,392 @@
-from decimal import Decimal
+from datetime import timedelta
+import csv
+import ipaddress
 import json
 from django.contrib.auth import authenticate
-from django.http import JsonResponse
+from django.conf import settings
+from django.db import router
+from django.db.models import Q
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.crypto import constant_time_compare
+from django.utils.dateparse import parse_date, parse_datetime
 from django.views.decorators.csrf import csrf_exempt
 from django.utils import timezone
-from rest_framework.decorators import permission_classes, api_view
+from rest_framework.decorators import authentication_classes, permission_classes, api_view
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework_simplejwt.views import TokenObtainPairView
-from django.utils.crypto import get_random_string
 from .models import Token, CuentaBancaria, Contacto, Transferencia
 from .serializers import CustomTokenObtainPairSerializer
-
-
+from . import contactos, fracciones, historial, resumenes
+from .authentication import JWTLecturaAuthentication
+from .acceso import verificar_limite, LimiteExcedido
+from .idempotencia import idempotente, al_confirmar
+from .json_rapido import dumps, json_rapido, RespuestaJSON
+from .metricas import texto_prometheus
+from .replicas import lectura_replica
+from .cache_lecturas import respuesta_cacheada, CUENTAS, CONTACTOS
+from .tokens import obtener_almacen
+from .services import leer_monto, transferir, transferir_lote, TransferenciaError, MODO_TODO_O_NADA
+
+
+@json_rapido
 class CustomTokenObtainPairView(TokenObtainPairView):
     serializer_class = CustomTokenObtainPairSerializer
 
+    def post(self, request, *args, **kwargs):
+        try:
+            verificar_limite(request, request.data.get('username'))
+        except LimiteExcedido as error:
+            return Response({'detail': 'Demasiados intentos, espera antes de reintentar'}, status=429,
+                            headers=error.cabeceras())
+        return super().post(request, *args, **kwargs)
+
+
+def credenciales(request):
+    # Devuelve (username, password) del cuerpo JSON o None si el cuerpo no es un objeto JSON
+    try:
+        body = json.loads(request.body)
+    except ValueError:
+        return None
+    if not isinstance(body, dict):
+        return None
+    return body.get('username'), body.get('password')
+
+
+def login_limitado(error):
+    respuesta = RespuestaJSON({'mensaje': 'Demasiados intentos, espera antes de reintentar'}, status=429)
+    for cabecera, valor in error.cabeceras().items():
+        respuesta[cabecera] = valor
+    return respuesta
+
 
 @csrf_exempt
 def login_view(request):
     if request.method == 'POST':
         # Obtener el nombre de usuario y contraseña del cuerpo de la solicitud
-        body_unicode = request.body.decode('utf-8')
-        body = json.loads(body_unicode)
-        username = body.get('username')
-        password = body.get('password')
+        datos = credenciales(request)
+        if datos is None:
+            return RespuestaJSON({'mensaje': 'Cuerpo JSON inválido'}, status=400)
+        username, password = datos
+
+        # Los límites por IP y por usuario se revisan antes del hash, que es lo costoso
+        try:
+            verificar_limite(request, username)
+        except LimiteExcedido as error:
+            return login_limitado(error)
 
         # Autenticación del usuario
         user = authenticate(request, username=username, password=password)
 
         if user is not None:
             # Login exitoso
-            return JsonResponse({'mensaje': 'Login exitoso', 'usuario_id': user.id})
+            return RespuestaJSON({'mensaje': 'Login exitoso', 'usuario_id': user.id})
         else:
             # Login fallido
-            return JsonResponse({'mensaje': 'Credenciales inválidas'}, status=400)
+            return RespuestaJSON({'mensaje': 'Credenciales inválidas'}, status=400)
     else:
-        return JsonResponse({'mensaje': 'Método no permitido'}, status=405)
+        return RespuestaJSON({'mensaje': 'Método no permitido'}, status=405)
+
+
+def parametros_tokens(request):
+    limite = min(int(request.GET.get('limite', settings.TOKENS_LIMITE)), settings.TOKENS_LIMITE_MAXIMO)
+    try:
+        antes = historial.decodificar_cursor(request.GET['antes']) if request.GET.get('antes') else None
+    except historial.CursorInvalido:
+        raise ValueError(request.GET['antes'])
+    if limite <= 0:
+        raise ValueError(limite)
+    return limite, antes
+
+
+def consulta_tokens(usuario, limite, antes):
+    # Del más reciente al más antiguo por el índice (cliente, generado_en, id); `antes` es la posición
+    # (generado_en, id) del último token de la página anterior
+    tokens = Token.objects.filter(cliente_id=usuario.pk).order_by('-generado_en', '-id')
+    if antes is not None:
+        generado_en, id_ = antes
+        tokens = tokens.filter(Q(generado_en__lt=generado_en) | Q(generado_en=generado_en, id__lt=id_))
+    return tokens.values_list('id', 'token', 'generado_en', 'usado_en', 'es_valido')[:limite + 1]
+
+
+def pagina_tokens(tokens, limite):
+    # La expiración se calcula al leer: ningún token se reescribe para listarlo. Las fechas se escriben en
+    # ISO-8601 al serializar, sin formatearlas fila por fila.
+    limite_vigencia = timezone.now() - timedelta(seconds=settings.TOKENS_VIGENCIA)
+    lista_tokens = [{
+        'token': token,
+        'generado_en': generado_en,
+        'usado_en': usado_en,
+        'es_valido': es_valido and generado_en >= limite_vigencia
+    } for _, token, generado_en, usado_en, es_valido in tokens[:limite]]
+
+    ultimo = tokens[limite - 1] if len(tokens) > limite else None
+    siguiente = historial.codificar_cursor({'fecha': ultimo[2], 'id': ultimo[0]}) if ultimo else None
+    return {'tokens': lista_tokens, 'siguiente': siguiente}
 
 
 @api_view(['GET'])
+@json_rapido
 @permission_classes([IsAuthenticated])
 def generar_token(request):
-    usuario_actual = request.user
-
-    token_existente = Token.objects.filter(cliente=usuario_actual, es_valido=True).last()
-
-    if token_existente:
-        if token_existente.has_expired():
-            token_existente.es_valido = False
-            token_existente.save()
-        else:
-            tiempo_restante = 60 - (timezone.now() - token_existente.generado_en).seconds
-            return Response({'token': token_existente.token, 'tiempo_restante': tiempo_restante})
-
-    nuevo_token_valor = get_random_string(6, allowed_chars='0123456789')  # Generar token aleatorio de 6 dígitos
-    nuevo_token = Token.objects.create(cliente=usuario_actual, token=nuevo_token_valor, es_valido=True)
-    return Response({'token': nuevo_token.token, 'tiempo_restante': 60})
-
+    token, tiempo_restante = obtener_almacen().emitir(request.user)
+    return Response({'token': token, 'tiempo_restante': tiempo_restante})
 
 
 @api_view(['GET'])
+@json_rapido
 @permission_classes([IsAuthenticated])
+@authentication_classes([JWTLecturaAuthentication])
+@lectura_replica
 def obtener_cuenta_origen(request):
     usuario_actual = request.user
-    cuentas = CuentaBancaria.objects.filter(usuario=usuario_actual)
-    lista_cuentas = [{'numero': cuenta.numero, 'tipo': cuenta.tipo, 'saldo': cuenta.saldo} for cuenta in cuentas]
-    return JsonResponse({'cuentas': lista_cuentas})
+
+    def construir():
+        cuentas = CuentaBancaria.objects.filter(usuario_id=usuario_actual.pk) \
+            .values_list('numero', 'tipo', 'saldo', fracciones.en_fracciones())
+        lista_cuentas = [{'numero': numero, 'tipo': tipo, 'saldo': fracciones.total(saldo, extra)}
+                         for numero, tipo, saldo, extra in cuentas]
+        return {'cuentas': lista_cuentas}
+
+    return respuesta_cacheada(request, CUENTAS, construir)
 
 
 @api_view(['GET'])
+@json_rapido
 @permission_classes([IsAuthenticated])  # Se requiere autenticación
+@authentication_classes([JWTLecturaAuthentication])
+@lectura_replica
 def obtener_tokens_cliente(request):
-    user = request.user
-    tokens = Token.objects.filter(cliente=user)
-
-    # Verificar cada token si sigue siendo válido
-    lista_tokens = []
-    for t in tokens:
-        # Calcular la diferencia en segundos entre el tiempo actual y el tiempo de generación
-        tiempo_actual = timezone.now()
-        tiempo_generado = t.generado_en
-        tiempo_diferencia = (tiempo_actual - tiempo_generado).total_seconds()
-
-        # Si han pasado más de 60 segundos desde la generación, marcar el token como no válido
-        if tiempo_diferencia > 60 and t.es_valido:
-            t.es_valido = False
-            t.save()
-
-        # Añadir el token a la lista de respuesta
-        lista_tokens.append({
-            'token': t.token,
-            'generado_en': t.generado_en.strftime("%m/%d/%Y, %H:%M:%S"),
-            'usado_en': t.usado_en.strftime("%m/%d/%Y, %H:%M:%S") if t.usado_en else None,
-            'es_valido': t.es_valido
-        })
-
-    return JsonResponse({'tokens': lista_tokens})
+    try:
+        limite, antes = parametros_tokens(request)
+    except ValueError:
+        return Response({'error': 'Los parámetros de paginación no son válidos'}, status=400)
+
+    tokens = list(consulta_tokens(request.user, limite, antes))
+    return RespuestaJSON(pagina_tokens(tokens, limite))
+
 
 @api_view(['GET'])
+@json_rapido
 @permission_classes([IsAuthenticated])
+@authentication_classes([JWTLecturaAuthentication])
+@lectura_replica
 def obtener_contactos(request):
     usuario = request.user
-    contactos = Contacto.objects.filter(usuario=usuario)
-    lista_contactos = [{'nombre': contacto.cuenta_bancaria.usuario.username, 'numero': contacto.cuenta_bancaria.numero}
-                       for contacto in contactos]
-    return JsonResponse({'contactos': lista_contactos})
+
+    def construir():
+        # Número y dueño están copiados en Contacto: una consulta sin JOIN, en el orden del índice
+        contactos = Contacto.objects.filter(usuario_id=usuario.pk).order_by('numero', 'id') \
+            .values_list('nombre', 'numero')
+        lista_contactos = [{'nombre': nombre, 'numero': numero} for nombre, numero in contactos]
+        return {'contactos': lista_contactos}
+
+    return respuesta_cacheada(request, CONTACTOS, construir)
+
+
+@api_view(['GET'])
+@json_rapido
+@permission_classes([IsAuthenticated])
+@authentication_classes([JWTLecturaAuthentication])
+@lectura_replica
+def buscar_contactos(request):
+    prefijo = request.query_params.get('q', '').strip()[:150]
+    try:
+        limite = min(int(request.query_params.get('limite', settings.CONTACTOS_LIMITE)),
+                     settings.CONTACTOS_LIMITE_MAXIMO)
+        if limite <= 0:
+            raise ValueError(limite)
+        contactos_encontrados, siguiente = contactos.buscar(request.user.pk, prefijo,
+                                                            request.query_params.get('cursor'), limite)
+    except (ValueError, historial.CursorInvalido):
+        return Response({'error': 'Los parámetros de paginación no son válidos'}, status=400)
+    return Response({'contactos': contactos_encontrados, 'siguiente': siguiente})
 
 
 @api_view(['POST'])
+@json_rapido
 @permission_classes([IsAuthenticated])
+@idempotente
 def realizar_transferencia(request):
     usuario_actual = request.user
 
     cuenta_origen_id = request.data.get('cuenta_origen')
     cuenta_destino_id = request.data.get('cuenta_destino')
-    monto = Decimal(request.data.get('monto'))
     motivo = request.data.get('motivo', '')
     token_valor = request.data.get('token')
 
+    exito = {'mensaje': 'Transferencia realizada con éxito'}
     try:
-        cuenta_origen = CuentaBancaria.objects.get(numero=cuenta_origen_id, usuario=usuario_actual)
-    except CuentaBancaria.DoesNotExist:
-        return Response({'error': 'La cuenta de origen no existe o no pertenece al usuario'}, status=404)
+        monto = leer_monto(request.data.get('monto'))
+        transferir(usuario_actual, cuenta_origen_id, cuenta_destino_id, monto, motivo, token_valor,
+                   al_confirmar=al_confirmar(request, 200, exito))
+    except TransferenciaError as error:
+        return Response(error.respuesta(), status=error.status)
+
+    return Response(exito)
+
+
+@api_view(['POST'])
+@json_rapido
+@permission_classes([IsAuthenticated])
+def realizar_transferencia_lote(request):
+    usuario_actual = request.user
+
+    cuenta_origen_id = request.data.get('cuenta_origen')
+    token_valor = request.data.get('token')
+    modo = request.data.get('modo', MODO_TODO_O_NADA)
+    tramos = request.data.get('transferencias')
+
+    if not isinstance(tramos, list) or not all(isinstance(tramo, dict) for tramo in tramos):
+        return Response({'error': 'Las transferencias deben enviarse como una lista'}, status=400)
+
+    try:
+        resultados = transferir_lote(usuario_actual, cuenta_origen_id, tramos, token_valor, modo)
+    except TransferenciaError as error:
+        return Response(error.respuesta(), status=error.status)
+
+    return Response({'mensaje': 'Lote de transferencias procesado', 'resultados': resultados})
+
+
+def _cuenta_del_usuario(request):
+    return CuentaBancaria.objects.filter(numero=request.query_params.get('cuenta'), usuario_id=request.user.pk) \
+        .values_list('id', flat=True).first()
+
+
+@api_view(['GET'])
+@json_rapido
+@permission_classes([IsAuthenticated])
+@authentication_classes([JWTLecturaAuthentication])
+@lectura_replica
+def obtener_historial(request):
+    cuenta_id = _cuenta_del_usuario(request)
+    if cuenta_id is None:
+        return Response({'error': 'La cuenta no existe o no pertenece al usuario'}, status=404)
 
     try:
-        cuenta_destino = CuentaBancaria.objects.get(numero=cuenta_destino_id)
-    except CuentaBancaria.DoesNotExist:
-        return Response({'error': 'La cuenta de destino no existe'}, status=404)
+        limite = min(int(request.query_params.get('limite', settings.HISTORIAL_LIMITE)), settings.HISTORIAL_LIMITE_MAXIMO)
+    except ValueError:
+        return Response({'error': 'El límite no es válido'}, status=400)
+    if limite <= 0:
+        return Response({'error': 'El límite no es válido'}, status=400)
 
     try:
-        token = Token.objects.get(cliente=usuario_actual, token=token_valor, es_valido=True)
-    except Token.DoesNotExist:
-        return Response({'error': 'El token no es válido o ha expirado'}, status=400)
-
-    if token.has_expired():
-        token.es_valido = False
-        token.save()
-
-        # Generar un nuevo token para el usuario
-        nuevo_token = Token.objects.create(cliente=usuario_actual, token='nuevo_token_valor', es_valido=True)
-        return Response({'error': 'El token ha expirado', 'nuevo_token': nuevo_token.token}, status=400)
-
-    # Verificar que el monto sea positivo y que la cuenta tenga suficiente saldo
-    if monto <= 0:
-        return Response({'error': 'El monto debe ser mayor que 0'}, status=400)
-
-    if cuenta_origen.saldo < monto:
-        return Response({'error': 'Fondos insuficientes en la cuenta de origen'}, status=400)
-
-    # Realizar la transferencia
-    cuenta_origen.saldo -= monto
-    cuenta_destino.saldo += monto
-    cuenta_origen.save()
-    cuenta_destino.save()
-
-    # Crear el registro de la transferencia
-    Transferencia.objects.create(
-        cuenta_origen=cuenta_origen,
-        cuenta_destino=cuenta_destino,
-        monto=monto,
-        motivo=motivo
-    )
-
-    token.es_valido = False
-    token.usado_en = timezone.now()
-    token.save()
-
-    return Response({'mensaje': 'Transferencia realizada con éxito'})
+        movimientos, siguiente = historial.pagina(cuenta_id, request.query_params.get('cursor'), limite)
+    except historial.CursorInvalido:
+        return Response({'error': 'El cursor no es válido'}, status=400)
+
+    # Los movimientos ya tienen las claves de la respuesta (id, fecha, monto, motivo, cuenta, tipo)
+    return RespuestaJSON({'movimientos': movimientos, 'siguiente': siguiente})
+
+
+class _Eco:
+    # Buffer mínimo para que csv.writer devuelva cada línea en lugar de escribirla
+    def write(self, valor):
+        return valor
+
+
+def _exportar_csv(movimientos):
+    escritor = csv.writer(_Eco())
+    yield escritor.writerow(['id', 'fecha', 'tipo', 'cuenta', 'monto', 'motivo'])
+    for m in movimientos:
+        yield escritor.writerow([m['id'], m['fecha'].isoformat(), m['tipo'], m['cuenta'], m['monto'], m['motivo']])
+
+
+def _exportar_json(movimientos):
+    yield b'{"movimientos":['
+    separador = b''
+    for movimiento in movimientos:
+        yield separador + dumps(movimiento)
+        separador = b','
+    yield b']}'
+
+
+@api_view(['GET'])
+@json_rapido
+@permission_classes([IsAuthenticated])
+@authentication_classes([JWTLecturaAuthentication])
+@lectura_replica
+def exportar_historial(request):
+    cuenta_id = _cuenta_del_usuario(request)
+    if cuenta_id is None:
+        return Response({'error': 'La cuenta no existe o no pertenece al usuario'}, status=404)
+
+    formato = request.query_params.get('formato', 'json')
+    if formato not in ('json', 'csv'):
+        return Response({'error': 'El formato debe ser json o csv'}, status=400)
+
+    rango = {}
+    for campo in ('desde', 'hasta'):
+        if request.query_params.get(campo):
+            try:
+                rango[campo] = parse_datetime(request.query_params[campo])
+            except ValueError:
+                rango[campo] = None
+            if rango[campo] is None:
+                return Response({'error': f'La fecha {campo} no es válida'}, status=400)
+
+    movimientos = historial.recorrer(cuenta_id, chunk_size=settings.HISTORIAL_CHUNK,
+                                     bd=router.db_for_read(Transferencia), **rango)
+    if formato == 'csv':
+        respuesta = StreamingHttpResponse(_exportar_csv(movimientos), content_type='text/csv')
+        respuesta['Content-Disposition'] = 'attachment; filename="historial.csv"'
+        return respuesta
+    return StreamingHttpResponse(_exportar_json(movimientos), content_type='application/json')
+
+
+def _totales_a_dict(totales):
+    return {'entradas': f"{totales['entradas']:.2f}", 'salidas': f"{totales['salidas']:.2f}",
+            'n_entradas': totales['n_entradas'], 'n_salidas': totales['n_salidas']}
+
+
+@api_view(['GET'])
+@json_rapido
+@permission_classes([IsAuthenticated])
+@authentication_classes([JWTLecturaAuthentication])
+@lectura_replica
+def obtener_resumen(request):
+    cuenta_id = _cuenta_del_usuario(request)
+    if cuenta_id is None:
+        return Response({'error': 'La cuenta no existe o no pertenece al usuario'}, status=404)
+
+    # Por defecto, el mes en curso
+    hoy = timezone.localdate()
+    rango = {'desde': hoy.replace(day=1), 'hasta': hoy}
+    for campo in rango:
+        if request.query_params.get(campo):
+            try:
+                rango[campo] = parse_date(request.query_params[campo])
+            except ValueError:
+                rango[campo] = None
+            if rango[campo] is None:
+                return Response({'error': f'La fecha {campo} no es válida'}, status=400)
+    if rango['desde'] > rango['hasta']:
+        return Response({'error': 'La fecha desde no puede ser posterior a hasta'}, status=400)
+
+    resumen = resumenes.resumir(cuenta_id, rango['desde'], rango['hasta'])
+    return RespuestaJSON({
+        'desde': rango['desde'].isoformat(),
+        'hasta': rango['hasta'].isoformat(),
+        'meses': [{'mes': mes['mes'], **_totales_a_dict(mes)} for mes in resumen['meses']],
+        'contrapartes': [{'numero': c['numero'], **_totales_a_dict(c)} for c in resumen['contrapartes']],
+    })
+
+
+def _red_permitida(direccion):
+    try:
+        ip = ipaddress.ip_address(direccion)
+    except ValueError:
+        return False
+    return any(ip in ipaddress.ip_network(red) for red in settings.METRICAS['REDES'])
+
+
+def metricas(request):
+    # Sin DRF: Prometheus no envía JWT. Con METRICAS['TOKEN'] se exige como Bearer; sin token, solo se responde
+    # a las direcciones de METRICAS['REDES']
+    token = settings.METRICAS['TOKEN']
+    if token:
+        if not constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}'):
+            return HttpResponse(status=401)
+    elif not _red_permitida(request.META.get('REMOTE_ADDR', '')):
+        return HttpResponse(status=403)
+    return HttpResponse(texto_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,17 @@
+"""
+ASGI config for banking_system con el perfil settings_asgi_api (settings_api sin conexiones persistentes).
+
+It exposes the ASGI callable as a module-level variable named ``application``.
+"""
+
+import os
+
+from django.core.asgi import get_asgi_application
+
+from banking_system.precarga import precargar
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'banking_system.settings_asgi_api')
+
+application = get_asgi_application()
+
+precargar()
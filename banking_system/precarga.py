@@ -0,0 +1,10 @@
+"""
+Precarga compartida por los módulos de entrada del perfil settings_api (wsgi_api y asgi_api).
+"""
+from django.urls import get_resolver
+
+
+def precargar():
+    # Importa el URLconf (vistas, DRF, simplejwt) al arrancar y no en la primera petición: el worker entra en
+    # servicio ya cargado y, con gunicorn --preload, la importación se hace una vez antes de crear los workers
+    get_resolver().url_patterns
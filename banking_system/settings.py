@@ -48,9 +48,26 @@ REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'rest_framework_simplejwt.authentication.JWTAuthentication',
     ),
+    # Las vistas de accounts cambian JSONRenderer y JSONParser por los de accounts.json_rapido (@json_rapido)
+    'DEFAULT_RENDERER_CLASSES': (
+        'rest_framework.renderers.JSONRenderer',
+        # La API navegable solo en desarrollo: renderizarla cuesta más que la respuesta misma
+        *(('rest_framework.renderers.BrowsableAPIRenderer',) if DEBUG else ()),
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'rest_framework.parsers.JSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ),
 }
 
+# Serialización JSON de la API (accounts.json_rapido): 'auto' usa orjson o msgspec si están instalados y
+# json de la biblioteca estándar si no; también se puede fijar 'orjson', 'msgspec' o 'json'
+JSON_MOTOR = 'auto'
+
 MIDDLEWARE = [
+    'accounts.metricas.MetricasMiddleware',
+    'accounts.replicas.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -96,13 +113,65 @@ DATABASES = {
         'PASSWORD': '1234',
         'HOST': 'localhost',
         'PORT': '5432',
+        # Conexiones persistentes: cada worker reutiliza su conexión hasta 60 s y la verifica antes de
+        # usarla tras un error o reinicio del servidor, en lugar de abrir una por solicitud.
+        'CONN_MAX_AGE': 60,
+        'CONN_HEALTH_CHECKS': True,
+        # Con psycopg 3 se puede usar el pool de Django en su lugar (requiere CONN_MAX_AGE = 0):
+        # 'OPTIONS': {'pool': {'min_size': 2, 'max_size': 20, 'timeout': 10}},
     }
 }
 
+# Réplica de solo lectura para las vistas de consulta (ver accounts.replicas). En pruebas es un espejo de
+# la primaria; sin DB_REPLICA_HOST todo se lee de 'default'.
+if os.environ.get('DB_REPLICA_HOST'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'HOST': os.environ['DB_REPLICA_HOST'],
+        'PORT': os.environ.get('DB_REPLICA_PORT', '5432'),
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['accounts.replicas.RouterReplica']
+REPLICA = {
+    'ALIAS': 'replica',
+    'FIJACION': 5,  # Segundos que un usuario lee de la primaria después de escribir
+    'CACHE': 'default',  # Alias de CACHES donde se guarda la fijación; debe ser compartido entre procesos
+}
+
+# Caché compartida por todos los workers (fijación a la primaria, caché de lecturas, tokens, límites). Sin
+# REDIS_URL cada proceso usa su propia caché en memoria, que solo sirve con un único proceso.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+if os.environ.get('REDIS_URL'):
+    CACHES['default'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',  # Requiere el paquete redis
+        'LOCATION': os.environ['REDIS_URL'],
+    }
+
+# Con una réplica, un worker que fija al usuario a la primaria en una caché por proceso no se entera en los
+# demás, que leerían de la réplica atrasada
+if REPLICA['ALIAS'] in DATABASES and CACHES[REPLICA['CACHE']]['BACKEND'].endswith('LocMemCache'):
+    from django.core.exceptions import ImproperlyConfigured
+    raise ImproperlyConfigured('DB_REPLICA_HOST requiere una caché compartida entre procesos: define REDIS_URL')
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
+# El primer hasher es el de las contraseñas nuevas; los hashes PBKDF2 existentes se migran a él en el siguiente
+# login exitoso. scrypt con estos parámetros cuesta una fracción del PBKDF2 por defecto y usa 16 MiB por intento,
+# lo que encarece los ataques con GPU sin saturar la CPU del servidor.
+PASSWORD_HASHERS = [
+    'accounts.hashers.ScryptConfigurable',
+    'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+]
+HASHER_SCRYPT = {'N': 2 ** 14, 'R': 8, 'P': 1}
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -150,4 +219,143 @@ SIMPLE_JWT = {
     'BLACKLIST_AFTER_ROTATION': True,
     'ALGORITHM': 'HS256',
     'SIGNING_KEY': 'tu_clave_secreta',  # Cambia esto por una clave secreta fuerte
-}
\ No newline at end of file
+}
+
+# Transferencias: reintentos ante deadlocks o fallos de serialización de la base de datos
+TRANSFERENCIA_REINTENTOS = 5
+TRANSFERENCIA_BACKOFF_BASE = 0.01  # Segundos de espera del primer reintento
+
+# Transferencias en lote (nóminas y dispersiones masivas)
+TRANSFERENCIA_LOTE_MAXIMO = 5000  # Tramos admitidos por solicitud
+TRANSFERENCIA_LOTE_BLOQUE = 500  # Filas por UPDATE ... CASE y por INSERT de bulk_create
+
+# Historial de transferencias
+HISTORIAL_LIMITE = 50  # Movimientos por página cuando el cliente no indica un límite
+HISTORIAL_LIMITE_MAXIMO = 200
+HISTORIAL_CHUNK = 2000  # Filas leídas por viaje a la base de datos al exportar
+
+# Resúmenes diarios por cuenta y contraparte (endpoint resumen/)
+RESUMENES_INCREMENTALES = True  # Cada transferencia suma a su resumen; con False solo los carga rebuild_rollups
+RESUMEN_CONTRAPARTES = 5  # Contrapartes principales devueltas por el resumen
+
+# Estados de cuenta (generate_statements): un archivo comprimido por rango de ids de cuenta
+ESTADOS_CUENTA = {
+    'DIRECTORIO': BASE_DIR / 'estados',
+    'PROCESOS': 4,
+    'LOTE': 10000,  # Ids de cuenta por rango; cada rango es una tarea y un punto de control
+}
+
+# Bandeja de salida: efectos posteriores a una transferencia, entregados por run_outbox_worker.
+# MANEJADORES asocia cada tipo de evento con funciones manejador(evento_id, datos); deben tolerar repeticiones.
+EVENTOS = {
+    'MANEJADORES': {
+        'transferencia_realizada': ['accounts.eventos.auditar'],
+    },
+    'HILOS': 8,
+    'LOTE': 100,
+    'INTENTOS': 10,  # Después de estos fallos el evento queda descartado
+    'BACKOFF_BASE': 2,  # Segundos de espera del primer reintento; se duplica en cada fallo
+    'BACKOFF_MAXIMO': 3600,
+}
+
+# Límites de velocidad por cuenta de origen (accounts/fraude.py), evaluados antes de confirmar cada transferencia
+# con contadores en la caché, sin consultar Transferencia. MEDIDA es 'monto', 'cantidad' o 'destinos_nuevos'
+# (destinos que la cuenta no pagó en los últimos DESTINOS_DIAS días); VENTANA en segundos. Sin reglas no se
+# evalúa nada. Tras vaciar la caché, warm_fraud_counters recarga los contadores desde las transferencias.
+FRAUDE = {
+    'ALIAS': 'default',  # Debe ser compartida entre procesos (Redis, Memcached) para que los límites sean globales
+    'CUBETAS': 12,  # Subventanas por ventana: el error de la ventana deslizante es de VENTANA / CUBETAS
+    'DESTINOS_BITS': 2048,  # Tamaño del filtro de Bloom de destinos conocidos por cuenta
+    'DESTINOS_DIAS': 90,  # Un destino deja de ser conocido entre DESTINOS_DIAS y el doble de días después de pagarle
+    'REGLAS': [],
+}
+# Por ejemplo:
+# FRAUDE['REGLAS'] = [
+#     {'NOMBRE': 'monto_por_minuto', 'MEDIDA': 'monto', 'VENTANA': 60, 'LIMITE': 5000},
+#     {'NOMBRE': 'monto_por_hora', 'MEDIDA': 'monto', 'VENTANA': 3600, 'LIMITE': 20000},
+#     {'NOMBRE': 'transferencias_por_minuto', 'MEDIDA': 'cantidad', 'VENTANA': 60, 'LIMITE': 10},
+#     {'NOMBRE': 'transferencias_por_hora', 'MEDIDA': 'cantidad', 'VENTANA': 3600, 'LIMITE': 60},
+#     {'NOMBRE': 'destinos_nuevos_por_hora', 'MEDIDA': 'destinos_nuevos', 'VENTANA': 3600, 'LIMITE': 5},
+# ]
+
+# Almacén de tokens virtuales (OTP)
+TOKENS_VIGENCIA = 60  # Segundos
+TOKENS_RETENCION_DIAS = 30  # purge_tokens elimina los tokens más antiguos que esto
+TOKENS_LIMITE = 50  # Tokens por página en obtener_tokens_cliente
+TOKENS_LIMITE_MAXIMO = 200
+TOKENS_ALMACEN = {
+    'BACKEND': 'accounts.tokens.AlmacenTokensDB',
+}
+# Sin escrituras en la base de datos en el camino crítico (la auditoría en Token es asíncrona y opcional):
+# TOKENS_ALMACEN = {
+#     'BACKEND': 'accounts.tokens.AlmacenTokensCache',
+#     'ALIAS': 'default',
+#     'AUDITORIA': True,
+# }
+
+# Búsqueda de contactos
+CONTACTOS_LIMITE = 50  # Contactos por página cuando el cliente no indica un límite
+CONTACTOS_LIMITE_MAXIMO = 200
+
+# Caché por usuario de obtener_cuenta_origen y obtener_contactos
+LECTURAS_CACHE = {
+    # 'compartida' (alias de CACHES, visible para todos los workers) o 'local' (LRU en memoria del proceso: las
+    # invalidaciones no llegan a los demás workers, solo sirve con un único proceso)
+    'BACKEND': 'compartida',
+    'ALIAS': 'default',
+    'TTL': 30,  # Segundos
+    'MAXIMO': 10000,  # Entradas de la caché local antes de descartar las menos usadas
+}
+
+# Autenticación JWT sin consultas para los endpoints de lectura
+JWT_LECTURA = {
+    'CACHE_MAXIMO': 10000,  # Tokens verificados recordados por proceso; 0 desactiva la caché
+    'CACHE_TTL': 300,  # Segundos máximos que se reutiliza una verificación (nunca más allá del exp del token)
+}
+
+# Idempotency-Key en POST /api/transferencia/
+IDEMPOTENCIA_TTL = 24 * 60 * 60  # Segundos que se guarda la respuesta de una clave
+IDEMPOTENCIA_ESPERA = 10  # Segundos que un duplicado espera a la solicitud en curso antes de responder 409
+IDEMPOTENCIA_RESERVA = 30  # Segundos tras los cuales una solicitud en curso se da por abandonada
+
+# Métricas por vista: histograma de latencia, consultas y tiempo SQL, bloqueos y filas (GET /api/metricas/)
+METRICAS = {
+    'ACTIVAS': True,
+    'BUCKETS': (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),  # Segundos
+    'LOG': False,  # True: una línea JSON por solicitud en el logger accounts.metricas
+    # /api/metricas/ exige `Authorization: Bearer <TOKEN>` si se define; si no, solo responde a clientes cuya
+    # REMOTE_ADDR esté en REDES (detrás de un proxy inverso, REMOTE_ADDR es la del proxy: define TOKEN)
+    'TOKEN': os.environ.get('METRICAS_TOKEN'),
+    'REDES': ('127.0.0.0/8', '::1/128'),
+    'PERFIL': None,
+}
+# Perfilado muestreado de una sola vista; cada muestra se guarda como archivo en DIRECTORIO:
+# METRICAS['PERFIL'] = {
+#     'VISTA': 'realizar_transferencia',  # Nombre de la URL
+#     'MUESTREO': 0.01,  # Fracción de solicitudes perfiladas
+#     'MOTOR': 'cprofile',  # o 'pyinstrument' (requiere instalarlo)
+#     'DIRECTORIO': 'perfiles',
+# }
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'consola': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'accounts.metricas': {'handlers': ['consola'], 'level': 'INFO', 'propagate': False},
+        'accounts.auditoria': {'handlers': ['consola'], 'level': 'INFO', 'propagate': False},
+    },
+}
+
+# Límites de intentos de login (cubetas de tokens en la caché), evaluados antes de calcular el hash.
+# RECARGA son intentos por segundo que se recuperan; None desactiva el límite. La IP es REMOTE_ADDR: detrás
+# de un proxy debe reescribirse con la IP del cliente.
+LOGIN_LIMITES = {
+    'ALIAS': 'default',
+    'IP': {'CAPACIDAD': 30, 'RECARGA': 1},
+    'USUARIO': {'CAPACIDAD': 10, 'RECARGA': 0.1},
+}
+LOGIN_HASH_HILOS = 4  # Hilos dedicados al hash en /api/async/login/
+LOGIN_HASH_COLA = 64  # Logins async esperando hilo antes de responder 503
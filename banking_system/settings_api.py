@@ -0,0 +1,36 @@
+"""
+Perfil para los workers de la API (autenticación solo por JWT).
+
+Parte de settings.py y quita lo que una solicitud a /api/ no usa: admin, sesiones, mensajes y archivos
+estáticos, sus middleware, las plantillas y la API navegable. Lo cargan banking_system.wsgi_api y
+banking_system.asgi_api; migraciones y comandos de administración siguen usando settings.py.
+"""
+
+from .settings import *  # noqa: F401,F403
+from .settings import INSTALLED_APPS, MIDDLEWARE, REST_FRAMEWORK
+
+# token_blacklist se conserva: /api/token/refresh/ rota los refresh tokens y el anterior debe quedar revocado
+INSTALLED_APPS = [app for app in INSTALLED_APPS if app not in (
+    'django.contrib.admin',
+    'django.contrib.sessions',
+    'django.contrib.messages',
+    'django.contrib.staticfiles',
+)]
+
+# DRF autentica cada vista con JWT y no usa sesiones ni CSRF (el login ya es csrf_exempt)
+MIDDLEWARE = [clase for clase in MIDDLEWARE if clase not in (
+    'django.contrib.sessions.middleware.SessionMiddleware',
+    'django.middleware.csrf.CsrfViewMiddleware',
+    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'django.contrib.messages.middleware.MessageMiddleware',
+    'django.middleware.clickjacking.XFrameOptionsMiddleware',
+)]
+
+ROOT_URLCONF = 'banking_system.urls_api'
+
+TEMPLATES = []
+
+REST_FRAMEWORK = {
+    **REST_FRAMEWORK,
+    'DEFAULT_RENDERER_CLASSES': ('rest_framework.renderers.JSONRenderer',),
+}
@@ -0,0 +1,11 @@
+"""
+Perfil settings_api para los workers ASGI (banking_system.asgi_api).
+"""
+
+from .settings_api import *  # noqa: F401,F403
+from .settings_api import DATABASES
+
+# Bajo ASGI cada vista síncrona corre en un hilo de sync_to_async y Django solo cierra las conexiones
+# vencidas al empezar y terminar cada petición: con CONN_MAX_AGE > 0 las conexiones de los hilos se acumulan
+# hasta agotar max_connections de PostgreSQL. Se abre una por petición (o se usa el pool de psycopg 3).
+DATABASES = {alias: {**base, 'CONN_MAX_AGE': 0} for alias, base in DATABASES.items()}
@@ -0,0 +1,8 @@
+"""
+URL configuration del perfil settings_api: solo la API, sin el admin.
+"""
+from django.urls import path, include
+
+urlpatterns = [
+    path('api/', include('accounts.urls')),
+]
@@ -0,0 +1,17 @@
+"""
+WSGI config for banking_system con el perfil settings_api (solo la API).
+
+It exposes the WSGI callable as a module-level variable named ``application``.
+"""
+
+import os
+
+from django.core.wsgi import get_wsgi_application
+
+from banking_system.precarga import precargar
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'banking_system.settings_api')
+
+application = get_wsgi_application()
+
+precargar()